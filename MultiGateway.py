@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sys
+
+from bleak import BleakClient
+from pycycling.cycling_power_service import CyclingPowerService
+
+from backend import wire
+from backend.session import SessionRecorder
+from gateway.bike import BikeState
+from gateway.console import TerminalView
+from gateway.cps import subscribe_raw
+from gateway.sender import FrameSender
+from gateway.spool import Spool
+
+# Une seule passerelle pour plusieurs home-trainers :
+#   python MultiGateway.py velo1=B39283B0-F675-456D-E265-9EE860DE185F velo2=AA:BB:CC:DD:EE:FF
+# ou BIKES="velo1=ADRESSE1,velo2=ADRESSE2" python MultiGateway.py
+RELAY_URL = os.environ.get("RELAY_URL", "https://michelin-delta.vercel.app")
+WIRE_FORMAT = os.environ.get("WIRE_FORMAT", "json")
+SEND_QUEUE_SIZE = int(os.environ.get("SEND_QUEUE_SIZE", 1024))
+DROP_POLICY = os.environ.get("DROP_POLICY", "drop_oldest")
+SPOOL_PATH = os.environ.get("SPOOL_PATH", "gateway.spool")
+# RAW_CPS=1 : décodage direct de 0x2A63 (gateway/cps.py) au lieu des objets pycycling
+RAW_CPS = os.environ.get("RAW_CPS", "0") == "1"
+# Affichage terminal à cadence fixe ; CONSOLE=off pour le désactiver
+CONSOLE_FPS = float(os.environ.get("CONSOLE_FPS", 4))
+HEADLESS = os.environ.get("CONSOLE", "on") == "off"
+# RECORD_PATH=fichier : enregistre notifications BLE brutes et trames (rejouables avec SessionReplay.py)
+RECORD_PATH = os.environ.get("RECORD_PATH")
+RECONNECT_DELAY = 5
+
+
+def parse_bikes(args):
+    bikes = []
+    for arg in args:
+        bike_id, sep, address = arg.partition("=")
+        if not sep or not bike_id or not address:
+            raise SystemExit(f"Argument invalide : {arg!r} (attendu : bike_id=ADRESSE)")
+        bikes.append(BikeState(bike_id, address))
+    return bikes
+
+
+async def run_bike(state, sender, view, recorder=None):
+    # Reconnexion en boucle : un capteur qui décroche n'arrête pas les autres vélos
+    def publish(metrics):
+        if recorder is not None:
+            recorder.record_frame(state.bike_id, wire.encode(wire.from_dict(metrics)))
+        view.update(state.bike_id, metrics)
+        sender.send(metrics, state.bike_id)
+
+    def power_callback(data):
+        publish(state.update(
+            getattr(data, 'instantaneous_power', 0),
+            getattr(data, 'cumulative_crank_revs', 0),
+            getattr(data, 'last_crank_event_time', 0),
+        ))
+
+    def raw_callback(m):
+        publish(state.update(m.power, m.crank_revs, m.crank_event_time))
+
+    on_raw = (lambda data: recorder.record_raw(state.bike_id, data)) if recorder is not None else None
+
+    while True:
+        try:
+            async with BleakClient(state.address) as client:
+                if RAW_CPS:
+                    await subscribe_raw(client, raw_callback, on_raw)
+                else:
+                    power_service = CyclingPowerService(client)
+                    await power_service.enable_cycling_power_measurement_notifications()
+                    power_service.set_cycling_power_measurement_handler(power_callback)
+                state.connected = True
+                print(f"✅ Vélo {state.bike_id} connecté ({state.address})")
+                while client.is_connected:
+                    await asyncio.sleep(1)
+        except Exception as e:
+            print(f"⚠️ Vélo {state.bike_id} : {e}")
+        state.connected = False
+        print(f"🔄 Vélo {state.bike_id} : nouvelle tentative dans {RECONNECT_DELAY} s")
+        await asyncio.sleep(RECONNECT_DELAY)
+
+
+async def main(bikes):
+    spool = Spool(SPOOL_PATH) if SPOOL_PATH else None
+    sender = FrameSender(RELAY_URL, [b.bike_id for b in bikes], SEND_QUEUE_SIZE, DROP_POLICY,
+                         WIRE_FORMAT, spool)
+    sender.start()
+    view = TerminalView(CONSOLE_FPS, HEADLESS, footer=lambda: (
+        f"📤 File d'envoi: {sender.queue.qsize()} | 🗑️ Trames rejetées: {sender.dropped}"))
+    view.start()
+    recorder = SessionRecorder(RECORD_PATH) if RECORD_PATH else None
+    try:
+        await asyncio.gather(*(run_bike(state, sender, view, recorder) for state in bikes))
+    finally:
+        view.stop()
+        if recorder is not None:
+            recorder.close()
+        print(f"📤 Envoi : {sender.stats()}")
+        await sender.stop()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:] or [b for b in os.environ.get("BIKES", "").split(",") if b]
+    if not args:
+        raise SystemExit("Aucun vélo : python MultiGateway.py bike_id=ADRESSE [...]")
+    asyncio.run(main(parse_bikes(args)))
@@ -1,85 +1,68 @@
 import asyncio
+import os
 import time
-import sys
-import math
-import socketio
 from bleak import BleakClient
 from pycycling.cycling_power_service import CyclingPowerService
 
+from backend import wire
+from backend.session import SessionRecorder
+from gateway.bike import BikeState, MockBike
+from gateway.console import TerminalView
+from gateway.cps import subscribe_raw
+from gateway.sender import FrameSender
+from gateway.spool import Spool
+
 SENSOR_ADDRESS = "B39283B0-F675-456D-E265-9EE860DE185F"
-sio = socketio.Client()
+BIKE_ID = os.environ.get("BIKE_ID", "default")
 # Remplace par ton URL, ex. "http://localhost:5001" si tu testes en local,
 # ou "https://michelin-bike.azurewebsites.net" comme dans ton code
-sio.connect("https://michelin-delta.vercel.app")
-
-BASE_POWER = 150
-GRADE_AMPLITUDE = 5
-SIMULATION_PERIOD = 60
-EFFICIENCY = 0.7
-
-def clear_terminal():
-    sys.stdout.write("\033[H\033[J")
-    sys.stdout.flush()
-
-async def connect_to_power_meter():
+RELAY_URL = os.environ.get("RELAY_URL", "https://michelin-delta.vercel.app")
+# WIRE_FORMAT=binary : trames compactes (backend/wire.py), json sinon
+WIRE_FORMAT = os.environ.get("WIRE_FORMAT", "json")
+# File d'envoi bornée entre les callbacks BLE et le réseau
+SEND_QUEUE_SIZE = int(os.environ.get("SEND_QUEUE_SIZE", 256))
+DROP_POLICY = os.environ.get("DROP_POLICY", "drop_oldest")
+# Trames conservées sur disque quand le relais est injoignable (SPOOL_PATH= pour désactiver)
+SPOOL_PATH = os.environ.get("SPOOL_PATH", f"{BIKE_ID}.spool")
+# RAW_CPS=1 : décodage direct de 0x2A63 (gateway/cps.py) au lieu des objets pycycling
+RAW_CPS = os.environ.get("RAW_CPS", "0") == "1"
+# Affichage terminal redessiné CONSOLE_FPS fois par seconde ; CONSOLE=off pour le désactiver
+CONSOLE_FPS = float(os.environ.get("CONSOLE_FPS", 4))
+HEADLESS = os.environ.get("CONSOLE", "on") == "off"
+# RECORD_PATH=fichier : enregistre notifications BLE brutes et trames (rejouables avec SessionReplay.py)
+RECORD_PATH = os.environ.get("RECORD_PATH")
+
+async def connect_to_power_meter(sender, view, recorder=None):
     time_start = time.time()
     try:
         print("Tentative de connexion au capteur BLE...")
         async with BleakClient(SENSOR_ADDRESS) as client:
             if client.is_connected:
                 print("✅ Connecté au capteur BLE")
-                power_service = CyclingPowerService(client)
-                await power_service.enable_cycling_power_measurement_notifications()
-
-                last_crank_revs = None
-                last_crank_time = None
-                total_distance = 0
-                wheel_circumference = 622 * 3.1416 / 1000
-
-                def power_callback(data):
-                    nonlocal last_crank_revs, last_crank_time, total_distance
-                    puissance = getattr(data, 'instantaneous_power', 0)
-                    cumulative_crank_revs = getattr(data, 'cumulative_crank_revs', 0)
-                    last_crank_event_time = getattr(data, 'last_crank_event_time', 0)
-
-                    if last_crank_revs is not None and last_crank_time is not None:
-                        delta_revs = cumulative_crank_revs - last_crank_revs
-                        delta_time = (last_crank_event_time - last_crank_time) / 1024
-                        cadence_rpm = (delta_revs / delta_time) * 60 if delta_time > 0 else 0
-                        total_distance += delta_revs * wheel_circumference
-                    else:
-                        cadence_rpm = 0
-
-                    last_crank_revs = cumulative_crank_revs
-                    last_crank_time = last_crank_event_time
-
-                    elapsed_time = time.time() - time_start
-                    grade = GRADE_AMPLITUDE * math.sin(2 * math.pi * elapsed_time / SIMULATION_PERIOD)
-                    if grade >= 0:
-                        target_power = BASE_POWER
-                        power_recharge = 0
-                    else:
-                        target_power = BASE_POWER + abs(grade * 10)
-                        power_recharge = EFFICIENCY * (BASE_POWER - target_power)
-
-                    metrics = {
-                        "power": puissance,
-                        "cadence": round(cadence_rpm, 1),
-                        "distance": round(total_distance, 2),
-                        "revolutions": cumulative_crank_revs,
-                        "grade": round(grade, 1),
-                        "target_power": target_power,
-                        "power_recharge": round(power_recharge, 2)
-                    }
-
-                    clear_terminal()
-                    print(f"⚡ Puissance: {puissance} W | 🚴 Cadence: {cadence_rpm:.1f} RPM")
-                    print(f"📏 Distance parcourue: {total_distance:.2f} m | 🔁 Révolutions: {cumulative_crank_revs}")
-                    print(f"🟢 Pente: {grade:.1f}% | 🎯 Puissance cible: {target_power} W | 🔋 Recharge: {power_recharge:.2f} W")
-
-                    sio.emit("metrics_update", metrics)
-
-                power_service.set_cycling_power_measurement_handler(power_callback)
+                state = BikeState(BIKE_ID, SENSOR_ADDRESS)
+
+                def on_measurement(power, crank_revs, crank_event_time):
+                    metrics = state.update(power, crank_revs, crank_event_time)
+                    if recorder is not None:
+                        recorder.record_frame(BIKE_ID, wire.encode(wire.from_dict(metrics)))
+                    view.update(BIKE_ID, metrics)
+                    sender.send(metrics)
+
+                if RAW_CPS:
+                    on_raw = (lambda data: recorder.record_raw(BIKE_ID, data)) if recorder is not None else None
+                    await subscribe_raw(client, lambda m: on_measurement(m.power, m.crank_revs, m.crank_event_time),
+                                        on_raw)
+                else:
+                    def power_callback(data):
+                        on_measurement(
+                            getattr(data, 'instantaneous_power', 0),
+                            getattr(data, 'cumulative_crank_revs', 0),
+                            getattr(data, 'last_crank_event_time', 0),
+                        )
+
+                    power_service = CyclingPowerService(client)
+                    await power_service.enable_cycling_power_measurement_notifications()
+                    power_service.set_cycling_power_measurement_handler(power_callback)
 
                 print("Simulation BLE : en écoute indéfiniment (Contrôle-C pour quitter).")
                 while True:
@@ -92,48 +75,35 @@ async def connect_to_power_meter():
         print(f"Erreur de connexion au capteur BLE: {e}")
         print("Lancement du mode simulation de données illimité (mock).")
 
-        last_crank_revs = 0
-        total_distance = 0
-        wheel_circumference = 622 * math.pi / 1000
-        simulated_cumulative_revs = 0
+        mock = MockBike(time_start)
 
         print("Simulation de données illimitée (Contrôle-C pour quitter).")
         while True:
             await asyncio.sleep(1)
-            current_time = time.time()
-            elapsed_time = current_time - time_start
-            delta_revs = 3 + int((math.sin(current_time) + 1) * 1)
-            simulated_cumulative_revs += delta_revs
-            cadence_rpm = 60 + 10 * math.sin(current_time / 5)
-            total_distance += delta_revs * wheel_circumference
-            puissance = BASE_POWER + 20 * math.sin(current_time / 3)
-            grade = GRADE_AMPLITUDE * math.sin(2 * math.pi * elapsed_time / SIMULATION_PERIOD)
-
-            if grade >= 0:
-                target_power = BASE_POWER
-                power_recharge = 0
-            else:
-                target_power = BASE_POWER + abs(grade * 10)
-                power_recharge = EFFICIENCY * (BASE_POWER - target_power)
-
-            metrics = {
-                "power": round(puissance, 1),
-                "cadence": round(cadence_rpm, 1),
-                "distance": round(total_distance, 2),
-                "revolutions": simulated_cumulative_revs,
-                "grade": round(grade, 1),
-                "target_power": target_power,
-                "power_recharge": round(power_recharge, 2)
-            }
-
-            clear_terminal()
-            print(f"⚡ Puissance: {metrics['power']} W | 🚴 Cadence: {metrics['cadence']} RPM")
-            print(f"📏 Distance parcourue: {metrics['distance']} m | 🔁 Révolutions: {metrics['revolutions']}")
-            print(f"🟢 Pente: {metrics['grade']}% | 🎯 Puissance cible: {metrics['target_power']} W | 🔋 Recharge: {metrics['power_recharge']} W")
-
-            sio.emit("metrics_update", metrics)
-
-asyncio.run(connect_to_power_meter())
+            metrics = mock.next()
+            if recorder is not None:
+                recorder.record_frame(BIKE_ID, wire.encode(wire.from_dict(metrics)))
+            view.update(BIKE_ID, metrics)
+            sender.send(metrics)
+
+async def main():
+    spool = Spool(SPOOL_PATH) if SPOOL_PATH else None
+    sender = FrameSender(RELAY_URL, BIKE_ID, SEND_QUEUE_SIZE, DROP_POLICY, WIRE_FORMAT, spool)
+    sender.start()
+    view = TerminalView(CONSOLE_FPS, HEADLESS, footer=lambda: (
+        f"📤 File d'envoi: {sender.queue.qsize()} | 🗑️ Trames rejetées: {sender.dropped}"))
+    view.start()
+    recorder = SessionRecorder(RECORD_PATH) if RECORD_PATH else None
+    try:
+        await connect_to_power_meter(sender, view, recorder)
+    finally:
+        view.stop()
+        if recorder is not None:
+            recorder.close()
+        print(f"📤 Envoi : {sender.stats()}")
+        await sender.stop()
+
+asyncio.run(main())
 
 
 
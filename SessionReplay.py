@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import time
+
+import socketio
+
+from backend import wire
+from backend.latency import estimate_offset
+from backend.session import KIND_FRAME, KIND_RAW, read_session
+from gateway.bike import BikeState
+from gateway.cps import PowerMeasurement, decode_into
+
+# Rejoue une session enregistrée (RECORD_PATH) vers le relais, sans matériel :
+#   python SessionReplay.py session.rec                      # temps réel
+#   python SessionReplay.py session.rec --speed 10 --loop 0  # 10x, en boucle infinie
+#   python SessionReplay.py session.rec --speed max --source raw
+# --source raw repasse les notifications BLE brutes dans BikeState (cadence,
+# distance...), --source frame renvoie les trames dérivées telles qu'enregistrées.
+# Les intervalles entre trames sont conservés (divisés par --speed).
+# t_gw suit en revanche les instants enregistrés quelle que soit --speed : le
+# relais intègre l'énergie et la distance sur la durée réelle de l'effort, et
+# cumuls comme classements sont ceux de la session d'origine. Hors --speed 1,
+# les latences mesurées par le relais (gateway_to_relay, end_to_end) n'ont donc
+# pas de sens.
+
+
+def parse_speed(value):
+    if value == "max":
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("la vitesse doit être > 0 ou 'max'")
+    return speed
+
+
+# Trames à envoyer : [(instant, bike_id, valeurs dans l'ordre de wire.FIELDS)]
+def frames_from_records(records, source):
+    frames = []
+    if source == "frame":
+        for t, kind, bike_id, data in records:
+            if kind == KIND_FRAME:
+                frames.append((t, bike_id, wire.decode(data)))
+        return frames
+    states = {}
+    measurement = PowerMeasurement()
+    for t, kind, bike_id, data in records:
+        if kind != KIND_RAW:
+            continue
+        state = states.get(bike_id)
+        if state is None:
+            state = states[bike_id] = BikeState(bike_id, None)
+        decode_into(measurement, data)
+        metrics = state.update(measurement.power, measurement.crank_revs, measurement.crank_event_time)
+        frames.append((t, bike_id, wire.from_dict(metrics)))
+    return frames
+
+
+# Décalage horloge relais - horloge locale, comme la passerelle (gateway/sender.py)
+async def sync_clock(sio, pings=5):
+    samples = []
+    for _ in range(pings):
+        t0 = time.monotonic()
+        reply = await sio.call("clock_ping", {"t0": t0}, timeout=5)
+        samples.append((t0, reply["t"], time.monotonic()))
+    offset, rtt = estimate_offset(samples)
+    await sio.emit("clock_offset", {"offset": offset, "rtt": rtt})
+
+
+async def replay(url, frames, speed, loops, wire_format):
+    bikes = sorted({bike_id for _, bike_id, _ in frames})
+    sio = socketio.AsyncClient()
+    await sio.connect(url, transports=["websocket"])
+    await sio.call("register_sensor", {"bike_id": bikes[0], "bikes": bikes, "epoch": int(time.time())})
+    await sync_clock(sio)
+    # Horloge de la session rejouée : les passages se suivent sans retour en arrière
+    timeline = time.monotonic()
+    seq = 0
+    sent = 0
+    started = time.monotonic()
+    iteration = 0
+    try:
+        while loops == 0 or iteration < loops:
+            iteration += 1
+            base = time.monotonic()
+            t0 = frames[0][0]
+            for t, bike_id, values in frames:
+                if speed is not None:
+                    delay = base + (t - t0) / speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                seq += 1
+                t_gw = timeline + (t - t0)
+                if wire_format == "binary":
+                    await sio.emit("metrics_frame", (bike_id, wire.encode(values, seq, t_gw)))
+                else:
+                    data = wire.to_dict(values)
+                    data["bike_id"] = bike_id
+                    data["seq"] = seq
+                    data["t_gw"] = t_gw
+                    await sio.emit("metrics_update", data)
+                sent += 1
+            timeline += frames[-1][0] - t0
+            print(f"🔁 Passage {iteration} terminé : {sent} trames envoyées")
+    finally:
+        # Aller-retour acquitté : les émissions précédentes ont été traitées par le relais
+        if sio.connected:
+            await sio.call("clock_ping", {}, timeout=30)
+        elapsed = time.monotonic() - started
+        await sio.disconnect()
+        print(f"📼 {sent} trames en {elapsed:.1f} s ({sent / elapsed if elapsed else 0:.0f} trames/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rejoue une session enregistrée vers le relais")
+    parser.add_argument("path", help="fichier de session (RECORD_PATH)")
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="facteur d'accélération, ou 'max'")
+    parser.add_argument("--loop", type=int, default=1, help="nombre de passages (0 = infini)")
+    parser.add_argument("--source", choices=("frame", "raw"), default="frame")
+    parser.add_argument("--format", choices=("json", "binary"), default="binary")
+    args = parser.parse_args()
+
+    started, records = read_session(args.path)
+    frames = frames_from_records(records, args.source)
+    if not frames:
+        raise SystemExit(f"Aucune entrée '{args.source}' dans {args.path}")
+    duration = frames[-1][0] - frames[0][0]
+    print(f"📼 Session du {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))} : "
+          f"{len(frames)} trames sur {duration:.1f} s")
+    try:
+        asyncio.run(replay(args.url, frames, args.speed, args.loop, args.format))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import array
+import glob
+import json
+import math
+import os
+import re
+import struct
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from persistence import FRAME_COLUMNS, JsonLinesSink, saved_sessions
+
+# Archive en colonnes des trames d'un événement de plusieurs jours. Une session
+# d'archive (un vélo, du démarrage du relais à son arrêt) est un répertoire :
+#   header.json      : format, vélo, début (s epoch), nombre de lignes, colonnes
+#   <colonne>.bin    : valeurs brutes de largeur fixe, petit-boutiste, une par trame
+#   index.bin        : index temporel, u4 ; index[i] = première ligne dont
+#                      t >= début + i * pas (une entrée par pas, 1 s par défaut)
+# L'écriture n'a besoin que de la bibliothèque standard (le relais n'importe pas
+# numpy). La lecture projette les fichiers en mémoire (numpy.memmap) : une plage
+# de temps est une tranche de chaque colonne, sans copie ni décodage.
+FORMAT = "mbcol1"
+# Colonnes des documents "frames" de persistence.py : type numpy et code
+# array.array de même largeur ; f32 par défaut, comme dans wire.py
+TYPES = {"t": ("<f8", "d"), "rseq": ("<u4", "I"), "distance": ("<f8", "d"), "revolutions": ("<u4", "I"),
+         "total_energy": ("<f8", "d"), "total_distance": ("<f8", "d"),
+         "step_energy": ("<f8", "d"), "step_distance": ("<f8", "d")}
+COLUMNS = tuple((name,) + TYPES.get(name, ("<f4", "f")) for name in FRAME_COLUMNS)
+INDEX = ("index", "<u4", "I")
+_CAST = {"d": float, "f": float, "I": int}
+
+
+def _column_path(directory, name):
+    return os.path.join(directory, f"{name}.bin")
+
+
+class ArchiveWriter:
+    # Trames ajoutées dans l'ordre chronologique ; écrites par blocs de flush_rows
+    def __init__(self, directory, bike_id, started=None, step=1.0, flush_rows=4096):
+        self.directory = directory
+        self.bike_id = bike_id
+        self.started = started
+        self.step = step
+        self.flush_rows = flush_rows
+        self.rows = 0
+        self.last_t = None
+        # Dernière séquence relais écrite : un lot réessayé ne réécrit pas ses trames
+        self.last_rseq = None
+        self.duplicates = 0
+        self.out_of_order = 0
+        self._index_len = 0
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, "header.json")):
+            self._resume()
+        self._buffers = [array.array(code) for _, _, code in COLUMNS]
+        self._casts = [_CAST[code] for _, _, code in COLUMNS]
+        self._index = array.array(INDEX[2])
+        # Sans tampon : un flush raté est défait en tronquant chaque fichier
+        self._files = [open(_column_path(directory, name), "ab", buffering=0) for name, _, _ in COLUMNS]
+        self._index_file = open(_column_path(directory, INDEX[0]), "ab", buffering=0)
+
+    def _resume(self):
+        # Archive existante : on repart des lignes annoncées par l'en-tête, les
+        # octets écrits après (arrêt brutal entre deux flushs) sont tronqués
+        with open(os.path.join(self.directory, "header.json")) as f:
+            header = json.load(f)
+        self.started = header["started"]
+        self.step = header["step"]
+        self.rows = header["rows"]
+        self._index_len = header["index"]
+        for name, dtype, _ in COLUMNS + (INDEX,):
+            count = self._index_len if name == INDEX[0] else self.rows
+            path = _column_path(self.directory, name)
+            if os.path.exists(path):
+                os.truncate(path, count * int(dtype[2:]))
+        if self.rows:
+            with open(_column_path(self.directory, "t"), "rb") as f:
+                f.seek((self.rows - 1) * 8)
+                self.last_t = struct.unpack("<d", f.read(8))[0]
+        # last_rseq n'est pas relu : les séquences repartent de 1 à chaque
+        # démarrage du relais, seul t protège l'ordre d'une archive reprise
+
+    # row : valeurs dans l'ordre de COLUMNS, t (s epoch) puis rseq en premier.
+    # Ignorées et comptées, pour que t reste croissant et qu'un lot réessayé ne
+    # double rien : une trame de séquence déjà écrite (duplicates), une trame
+    # antérieure à la précédente (out_of_order). -> True si la ligne est ajoutée
+    def append(self, row):
+        t, rseq = row[0], row[1]
+        if rseq and self.last_rseq is not None and rseq <= self.last_rseq:
+            self.duplicates += 1
+            return False
+        if self.last_t is not None and t < self.last_t:
+            self.out_of_order += 1
+            return False
+        if self.started is None:
+            self.started = math.floor(t)
+        # Une entrée d'index par pas écoulé jusqu'à cette trame (pas vides compris)
+        slot = int((t - self.started) // self.step)
+        while self._index_len <= slot:
+            self._index.append(self.rows)
+            self._index_len += 1
+        self._buffers[0].append(t)
+        for buffer, cast, value in zip(self._buffers[1:], self._casts[1:], row[1:]):
+            buffer.append(cast(value) if value is not None else 0)
+        self.last_t = t
+        if rseq:
+            self.last_rseq = rseq
+        self.rows += 1
+        if len(self._buffers[0]) >= self.flush_rows:
+            self.flush()
+        return True
+
+    # Tout ou rien : en cas d'erreur, les fichiers reviennent à leur taille
+    # d'avant et les lignes restent en mémoire pour le flush suivant
+    def flush(self):
+        buffers = self._buffers + [self._index]
+        files = self._files + [self._index_file]
+        sizes = [os.fstat(f.fileno()).st_size for f in files]
+        try:
+            for buffer, f in zip(buffers, files):
+                if sys.byteorder != "little":
+                    buffer = array.array(buffer.typecode, buffer)
+                    buffer.byteswap()
+                buffer.tofile(f)
+        except OSError:
+            for f, size in zip(files, sizes):
+                os.ftruncate(f.fileno(), size)
+            raise
+        for buffer in buffers:
+            del buffer[:]
+        self._write_header()
+
+    def _write_header(self):
+        header = {"format": FORMAT, "bike_id": self.bike_id, "started": self.started, "step": self.step,
+                  "rows": self.rows, "index": self._index_len,
+                  "columns": [[name, dtype] for name, dtype, _ in COLUMNS]}
+        # Remplacement atomique : un lecteur voit l'ancien en-tête ou le nouveau,
+        # et ne lit jamais au-delà des lignes déjà écrites
+        path = os.path.join(self.directory, "header.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(header, f)
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        self.flush()
+        for f in self._files + [self._index_file]:
+            f.close()
+
+
+class ArchiveReader:
+    def __init__(self, directory):
+        if np is None:
+            raise RuntimeError("numpy est nécessaire pour lire une archive")
+        with open(os.path.join(directory, "header.json")) as f:
+            header = json.load(f)
+        if header.get("format") != FORMAT:
+            raise ValueError(f"pas une archive {FORMAT} : {directory}")
+        self.directory = directory
+        self.bike_id = header["bike_id"]
+        self.started = header["started"]
+        self.step = header["step"]
+        self.rows = header["rows"]
+        self.dtypes = dict(header["columns"])
+        self._columns = {}
+        self.index = self._map(INDEX[0], INDEX[1], header["index"])
+
+    def _map(self, name, dtype, rows):
+        if rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(_column_path(self.directory, name), dtype=dtype, mode="r", shape=(rows,))
+
+    def column(self, name):
+        mapped = self._columns.get(name)
+        if mapped is None:
+            mapped = self._columns[name] = self._map(name, self.dtypes[name], self.rows)
+        return mapped
+
+    @property
+    def columns(self):
+        return list(self.dtypes)
+
+    # Lignes [début, fin[ des trames de t0 <= t < t1 : l'index donne le pas de
+    # chaque borne, une recherche dichotomique dans ce seul pas la précise
+    def rows_between(self, t0, t1):
+        return self._row_at(t0), self._row_at(t1)
+
+    def _row_at(self, t):
+        # Même calcul de pas qu'à l'écriture (ArchiveWriter.append)
+        slot = (t - self.started) // self.step
+        if slot < 0 or len(self.index) == 0:
+            return 0
+        slot = int(slot)
+        if slot >= len(self.index):
+            low = int(self.index[-1])
+            high = self.rows
+        else:
+            low = int(self.index[slot])
+            high = int(self.index[slot + 1]) if slot + 1 < len(self.index) else self.rows
+        return low + int(np.searchsorted(self.column("t")[low:high], t, side="left"))
+
+    # {colonne: vue numpy} des trames de t0 <= t < t1, sans copie
+    def slice(self, t0, t1, columns=None):
+        start, end = self.rows_between(t0, t1)
+        return {name: self.column(name)[start:end] for name in (columns or self.columns)}
+
+
+# Un répertoire d'archive par vélo et par démarrage : <racine>/<bike_id>-<début>
+def session_directory(root, bike_id, started):
+    # bike_id vient des passerelles : rien qui sorte de la racine
+    return os.path.join(root, f"{re.sub(r'[^0-9A-Za-z_.-]', '_', bike_id).lstrip('.')}-{int(started)}")
+
+
+def list_sessions(root):
+    sessions = []
+    for name in sorted(os.listdir(root)):
+        if os.path.exists(os.path.join(root, name, "header.json")):
+            sessions.append(os.path.join(root, name))
+    return sessions
+
+
+# Puits de persistence.WriteBehind (PERSIST_URL=archive:///répertoire) : une
+# session d'archive par vélo, ouverte à sa première trame. Les résumés de
+# session de participant vont dans sessions.jsonl, leurs bornes started_at /
+# ended_at délimitant la tranche à lire. pattern : racines relues par
+# saved_sessions (celles de tous les workers).
+# Un lot réessayé ne crée pas de doublon : les trames déjà écrites sont
+# reconnues à leur séquence, les résumés sont écrits après les trames, en
+# entier ou pas du tout (JsonLinesSink).
+class ArchiveSink:
+    def __init__(self, root, pattern=None):
+        self.root = root
+        self.pattern = pattern or glob.escape(root)
+        os.makedirs(root, exist_ok=True)
+        self.writers = {}
+        self._sessions = JsonLinesSink(os.path.join(root, "sessions.jsonl"))
+
+    def write(self, docs):
+        sessions = []
+        for doc in docs:
+            if doc["type"] == "session":
+                sessions.append(doc)
+                continue
+            writer = self.writers.get(doc["bike_id"])
+            if writer is None:
+                started = math.floor(doc["frames"][0][0]) if doc["frames"] else math.floor(time.time())
+                writer = self.writers[doc["bike_id"]] = ArchiveWriter(
+                    session_directory(self.root, doc["bike_id"], started), doc["bike_id"], started)
+            for row in doc["frames"]:
+                writer.append(row)
+        for writer in self.writers.values():
+            writer.flush()
+        if sessions:
+            self._sessions.write(sessions)
+
+    def saved_sessions(self):
+        return saved_sessions(sorted(glob.glob(os.path.join(self.pattern, "sessions.jsonl"))))
+
+    def stats(self):
+        return {"duplicates": sum(writer.duplicates for writer in self.writers.values()),
+                "out_of_order": sum(writer.out_of_order for writer in self.writers.values())}
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self._sessions.close()
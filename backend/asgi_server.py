@@ -0,0 +1,370 @@
+import asyncio
+import functools
+import json
+import os
+import socket
+import time
+from urllib.parse import parse_qs
+
+import socketio
+import uvicorn
+
+from backpressure import SendQueues, run_send_queues_async
+from broadcast import bike_rooms, binary_room, bike_room, delta_room, make_async_broadcaster
+from bus import make_bus, run_workers
+from leaderboard import LEADERBOARD_ROOM, Leaderboards
+from metrics import run_loop_lag_probe
+from persistence import make_persistence
+from relay import Relay
+from rides import session_message
+from session import SessionRecorder
+from static_assets import StaticAssets
+from wire import Frame
+
+# Relais ASGI : python-socketio AsyncServer sous uvicorn, sans eventlet ni
+# monkeypatching. Mêmes événements, mêmes routes HTTP et mêmes fichiers statiques
+# que server.py : passerelles et écrans fonctionnent sans changement.
+#   python asgi_server.py
+#   uvicorn asgi_server:app --host 0.0.0.0 --port 80
+DIST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dist")
+
+# WORKERS / WORKER_ID / BUS_URL : comme server.py (bus.py)
+WORKERS = int(os.environ.get("WORKERS", 1))
+WORKER_ID = os.environ.get("WORKER_ID")
+BUS_URL = os.environ.get("BUS_URL")
+LAUNCHER = WORKERS > 1 and WORKER_ID is None
+
+transports = ["websocket"] if WORKERS > 1 else None
+sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*", transports=transports)
+
+BROADCAST_MODE = os.environ.get("BROADCAST_MODE", "immediate")
+BROADCAST_HZ = float(os.environ.get("BROADCAST_HZ", 10))
+KEYFRAME_EVERY = int(os.environ.get("KEYFRAME_EVERY", 50))
+LOG_EVERY = int(os.environ.get("LOG_EVERY", 0))
+RECORD_PATH = os.environ.get("RECORD_PATH")
+if RECORD_PATH and WORKER_ID is not None:
+    RECORD_PATH = f"{RECORD_PATH}.{WORKER_ID}"
+recorder = SessionRecorder(RECORD_PATH) if RECORD_PATH and not LAUNCHER else None
+
+static_assets = StaticAssets(DIST) if not LAUNCHER else None
+PERSIST_URL = os.environ.get("PERSIST_URL")
+persistence = make_persistence(PERSIST_URL, WORKER_ID) if PERSIST_URL and not LAUNCHER else None
+bus = make_bus(BUS_URL, int(WORKER_ID or 0), WORKERS) if BUS_URL and not LAUNCHER else None
+relay = Relay(int(os.environ.get("HISTORY_CAPACITY", 36000)), LOG_EVERY, recorder, bus,
+              int(os.environ.get("REPLAY_WINDOW", 600)),
+              leaderboards=Leaderboards(int(os.environ.get("LEADERBOARD_SIZE", 10))), persistence=persistence,
+              history_bikes=int(os.environ.get("HISTORY_MAX_BIKES", 64)),
+              relay_epoch=int(os.environ.get("RELAY_EPOCH", 0)) or None)
+# Classements repris des sessions persistées (PERSIST_URL), vides sinon
+restored = relay.restore_leaderboards()
+if restored is not None:
+    print(f"🏆 Classements reconstruits : {restored} résultats")
+queues = SendQueues(sio, int(os.environ.get("SEND_QUEUE_MAX", 32)),
+                    float(os.environ.get("SLOW_CLIENT_TIMEOUT", 15)))
+broadcaster = make_async_broadcaster(sio, BROADCAST_MODE, BROADCAST_HZ, relay.latency, KEYFRAME_EVERY, queues,
+                                     relay_epoch=relay.relay_epoch)
+relay.register_metrics(sio, broadcaster, queues)
+
+
+def on_event(event):
+    # sio.on + comptage des messages et durée du handler
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def instrumented(sid, *args):
+            relay.messages_in.inc(event)
+            start = time.perf_counter()
+            try:
+                return await handler(sid, *args)
+            finally:
+                relay.handler_seconds.observe(event, value=time.perf_counter() - start)
+        sio.on(event, instrumented)
+        return instrumented
+    return decorator
+
+
+async def run_recorder_flush():
+    while True:
+        await sio.sleep(recorder.flush_interval)
+        recorder.flush()
+
+
+async def push_leaderboard(updates):
+    for event, payload in relay.leaderboards.messages(updates):
+        await sio.emit(event, payload, to=LEADERBOARD_ROOM)
+
+
+async def push_session(bike_id, ride, ended=None):
+    await sio.emit("session_update", session_message(bike_id, ride, ended), to=bike_rooms(bike_id))
+
+
+async def run_bus_listener():
+    # Trames des autres workers : rediffusées aux écrans connectés à ce processus
+    ready = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_reader(bus.fileno(), ready.set)
+    try:
+        while True:
+            await ready.wait()
+            ready.clear()
+            try:
+                frames, notices = relay.receive_bus()
+            except ConnectionError as e:
+                print(f"⚠️ Bus interrompu : {e}")
+                return
+            except Exception as e:
+                # Erreur inattendue sur un lot : on le perd, pas l'écoute du bus
+                print(f"⚠️ Messages du bus ignorés : {e!r}")
+                continue
+            for frame in frames:
+                await broadcaster.push(frame.bike_id, frame)
+            for kind, data in notices:
+                if kind == "leaderboard":
+                    await push_leaderboard(data)
+                else:
+                    await push_session(*data)
+    finally:
+        loop.remove_reader(bus.fileno())
+
+
+async def on_startup():
+    sio.start_background_task(run_loop_lag_probe, sio.sleep, relay.hub_lag, relay.hub_lag_seconds)
+    sio.start_background_task(run_send_queues_async, sio, queues, sio.sleep)
+    if recorder is not None:
+        sio.start_background_task(run_recorder_flush)
+    if bus is not None:
+        sio.start_background_task(run_bus_listener)
+
+
+def on_shutdown():
+    if recorder is not None:
+        recorder.close()
+    if persistence is not None:
+        persistence.close()
+    if bus is not None:
+        bus.close()
+
+
+# Routes HTTP et fichiers statiques de server.py
+def query_arg(query, name, default, cast):
+    try:
+        return cast(query[name][0])
+    except (KeyError, IndexError, ValueError):
+        return default
+
+
+async def http_api(scope, receive, send):
+    path = scope["path"]
+    query = parse_qs(scope["query_string"].decode())
+    content_type = b"application/json"
+    status = 200
+    if path == "/api/broadcast":
+        body = broadcaster.stats()
+    elif path == "/api/latency":
+        body = relay.latency.summary()
+    elif path.startswith("/api/history/"):
+        body, status = relay.history_query(
+            path[len("/api/history/"):],
+            query_arg(query, "seconds", 300, float),
+            query_arg(query, "points", 300, int),
+            query_arg(query, "metric", "power", str),
+        )
+    elif path.startswith("/api/leaderboard/"):
+        board, _, participant_id = path[len("/api/leaderboard/"):].partition("/")
+        if participant_id:
+            body, status = relay.leaderboard_rank(board, participant_id)
+        else:
+            body, status = relay.leaderboard_query(board, query_arg(query, "k", 10, int))
+    elif path == "/api/sessions":
+        body, status = relay.sessions_query(query_arg(query, "participant", None, str),
+                                            query_arg(query, "limit", 50, int))
+    elif path == "/api/sessions/best":
+        body, status = relay.best_sessions_query(query_arg(query, "metric", "energy", str),
+                                                 query_arg(query, "day", None, str),
+                                                 query_arg(query, "k", 10, int))
+    elif path == "/api/totals":
+        body, status = relay.totals_query(query_arg(query, "since", 0.0, float),
+                                          query_arg(query, "until", None, float))
+    elif path == "/metrics":
+        body = relay.registry.render()
+        content_type = b"text/plain; version=0.0.4"
+    else:
+        request_headers = dict(scope["headers"])
+        result = static_assets.respond(
+            path,
+            request_headers.get(b"accept-encoding", b"").decode("latin-1"),
+            request_headers.get(b"if-none-match", b"").decode("latin-1"),
+        )
+        if result is not None:
+            status, headers, payload = result
+            headers = [(k.lower().encode(), v.encode()) for k, v in headers]
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else payload})
+            return
+        body, status = {"error": "introuvable"}, 404
+    payload = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+    headers = [(b"content-type", content_type), (b"content-length", str(len(payload)).encode())]
+    if path.startswith("/api/"):
+        # Les écrans peuvent être servis depuis un autre domaine que le relais
+        headers.append((b"access-control-allow-origin", b"*"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": payload})
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_api, on_startup=on_startup, on_shutdown=on_shutdown)
+
+
+@sio.on("connect")
+async def handle_connect(sid, environ, auth=None):
+    print("✅ Un client WebSocket s'est connecté")
+
+
+@sio.on("disconnect")
+async def handle_disconnect(sid, *args):
+    queues.forget(sid)
+    bikes = relay.forget(sid)
+    if bikes is not None:
+        print(f"❌ Capteur des vélos {', '.join(bikes)} déconnecté")
+    else:
+        print("❌ Un client WebSocket s'est déconnecté")
+
+
+@on_event("register_sensor")
+async def handle_register_sensor(sid, data=None):
+    bikes = relay.register_sensor(sid, data)
+    print(f"🚲 Capteur enregistré pour les vélos {', '.join(bikes)}")
+
+
+@on_event("subscribe")
+async def handle_subscribe(sid, data=None):
+    data = data or {}
+    kind = "binary" if data.get("binary") else "delta" if data.get("delta") else "json"
+    room = {"binary": binary_room, "delta": delta_room, "json": bike_room}[kind]
+    last_seq = data.get("last_seq") or {}
+    for bike_id in data.get("bikes", []):
+        bike_id = str(bike_id)
+        last = relay.resume_seq(last_seq.get(bike_id), data.get("relay_epoch"))
+        await sio.enter_room(sid, room(bike_id))
+        for event, payload in broadcaster.state.subscribe_messages(
+                bike_id, kind, last, relay.replay_since(bike_id, last) if last is not None else None):
+            await sio.emit(event, payload, to=sid)
+        await sio.emit("session_update", session_message(bike_id, relay.rides.get(bike_id)), to=sid)
+
+
+@on_event("unsubscribe")
+async def handle_unsubscribe(sid, data=None):
+    for bike_id in (data or {}).get("bikes", []):
+        await sio.leave_room(sid, bike_room(bike_id))
+        await sio.leave_room(sid, binary_room(bike_id))
+        await sio.leave_room(sid, delta_room(bike_id))
+
+
+@on_event("leaderboard_subscribe")
+async def handle_leaderboard_subscribe(sid, data=None):
+    await sio.enter_room(sid, LEADERBOARD_ROOM)
+    return relay.leaderboards.snapshot()
+
+
+@on_event("leaderboard_submit")
+async def handle_leaderboard_submit(sid, data=None):
+    try:
+        record, updates = relay.submit_result(data)
+    except (ValueError, TypeError) as e:
+        return {"error": str(e)}
+    await push_leaderboard(updates)
+    print(f"🏆 Résultat enregistré pour {record['name']}")
+    return {"id": record["id"], "ranks": relay.leaderboards.ranks(record["id"])}
+
+
+@on_event("session_start")
+async def handle_session_start(sid, data=None):
+    try:
+        ride = relay.start_session(data)
+    except (ValueError, TypeError) as e:
+        return {"error": str(e)}
+    await push_session(ride.bike_id, ride)
+    print(f"🏁 Session de {ride.name} démarrée sur le vélo {ride.bike_id}")
+    return {"session": ride.as_dict()}
+
+
+@on_event("session_end")
+async def handle_session_end(sid, data=None):
+    save = (data or {}).get("save", True)
+    try:
+        ride, updates = relay.end_session(data, save)
+    except (ValueError, TypeError) as e:
+        return {"error": str(e)}
+    await push_session(ride.bike_id, None, ride)
+    await push_leaderboard(updates)
+    print(f"🏆 Session de {ride.name} terminée")
+    return {"session": ride.as_dict(), "ranks": relay.leaderboards.ranks(ride.id) if save else None}
+
+
+@on_event("metrics_update")
+async def handle_metrics_update(sid, data):
+    relay.log_frame(data)
+    bike_id = relay.sensor_bike(sid, data.get("bike_id"))
+    frame = Frame.from_json(bike_id, data)
+    if not relay.ingest(sid, frame):
+        return
+    await broadcaster.push(bike_id, frame, skip_sid=sid)
+
+
+@on_event("metrics_frame")
+async def handle_metrics_frame(sid, *args):
+    payload = args[-1]
+    bike_id = relay.sensor_bike(sid, args[0] if len(args) > 1 else None)
+    try:
+        frame = Frame.from_bytes(bike_id, payload)
+    except (ValueError, TypeError) as e:
+        print(f"⚠️ Trame binaire rejetée ({bike_id}) : {e}")
+        return
+    if not relay.ingest(sid, frame):
+        return
+    await broadcaster.push(bike_id, frame, skip_sid=sid)
+
+
+@on_event("clock_ping")
+async def handle_clock_ping(sid, data=None):
+    return {"t": time.monotonic()}
+
+
+@on_event("clock_offset")
+async def handle_clock_offset(sid, data=None):
+    relay.set_clock_offset(sid, data)
+
+
+@on_event("frame_ack")
+async def handle_frame_ack(sid, data=None):
+    relay.frame_ack(data)
+
+
+@on_event("metrics_batch")
+async def handle_metrics_batch(sid, payload=None):
+    accepted, latest = relay.ingest_batch(sid, (payload or {}).get("frames", []))
+    for bike_id, frame in latest.items():
+        await broadcaster.push(bike_id, frame, skip_sid=sid)
+    print(f"📦 Lot rejoué : {accepted} trames acceptées")
+    return {"accepted": accepted}
+
+
+def reuseport_socket(port):
+    # Plusieurs workers sur le même port : le noyau répartit les connexions
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("0.0.0.0", port))
+    return sock
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 80))
+    if LAUNCHER:
+        print(f"🚀 Démarrage de {WORKERS} workers ASGI sur http://0.0.0.0:{port}")
+        run_workers(os.path.abspath(__file__), WORKERS)
+        raise SystemExit(0)
+    print(f"🚀 Démarrage du relais ASGI sur http://0.0.0.0:{port}")
+    if WORKER_ID is None:
+        uvicorn.run(app, host="0.0.0.0", port=port, log_level="warning")
+    else:
+        server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+        server.run(sockets=[reuseport_socket(port)])
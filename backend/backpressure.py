@@ -0,0 +1,105 @@
+import time
+
+# File d'envoi bornée par écran. Un écran dont la file engine.io dépasse
+# max_queue paquets (Wi-Fi saturé, onglet en veille) passe en mode lent : ses
+# trames sont retenues dans une boîte par (événement, vélo) où la plus récente
+# remplace la précédente (drop-oldest ; les deltas sont fusionnés pour rester
+# exacts). Les autres écrans reçoivent toujours l'émission de room commune.
+# La boîte est vidée dès que la file redescend sous max_queue / 2 ; un écran
+# resté lent plus de evict_after secondes est déconnecté.
+class SendQueues:
+    def __init__(self, server, max_queue=32, evict_after=15.0):
+        # server : le serveur python-socketio (socketio.server sous Flask-SocketIO)
+        self.server = server
+        self.max_queue = max_queue
+        self.low_water = max_queue // 2
+        self.evict_after = evict_after
+        # sid -> {(événement, bike_id): données}
+        self.held = {}
+        # sid -> (eio_sid, instant du passage en mode lent)
+        self.slow_since = {}
+        self.dropped = 0
+        self.evicted = 0
+
+    def depth(self, eio_sid):
+        socket = self.server.eio.sockets.get(eio_sid)
+        return socket.queue.qsize() if socket is not None else 0
+
+    # Écrans de la room à ne pas servir par l'émission commune : leurs trames
+    # sont retenues. Renvoie la liste skip_sid pour socketio.emit.
+    def route(self, room, event, data, bike_id, skip_sid=None):
+        skip = [skip_sid] if skip_sid is not None else []
+        members = self.server.manager.rooms.get("/", {}).get(room)
+        if not members:
+            return skip
+        for sid, eio_sid in members.items():
+            if sid == skip_sid:
+                continue
+            if sid in self.held or self.depth(eio_sid) >= self.max_queue:
+                self.hold(sid, eio_sid, event, data, bike_id)
+                skip.append(sid)
+        return skip
+
+    def hold(self, sid, eio_sid, event, data, bike_id):
+        held = self.held.get(sid)
+        if held is None:
+            held = self.held[sid] = {}
+            self.slow_since[sid] = (eio_sid, time.monotonic())
+        key = (event, bike_id)
+        previous = held.get(key)
+        if previous is not None:
+            self.dropped += 1
+            if event == "metrics_delta":
+                # Champs de la trame retenue complétés par les plus récents
+                data = dict(previous, **data)
+        held[key] = data
+
+    # -> ([(sid, [(événement, données)])] à envoyer, [sid] à déconnecter)
+    def collect(self):
+        ready = []
+        evict = []
+        now = time.monotonic()
+        for sid, (eio_sid, since) in list(self.slow_since.items()):
+            if eio_sid not in self.server.eio.sockets:
+                self.forget(sid)
+            elif self.depth(eio_sid) <= self.low_water:
+                ready.append((sid, [(event, data) for (event, _), data in self.held.pop(sid).items()]))
+                del self.slow_since[sid]
+            elif now - since > self.evict_after:
+                evict.append(sid)
+                self.forget(sid)
+                self.evicted += 1
+        return ready, evict
+
+    def forget(self, sid):
+        self.held.pop(sid, None)
+        self.slow_since.pop(sid, None)
+
+    def stats(self):
+        return {"max_queue": self.max_queue, "slow_clients": len(self.held),
+                "held": sum(len(h) for h in self.held.values()),
+                "dropped": self.dropped, "evicted": self.evicted}
+
+
+def run_send_queues(server, queues, sleep, interval=0.05):
+    while True:
+        sleep(interval)
+        ready, evict = queues.collect()
+        for sid, messages in ready:
+            for event, data in messages:
+                server.emit(event, data, to=sid)
+        for sid in evict:
+            print("🐌 Écran trop lent déconnecté")
+            server.disconnect(sid)
+
+
+async def run_send_queues_async(server, queues, sleep, interval=0.05):
+    while True:
+        await sleep(interval)
+        ready, evict = queues.collect()
+        for sid, messages in ready:
+            for event, data in messages:
+                await server.emit(event, data, to=sid)
+        for sid in evict:
+            print("🐌 Écran trop lent déconnecté")
+            await server.disconnect(sid)
@@ -0,0 +1,349 @@
+import time
+
+from odometer import TOTAL_FIELDS
+from rides import SESSION_FIELDS
+from wire import FIELDS
+
+# Champs calculés par le relais (Frame.totals) : cumuls du vélo et de la session en cours
+RELAY_FIELDS = TOTAL_FIELDS + SESSION_FIELDS
+# Champs d'état d'un vélo diffusés aux écrans : la trame du capteur et les champs du relais
+STATE_FIELDS = FIELDS + RELAY_FIELDS
+
+
+def bike_room(bike_id):
+    return f"bike:{bike_id}"
+
+
+def binary_room(bike_id):
+    return f"bike:{bike_id}:bin"
+
+
+def delta_room(bike_id):
+    return f"bike:{bike_id}:delta"
+
+
+# Trame complète hors flux en direct (snapshot, rattrapage) : sans t_out ni t_src,
+# qui n'entrent pas dans les mesures de latence
+def frame_dict(frame):
+    data = dict(frame.as_dict())
+    data.pop("t_out", None)
+    data.pop("t_src", None)
+    if frame.rseq is not None:
+        data["rseq"] = frame.rseq
+    if frame.totals is not None:
+        data.update(zip(RELAY_FIELDS, frame.totals))
+    return data
+
+
+# Toutes les rooms d'un vélo, quel que soit le format choisi par l'écran
+def bike_rooms(bike_id):
+    return [bike_room(bike_id), binary_room(bike_id), delta_room(bike_id)]
+
+
+def room_size(manager, room, skip_sid=None):
+    members = manager.rooms.get("/", {}).get(room)
+    if not members:
+        return 0
+    return len(members) - (1 if skip_sid is not None and skip_sid in members else 0)
+
+
+# Dernier état de chaque vélo et flux différentiel "metrics_delta" :
+# un écran abonné avec {"delta": true} reçoit d'abord l'état complet (snapshot),
+# puis seulement les champs modifiés depuis la trame précédente, avec une trame
+# complète (keyframe, "key": true) toutes les keyframe_every trames.
+# Tous les membres de la room delta ont reçu le même flux depuis le même
+# snapshot : la base de comparaison est tenue par room, pas par client.
+# relay_epoch (Relay.relay_epoch) part avec chaque trame JSON : les rseq
+# repartent de 1 à chaque lancement du relais, l'écran qui voit changer
+# relay_epoch oublie ses points de reprise.
+class FrameState:
+    def __init__(self, keyframe_every=50, relay_epoch=None):
+        self.keyframe_every = keyframe_every
+        self.relay_epoch = relay_epoch
+        # Dernière trame diffusée par vélo
+        self.latest = {}
+        # Valeurs connues de la room delta : bike_id -> dict des champs
+        self.sent = {}
+        self.since_keyframe = {}
+
+    @staticmethod
+    def _values(frame):
+        data = frame.as_dict()
+        values = {name: data.get(name) for name in FIELDS}
+        if frame.totals is not None:
+            values.update(zip(RELAY_FIELDS, frame.totals))
+        values["rseq"] = frame.rseq
+        return values
+
+    def delta(self, frame):
+        values = self._values(frame)
+        data = frame.as_dict()
+        base = self.sent.get(frame.bike_id)
+        count = self.since_keyframe.get(frame.bike_id, 0) + 1
+        key = base is None or count >= self.keyframe_every
+        if key:
+            message = {name: values.get(name) for name in STATE_FIELDS}
+            message["key"] = True
+            count = 0
+        else:
+            message = {name: values.get(name) for name in STATE_FIELDS if values.get(name) != base.get(name)}
+        message["bike_id"] = frame.bike_id
+        for name in ("seq", "t_gw"):
+            if data.get(name) is not None:
+                message[name] = data[name]
+        if frame.rseq is not None:
+            message["rseq"] = frame.rseq
+        self.stamp(message)
+        self.sent[frame.bike_id] = values
+        self.since_keyframe[frame.bike_id] = count
+        return message
+
+    def stamp(self, message):
+        if self.relay_epoch is not None:
+            message["relay_epoch"] = self.relay_epoch
+        return message
+
+    def forget_delta(self, bike_id):
+        # Room delta vide : la base sera reprise au prochain snapshot
+        self.sent.pop(bike_id, None)
+
+    # Messages pour un écran qui vient de s'abonner : [(événement, données)]
+    # reset=True : l'écran demandait une reprise impossible, il doit repartir de cet état
+    def snapshot(self, bike_id, kind="json", reset=False):
+        frame = self.latest.get(bike_id)
+        if frame is None:
+            return []
+        if kind == "binary":
+            return [("metrics_frame", (bike_id, frame.as_bytes()))]
+        if kind == "delta":
+            values = self.sent.get(bike_id)
+            if values is None:
+                values = self.sent[bike_id] = self._values(frame)
+                self.since_keyframe[bike_id] = 0
+            message = dict(values, bike_id=bike_id, key=True)
+        else:
+            message = frame_dict(frame)
+        if reset:
+            message["reset"] = True
+        self.stamp(message)
+        return [("metrics_delta" if kind == "delta" else "metrics_update", message)]
+
+    # Abonnement avec last_seq (dernier rseq vu par l'écran avant sa coupure) :
+    # les trames manquées en un seul lot "metrics_replay", sinon un snapshot.
+    # missed : Relay.replay_since(), None si la reprise est impossible.
+    # Le flux binaire ne porte pas rseq : pas de reprise, toujours un snapshot.
+    def subscribe_messages(self, bike_id, kind="json", last_seq=None, missed=None):
+        if last_seq is None or kind == "binary":
+            return self.snapshot(bike_id, kind)
+        if missed is None:
+            return self.snapshot(bike_id, kind, reset=True)
+        messages = []
+        if missed:
+            frames = [self.stamp(frame_dict(f)) for f in missed]
+            messages.append(("metrics_replay", {"bike_id": bike_id, "frames": frames}))
+        if kind == "delta":
+            # Base de la room delta, à laquelle se rapportent les prochains deltas
+            messages += self.snapshot(bike_id, kind)
+        return messages
+
+
+# Messages d'une trame pour les écrans JSON, binaires et différentiels du vélo :
+# [(événement, données, room, nombre de destinataires)].
+# Chaque représentation n'est construite que si quelqu'un l'attend.
+# Avec un LatencyTracker (latency.py), on mesure le temps passé dans le relais
+# et on horodate la sortie pour les accusés d'affichage des écrans.
+def frame_messages(manager, frame, skip_sid=None, latency=None, state=None):
+    frame.t_out = time.monotonic()
+    if latency is not None and frame.t_in is not None:
+        latency.observe("relay", frame.t_out - frame.t_in)
+    messages = []
+    if state is not None:
+        state.latest[frame.bike_id] = frame
+        room = delta_room(frame.bike_id)
+        n = room_size(manager, room, skip_sid)
+        if n:
+            data = state.delta(frame)
+            data["t_out"] = frame.t_out
+            if frame.t_src is not None:
+                data["t_src"] = frame.t_src
+            messages.append(("metrics_delta", data, room, n))
+        else:
+            state.forget_delta(frame.bike_id)
+    room = bike_room(frame.bike_id)
+    n = room_size(manager, room, skip_sid)
+    if n:
+        # Copie : as_dict() est la représentation en cache de la trame (fenêtre de
+        # reprise, dict reçu d'une passerelle JSON), qui ne doit pas être modifiée
+        data = dict(frame.as_dict())
+        data["t_out"] = frame.t_out
+        if frame.t_src is not None:
+            data["t_src"] = frame.t_src
+        if frame.rseq is not None:
+            data["rseq"] = frame.rseq
+        if frame.totals is not None:
+            data.update(zip(RELAY_FIELDS, frame.totals))
+        if state is not None:
+            state.stamp(data)
+        messages.append(("metrics_update", data, room, n))
+    room = binary_room(frame.bike_id)
+    n = room_size(manager, room, skip_sid)
+    if n:
+        messages.append(("metrics_frame", (frame.bike_id, frame.as_bytes()), room, n))
+    return messages
+
+
+# Renvoie le nombre de messages envoyés (un par écran destinataire).
+# queues (backpressure.SendQueues) : les écrans lents sont retirés de l'émission
+# commune et leurs trames retenues
+def emit_frame(socketio, frame, skip_sid=None, latency=None, state=None, queues=None):
+    sent = 0
+    for event, data, room, n in frame_messages(socketio.server.manager, frame, skip_sid, latency, state):
+        skip = queues.route(room, event, data, frame.bike_id, skip_sid) if queues is not None else skip_sid
+        socketio.emit(event, data, to=room, skip_sid=skip)
+        sent += n
+    return sent
+
+
+# Variante pour un socketio.AsyncServer (asgi_server.py)
+async def emit_frame_async(sio, frame, skip_sid=None, latency=None, state=None, queues=None):
+    sent = 0
+    for event, data, room, n in frame_messages(sio.manager, frame, skip_sid, latency, state):
+        skip = queues.route(room, event, data, frame.bike_id, skip_sid) if queues is not None else skip_sid
+        await sio.emit(event, data, to=room, skip_sid=skip)
+        sent += n
+    return sent
+
+
+# Diffusion immédiate : une émission par notification du capteur (comportement historique)
+class ImmediateBroadcaster:
+    def __init__(self, socketio, latency=None, keyframe_every=50, queues=None, relay_epoch=None):
+        self.socketio = socketio
+        self.latency = latency
+        self.state = FrameState(keyframe_every, relay_epoch)
+        self.queues = queues
+        self.frames_in = 0
+        self.frames_out = 0
+        self.messages_out = 0
+
+    def push(self, bike_id, frame, skip_sid=None):
+        self.frames_in += 1
+        self.messages_out += emit_frame(self.socketio, frame, skip_sid, self.latency, self.state, self.queues)
+        self.frames_out += 1
+
+    def stats(self):
+        return {
+            "mode": "immediate",
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "messages_out": self.messages_out,
+            "frames_coalesced": 0,
+        }
+
+
+# Diffusion "la dernière valeur gagne" : on ne garde que la trame la plus récente
+# de chaque vélo et on vide le tout une seule fois par tick.
+class CoalescingBroadcaster:
+    def __init__(self, socketio, tick_hz=10, latency=None, keyframe_every=50, queues=None, relay_epoch=None):
+        self.socketio = socketio
+        self.latency = latency
+        self.state = FrameState(keyframe_every, relay_epoch)
+        self.queues = queues
+        self.interval = 1.0 / tick_hz
+        self.pending = {}
+        self.frames_in = 0
+        self.frames_out = 0
+        self.messages_out = 0
+        self.frames_coalesced = 0
+        self.ticks = 0
+        self._task = None
+
+    def push(self, bike_id, frame, skip_sid=None):
+        if self._task is None:
+            self.start()
+        self.frames_in += 1
+        if bike_id in self.pending:
+            # La trame précédente n'a jamais été envoyée : elle est écrasée
+            self.frames_coalesced += 1
+        self.pending[bike_id] = (frame, skip_sid)
+
+    def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        for frame, skip_sid in pending.values():
+            self.messages_out += emit_frame(self.socketio, frame, skip_sid, self.latency, self.state, self.queues)
+            self.frames_out += 1
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            self.flush()
+            self.ticks += 1
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # En retard (hub saturé) : on repart du temps présent sans rattrapage
+                next_tick = time.monotonic()
+                delay = 0
+            self.socketio.sleep(delay)
+
+    def start(self):
+        if self._task is None:
+            self._task = self.socketio.start_background_task(self._run)
+
+    def stats(self):
+        return {
+            "mode": "coalesce",
+            "tick_hz": round(1.0 / self.interval, 2),
+            "ticks": self.ticks,
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "messages_out": self.messages_out,
+            "frames_coalesced": self.frames_coalesced,
+            "pending": len(self.pending),
+        }
+
+
+def make_broadcaster(socketio, mode="immediate", tick_hz=10, latency=None, keyframe_every=50, queues=None, relay_epoch=None):
+    if mode == "coalesce":
+        return CoalescingBroadcaster(socketio, tick_hz, latency, keyframe_every, queues, relay_epoch)
+    return ImmediateBroadcaster(socketio, latency, keyframe_every, queues, relay_epoch)
+
+
+# Variantes asyncio : mêmes statistiques, push() et les émissions sont attendus
+class AsyncImmediateBroadcaster(ImmediateBroadcaster):
+    async def push(self, bike_id, frame, skip_sid=None):
+        self.frames_in += 1
+        self.messages_out += await emit_frame_async(self.socketio, frame, skip_sid, self.latency, self.state, self.queues)
+        self.frames_out += 1
+
+
+class AsyncCoalescingBroadcaster(CoalescingBroadcaster):
+    async def push(self, bike_id, frame, skip_sid=None):
+        super().push(bike_id, frame, skip_sid)
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        for frame, skip_sid in pending.values():
+            self.messages_out += await emit_frame_async(self.socketio, frame, skip_sid, self.latency, self.state, self.queues)
+            self.frames_out += 1
+
+    async def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            await self.flush()
+            self.ticks += 1
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()
+                delay = 0
+            await self.socketio.sleep(delay)
+
+
+def make_async_broadcaster(sio, mode="immediate", tick_hz=10, latency=None, keyframe_every=50, queues=None, relay_epoch=None):
+    if mode == "coalesce":
+        return AsyncCoalescingBroadcaster(sio, tick_hz, latency, keyframe_every, queues, relay_epoch)
+    return AsyncImmediateBroadcaster(sio, latency, keyframe_every, queues, relay_epoch)
@@ -0,0 +1,289 @@
+import json
+import math
+import os
+import random
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlparse
+
+# Bus entre processus relais (WORKERS > 1, ou plusieurs machines avec Redis) :
+# chaque trame acceptée par un worker est publiée aux autres, qui la rediffusent
+# à leurs propres écrans et la versent dans leur historique.
+# Message : nœud d'origine (u32), drapeaux (u8), époque (u32), t_src (f64, NaN si
+#           inconnu), séquence relais du vélo (u32, 0 si aucune), longueur du
+#           bike_id (u8), bike_id (utf-8), trame binaire (wire.py)
+_HEADER = struct.Struct("<IBIdIB")
+FLAG_REPLAY = 1  # trame rejouée depuis un spool : rediffusée mais hors historique
+# Événement du relais (résultat de classement...) : le champ bike_id porte le
+# nom de l'événement et la trame binaire est remplacée par ses données en JSON
+FLAG_EVENT = 2
+
+# Taille max d'un message : les trames font moins de 64 octets, les événements
+# quelques centaines
+MAX_MESSAGE = 4096
+
+
+def encode_message(node_id, epoch, frame, flags=0):
+    bike = frame.bike_id.encode()
+    t_src = frame.t_src if frame.t_src is not None else math.nan
+    rseq = (frame.rseq or 0) & 0xFFFFFFFF
+    return _HEADER.pack(node_id, flags, epoch, t_src, rseq, len(bike)) + bike + frame.as_bytes()
+
+
+def encode_event(node_id, name, data):
+    name = name.encode()
+    body = json.dumps(data, separators=(",", ":")).encode()
+    return _HEADER.pack(node_id, FLAG_EVENT, 0, math.nan, 0, len(name)) + name + body
+
+
+def decode_message(payload):
+    # -> (nœud d'origine, drapeaux, époque, t_src ou None, séquence relais ou None,
+    #     bike_id, trame binaire)
+    try:
+        node_id, flags, epoch, t_src, rseq, bike_len = _HEADER.unpack_from(payload)
+    except struct.error as e:
+        raise ValueError(f"message de bus tronqué : {e}")
+    start = _HEADER.size
+    bike_id = bytes(payload[start:start + bike_len]).decode()
+    raw = bytes(payload[start + bike_len:])
+    return node_id, flags, epoch, (None if math.isnan(t_src) else t_src), rseq or None, bike_id, raw
+
+
+def new_node_id():
+    # Identifiant de processus unique, y compris entre machines partageant un Redis
+    return random.getrandbits(32)
+
+
+# Bus local : un socket UNIX datagramme par worker dans le même répertoire.
+# publish() envoie un datagramme à chaque autre worker, sans courtier ; un worker
+# saturé perd le message plutôt que de bloquer l'émetteur.
+class UnixSocketBus:
+    def __init__(self, directory, worker_id, workers):
+        self.path = os.path.join(directory, f"relay-{worker_id}.sock")
+        self.peers = [os.path.join(directory, f"relay-{i}.sock") for i in range(workers) if i != worker_id]
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def publish(self, payload):
+        self.published += 1
+        for peer in self.peers:
+            try:
+                self.sock.sendto(payload, peer)
+            except OSError:
+                # File du pair pleine, pair pas encore démarré ou arrêté
+                self.dropped += 1
+
+    # Non bloquant : tous les messages disponibles, à appeler quand fileno() est lisible
+    def receive(self):
+        messages = []
+        while True:
+            try:
+                messages.append(self.sock.recv(MAX_MESSAGE))
+            except BlockingIOError:
+                break
+        self.received += len(messages)
+        return messages
+
+    def stats(self):
+        return {"backend": "unix", "peers": len(self.peers), "published": self.published,
+                "received": self.received, "dropped": self.dropped}
+
+    def close(self):
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def _resp_command(*parts):
+    out = [b"*%d\r\n" % len(parts)]
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(part), part))
+    return b"".join(out)
+
+
+def _resp_parse(buf, pos):
+    # Une valeur RESP à partir de pos -> (valeur, position suivante), None si incomplète
+    end = buf.find(b"\r\n", pos)
+    if end < 0:
+        return None
+    kind, line = buf[pos:pos + 1], bytes(buf[pos + 1:end])
+    pos = end + 2
+    if kind in (b"+", b"-"):
+        return line, pos
+    if kind == b":":
+        return int(line), pos
+    if kind == b"$":
+        length = int(line)
+        if length < 0:
+            return None, pos
+        if len(buf) < pos + length + 2:
+            return None
+        return bytes(buf[pos:pos + length]), pos + length + 2
+    if kind == b"*":
+        items = []
+        for _ in range(int(line)):
+            parsed = _resp_parse(buf, pos)
+            if parsed is None:
+                return None
+            item, pos = parsed
+            items.append(item)
+        return items, pos
+    raise ValueError(f"réponse Redis inattendue : {kind!r}")
+
+
+# Bus Redis (ou tout serveur compatible : Valkey, KeyDB...) par PUBLISH/SUBSCRIBE,
+# protocole RESP écrit à la main pour rester non bloquant et sans dépendance.
+# Deux connexions : une pour publier, une abonnée au canal.
+class RedisBus:
+    def __init__(self, url, channel="relay:frames", max_pending=1 << 20):
+        parsed = urlparse(url)
+        self.channel = channel.encode()
+        self.max_pending = max_pending
+        address = (parsed.hostname or "localhost", parsed.port or 6379)
+        self.pub = self._connect(address, parsed.password)
+        self.sub = self._connect(address, parsed.password)
+        self.sub.sendall(_resp_command("SUBSCRIBE", self.channel))
+        self.pub.setblocking(False)
+        self.sub.setblocking(False)
+        self._out = bytearray()
+        self._in = bytearray()
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _connect(address, password):
+        sock = socket.create_connection(address, timeout=5)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if password:
+            sock.sendall(_resp_command("AUTH", password))
+            reply = sock.recv(256)
+            if not reply.startswith(b"+OK"):
+                raise ConnectionError(f"authentification Redis refusée : {reply!r}")
+        return sock
+
+    def fileno(self):
+        return self.sub.fileno()
+
+    def _flush(self):
+        # Écriture partielle possible : le reste attend le prochain appel
+        while self._out:
+            try:
+                sent = self.pub.send(self._out)
+            except BlockingIOError:
+                break
+            del self._out[:sent]
+        # Réponses de PUBLISH (nombre d'abonnés) : lues et ignorées
+        while True:
+            try:
+                if not self.pub.recv(4096):
+                    raise ConnectionError("connexion Redis fermée")
+            except BlockingIOError:
+                break
+
+    def publish(self, payload):
+        if len(self._out) > self.max_pending:
+            # Redis ne suit plus : on perd la trame plutôt que de grossir sans fin
+            self.dropped += 1
+            return
+        self._out += _resp_command("PUBLISH", self.channel, payload)
+        try:
+            self._flush()
+        except OSError:
+            # Redis injoignable (connexion coupée ou fermée) : appelé depuis
+            # Relay.ingest, l'erreur ne doit pas empêcher la diffusion locale.
+            # L'écoute du bus signale la coupure
+            self.dropped += 1
+            return
+        self.published += 1
+
+    def receive(self):
+        self._flush()
+        while True:
+            try:
+                chunk = self.sub.recv(65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                raise ConnectionError("connexion Redis fermée")
+            self._in += chunk
+        messages = []
+        pos = 0
+        while pos < len(self._in):
+            parsed = _resp_parse(self._in, pos)
+            if parsed is None:
+                break
+            value, pos = parsed
+            if isinstance(value, list) and len(value) == 3 and value[0] == b"message":
+                messages.append(value[2])
+        del self._in[:pos]
+        self.received += len(messages)
+        return messages
+
+    def stats(self):
+        return {"backend": "redis", "published": self.published, "received": self.received,
+                "dropped": self.dropped, "pending_bytes": len(self._out)}
+
+    def close(self):
+        self.pub.close()
+        self.sub.close()
+
+
+# BUS_URL : unix:///répertoire (workers d'une même machine) ou redis://hôte:port
+def make_bus(url, worker_id=0, workers=1):
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return UnixSocketBus(parsed.path, worker_id, workers)
+    if parsed.scheme in ("redis", "valkey"):
+        return RedisBus(url)
+    raise ValueError(f"bus inconnu : {url}")
+
+
+# Lance `workers` processus relais sur le même port (SO_REUSEPORT : le noyau
+# répartit les connexions) reliés par un bus local, et attend leur fin.
+def run_workers(script, workers):
+    env = dict(os.environ, WORKERS=str(workers))
+    # Même relay_epoch pour tous les workers : un écran passé de l'un à l'autre garde sa reprise
+    env.setdefault("RELAY_EPOCH", str(int(time.time() * 1000)))
+    directory = None
+    if not env.get("BUS_URL"):
+        directory = tempfile.mkdtemp(prefix="relay-bus-")
+        env["BUS_URL"] = f"unix://{directory}"
+    processes = [subprocess.Popen([sys.executable, script], env=dict(env, WORKER_ID=str(i)))
+                 for i in range(workers)]
+
+    def stop(*args):
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        stop()
+        for process in processes:
+            process.wait()
+    finally:
+        if directory is not None:
+            for name in os.listdir(directory):
+                os.unlink(os.path.join(directory, name))
+            os.rmdir(directory)
@@ -0,0 +1,113 @@
+from array import array
+
+from wire import FIELDS
+
+
+# Tampon circulaire de taille fixe : une colonne "d" pour les horodatages et
+# une par métrique. La mémoire est allouée une fois pour toutes, quelle que
+# soit la durée de l'événement.
+class RingBuffer:
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.columns = [array("d", bytes(8 * capacity)) for _ in range(width)]
+        self.head = 0
+        self.size = 0
+
+    def append(self, t, values):
+        i = self.head
+        self.times[i] = t
+        for column, value in zip(self.columns, values):
+            column[i] = value
+        self.head = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def _physical(self, k):
+        # k = rang chronologique (0 = plus ancien point conservé)
+        return (self.head - self.size + k) % self.capacity
+
+    def _first_at_or_after(self, t_min):
+        # Recherche dichotomique : les horodatages sont croissants
+        lo, hi = 0, self.size
+        times = self.times
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[self._physical(mid)] < t_min:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def since(self, t_min):
+        start = self._first_at_or_after(t_min)
+        idx = [self._physical(k) for k in range(start, self.size)]
+        times = [self.times[i] for i in idx]
+        columns = [[column[i] for i in idx] for column in self.columns]
+        return times, columns
+
+
+# Largest-Triangle-Three-Buckets : garde `threshold` points en préservant
+# la forme visuelle de la courbe. Renvoie les indices retenus.
+# Le premier et le dernier point sont toujours gardés : 3 points au minimum.
+def lttb(xs, ys, threshold):
+    n = len(xs)
+    threshold = max(threshold, 3)
+    if threshold >= n:
+        return list(range(n))
+    selected = [0]
+    bucket = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket) + 1
+        end = int((i + 1) * bucket) + 1
+        # Moyenne du seau suivant (le dernier point pour le dernier seau)
+        next_start = end
+        next_end = min(int((i + 2) * bucket) + 1, n)
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+# Un tampon par vélo, alloué à sa première trame (8 octets x capacity par
+# colonne). bike_id vient des clients : au-delà de max_bikes vélos, les
+# nouveaux ne sont plus historisés (comptés dans rejected).
+class History:
+    def __init__(self, capacity, max_bikes=64):
+        self.capacity = capacity
+        self.max_bikes = max_bikes
+        self.buffers = {}
+        self.rejected = 0
+
+    def record(self, bike_id, t, values):
+        buffer = self.buffers.get(bike_id)
+        if buffer is None:
+            if len(self.buffers) >= self.max_bikes:
+                self.rejected += 1
+                return
+            buffer = self.buffers[bike_id] = RingBuffer(self.capacity, len(FIELDS))
+        buffer.append(t, values)
+
+    def query(self, bike_id, t_min, points, metric="power"):
+        buffer = self.buffers.get(bike_id)
+        if buffer is None:
+            return None
+        times, columns = buffer.since(t_min)
+        if points and len(times) > points:
+            driver = columns[FIELDS.index(metric)]
+            keep = lttb(times, driver, points)
+            times = [times[i] for i in keep]
+            columns = [[column[i] for i in keep] for column in columns]
+        result = {"t": times}
+        result.update(zip(FIELDS, columns))
+        return result
@@ -0,0 +1,77 @@
+import math
+
+# Histogrammes de latence à seaux logarithmiques (~5 % de largeur) :
+# mémoire fixe, percentiles approchés sans garder les échantillons.
+_MIN = 1e-4     # 0,1 ms
+_MAX = 120.0    # 2 min
+_GROWTH = 1.05
+_BUCKETS = int(math.log(_MAX / _MIN, _GROWTH)) + 2
+
+# Trajets mesurés, dans l'ordre du parcours d'une trame
+HOPS = ("gateway_to_relay", "relay", "relay_to_dashboard", "end_to_end")
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        if seconds < 0:
+            # Estimation d'horloge imparfaite : on borne plutôt que de jeter l'échantillon
+            seconds = 0.0
+        if seconds <= _MIN:
+            i = 0
+        else:
+            i = min(int(math.log(seconds / _MIN, _GROWTH)) + 1, _BUCKETS - 1)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                # Borne haute du seau : estimation pessimiste
+                return min(_MIN * _GROWTH ** i, self.max)
+        return self.max
+
+    def summary(self):
+        def ms(v):
+            return None if v is None else round(v * 1000, 2)
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "p50_ms": ms(self.percentile(0.50)),
+            "p95_ms": ms(self.percentile(0.95)),
+            "p99_ms": ms(self.percentile(0.99)),
+            "max_ms": ms(self.max) if self.count else None,
+        }
+
+
+class LatencyTracker:
+    def __init__(self):
+        self.hops = {hop: LatencyHistogram() for hop in HOPS}
+
+    def observe(self, hop, seconds):
+        self.hops[hop].observe(seconds)
+
+    def summary(self):
+        return {hop: h.summary() for hop, h in self.hops.items()}
+
+
+# Estimation du décalage d'horloge par échange ping/pong (type NTP) :
+# on garde l'échantillon au plus petit aller-retour, le moins bruité.
+def estimate_offset(samples):
+    # samples : [(t0 local, t serveur, t1 local), ...] -> (décalage serveur - local, rtt)
+    best = min(samples, key=lambda s: s[2] - s[0])
+    t0, t_server, t1 = best
+    return t_server - (t0 + t1) / 2, t1 - t0
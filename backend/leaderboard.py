@@ -0,0 +1,115 @@
+import math
+import time
+import uuid
+
+from sortedcontainers import SortedList
+
+# Classements tenus par le relais, communs à tous les écrans (auparavant une
+# liste par navigateur dans localStorage, retriée à chaque fin de session).
+# Chaque classement est une SortedList de clés (-score, instant, participant) :
+# insertion, retrait et rang en O(log n), top K sans tri. À score égal, le
+# premier à l'avoir atteint passe devant.
+# Tenus en mémoire ; avec une persistance (PERSIST_URL), les résultats y sont
+# écrits et les classements reconstruits au démarrage (Relay.restore_leaderboards).
+# Un tableau par champ du résultat de session : vitesse max (km/h), énergie (Wh)
+BOARDS = ("speed", "energy")
+LEADERBOARD_ROOM = "leaderboard"
+
+
+class Leaderboard:
+    def __init__(self, name, k=10):
+        self.name = name
+        self.k = k
+        self.order = SortedList()
+        # participant -> (clé dans order, nom affiché)
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.order)
+
+    def _top_ids(self):
+        return [key[2] for key in self.order.islice(0, self.k)]
+
+    def _entry(self, rank, participant_id):
+        key, name = self.entries[participant_id]
+        return {"rank": rank, "id": participant_id, "name": name, "score": -key[0]}
+
+    # Garde le meilleur score de chaque participant. Renvoie les entrées du top K
+    # dont le rang ou le score a changé, y compris celles qui en sortent (rang > k)
+    def submit(self, participant_id, name, score, t):
+        previous = self.entries.get(participant_id)
+        if previous is not None and -previous[0][0] >= score:
+            return []
+        before = {pid: rank for rank, pid in enumerate(self._top_ids(), 1)}
+        if previous is not None:
+            self.order.remove(previous[0])
+        key = (-score, t, participant_id)
+        self.order.add(key)
+        self.entries[participant_id] = (key, name)
+        changes = []
+        after = self._top_ids()
+        for rank, pid in enumerate(after, 1):
+            if before.get(pid) != rank or pid == participant_id:
+                changes.append(self._entry(rank, pid))
+        for pid in before.keys() - set(after):
+            changes.append(self._entry(self.rank(pid), pid))
+        return changes
+
+    # Rang (1 = premier), None si le participant n'a pas de score
+    def rank(self, participant_id):
+        entry = self.entries.get(participant_id)
+        if entry is None:
+            return None
+        return self.order.index(entry[0]) + 1
+
+    def top(self, k=None):
+        k = self.k if k is None else k
+        return [self._entry(rank, key[2]) for rank, key in enumerate(self.order.islice(0, k), 1)]
+
+    def lookup(self, participant_id):
+        rank = self.rank(participant_id)
+        return self._entry(rank, participant_id) if rank is not None else None
+
+
+class Leaderboards:
+    def __init__(self, k=10):
+        self.boards = {name: Leaderboard(name, k) for name in BOARDS}
+
+    def get(self, name):
+        return self.boards.get(name)
+
+    # Résultat de session envoyé par un écran : id et instant attribués s'ils manquent
+    def normalize(self, data):
+        data = data or {}
+        name = str(data.get("name") or "").strip()[:40]
+        if not name:
+            raise ValueError("nom de participant manquant")
+        record = {"id": str(data.get("id") or uuid.uuid4().hex[:12]), "name": name,
+                  "t": float(data.get("t") or time.time())}
+        for board in BOARDS:
+            value = float(data.get(board) or 0)
+            if not math.isfinite(value):
+                raise ValueError(f"score invalide : {board}")
+            record[board] = max(value, 0.0)
+        return record
+
+    # -> {tableau: changements}, seulement les tableaux modifiés
+    def submit(self, record):
+        updates = {}
+        for board in BOARDS:
+            changes = self.boards[board].submit(record["id"], record["name"], record[board], record["t"])
+            if changes:
+                updates[board] = changes
+        return updates
+
+    def ranks(self, participant_id):
+        return {name: board.rank(participant_id) for name, board in self.boards.items()}
+
+    def snapshot(self):
+        return {name: board.top() for name, board in self.boards.items()}
+
+    # Événements "leaderboard_update" : seuls les rangs modifiés sont poussés ;
+    # une entrée de rang supérieur à k vient de sortir du top
+    def messages(self, updates):
+        return [("leaderboard_update", {"board": board, "k": self.boards[board].k, "changes": changes})
+                for board, changes in updates.items()]
@@ -0,0 +1,176 @@
+import time
+
+# Registre de métriques en mémoire, exposé au format texte Prometheus sur /metrics.
+# Mise à jour en O(1) dans les handlers ; les jauges coûteuses (rooms, files)
+# sont calculées uniquement au moment de la collecte.
+
+# Durée d'un handler : de 50 µs à 1 s
+DURATION_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+# Retard de la boucle d'événements
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value):
+    # Format texte Prometheus : \\, \" et \n dans les valeurs de labels
+    # (room et bike_id viennent des clients)
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+# Compteur incrémenté par le code, ou lu à la collecte sur un compteur existant
+# (collect() renvoie {(valeurs de labels): valeur})
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.values = {}
+
+    def inc(self, *labels, n=1):
+        self.values[labels] = self.values.get(labels, 0) + n
+
+    def lines(self):
+        values = self.collect() if self.collect is not None else self.values
+        for labels, v in values.items():
+            yield f"{self.name}{_labels(self.labels, labels)} {_number(v)}"
+
+
+# Jauge fixée par le code, ou lue à la collecte comme Counter
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.values = {}
+
+    def set(self, *labels, value):
+        self.values[labels] = value
+
+    def lines(self):
+        values = self.collect() if self.collect is not None else self.values
+        for labels, v in values.items():
+            yield f"{self.name}{_labels(self.labels, labels)} {_number(v)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, *labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            # [compteurs par seau (non cumulés)..., +Inf, somme]
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        series[i] += 1
+        series[-1] += value
+
+    def lines(self):
+        names = self.labels + ("le",)
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(names, labels + (_number(bound),))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {_number(series[-1])}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+# Quantiles précalculés (p50/p95/p99), par exemple ceux de latency.py
+class Summary:
+    kind = "summary"
+
+    def __init__(self, name, help, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def lines(self):
+        # collect() : {(valeurs de labels): (count, sum, {quantile: valeur})}
+        names = self.labels + ("quantile",)
+        for labels, (count, total, quantiles) in self.collect().items():
+            for q, v in quantiles.items():
+                if v is not None:
+                    yield f"{self.name}{_labels(names, labels + (q,))} {_number(v)}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=(), collect=None):
+        return self.register(Counter(name, help, labels, collect))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self.register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def summary(self, name, help, labels=(), collect=None):
+        return self.register(Summary(name, help, labels, collect))
+
+    def render(self):
+        out = []
+        for metric in self.metrics:
+            out.append(f"# HELP {metric.name} {metric.help}")
+            out.append(f"# TYPE {metric.name} {metric.kind}")
+            out.extend(metric.lines())
+        return "\n".join(out) + "\n"
+
+
+# Mesure du retard de la boucle eventlet : on demande à dormir `interval`
+# secondes, tout dépassement est du temps où le hub n'a pas pu nous reprendre
+# la main (handler trop long, E/S bloquante...).
+def run_hub_lag_probe(sleep, gauge, histogram, interval=0.5):
+    while True:
+        start = time.monotonic()
+        sleep(interval)
+        lag = max(0.0, time.monotonic() - start - interval)
+        gauge.set(value=lag)
+        histogram.observe(value=lag)
+
+
+# Même mesure pour la boucle asyncio (asgi_server.py)
+async def run_loop_lag_probe(sleep, gauge, histogram, interval=0.5):
+    while True:
+        start = time.monotonic()
+        await sleep(interval)
+        lag = max(0.0, time.monotonic() - start - interval)
+        gauge.set(value=lag)
+        histogram.observe(value=lag)
@@ -0,0 +1,94 @@
+# Totaux par vélo calculés une seule fois, par le relais, et diffusés avec
+# chaque trame : tous les écrans affichent les mêmes valeurs, sans calcul ni
+# écriture localStorage de leur côté.
+#   total_energy   : Wh, intégrale de la puissance (méthode des trapèzes) sur
+#                    les horodatages capteur ramenés sur l'horloge du relais
+#   total_distance : m, révolutions de pédalier x développement
+#   speed          : km/h, d'après la cadence
+TOTAL_FIELDS = ("total_energy", "total_distance", "speed")
+# Énergie (Wh) et distance (m) ajoutées par la dernière trame du vélo : la
+# persistance les garde avec chaque trame, les cumuls par période en sont la
+# somme, quel que soit le worker qui a reçu la trame
+STEP_FIELDS = ("step_energy", "step_distance")
+
+# Développement par tour de pédalier : rapport de transmission x circonférence de roue (m)
+TRANSMISSION_RATIO = 3.3
+WHEEL_CIRCUMFERENCE = 2.1
+
+
+def revolution_delta(previous, current):
+    if current >= previous:
+        return current - previous
+    # Compteur rebouclé : 16 bits côté capteur BLE, 32 bits dans la trame binaire
+    modulus = 1 << 16 if previous < 1 << 16 else 1 << 32
+    return current + modulus - previous
+
+
+class BikeTotals:
+    __slots__ = ("energy", "distance", "last_t", "last_power", "last_revs", "step")
+
+    def __init__(self):
+        self.energy = 0.0
+        self.distance = 0.0
+        self.last_t = None
+        self.last_power = None
+        self.last_revs = None
+        self.step = (0.0, 0.0)
+
+
+class Odometer:
+    # max_gap : au-delà (s), pas d'intégration à travers le trou (capteur muet, relais redémarré)
+    # max_cadence : tr/min ; un saut de compteur plus grand (plus une marge de
+    # REVS_SLACK tours, les notifications pouvant en regrouper plusieurs) est une
+    # remise à zéro du capteur, pas du pédalage
+    REVS_SLACK = 8
+
+    def __init__(self, meters_per_rev=TRANSMISSION_RATIO * WHEEL_CIRCUMFERENCE, max_gap=5.0, max_cadence=250):
+        self.meters_per_rev = meters_per_rev
+        self.max_gap = max_gap
+        self.max_cadence = max_cadence
+        self.bikes = {}
+
+    def plausible(self, delta, dt):
+        return delta <= self.max_cadence / 60 * dt + self.REVS_SLACK
+
+    # t : instant de la mesure (s, horloge monotone du relais), None si inconnu.
+    # Renvoie les valeurs de TOTAL_FIELDS.
+    def update(self, bike_id, t, power, revolutions, cadence):
+        totals = self.bikes.get(bike_id)
+        if totals is None:
+            totals = self.bikes[bike_id] = BikeTotals()
+        power = max(power or 0, 0)
+        revolutions = int(revolutions or 0)
+        energy, distance = totals.energy, totals.distance
+        dt = t - totals.last_t if t is not None and totals.last_t is not None else None
+        if dt is not None and 0 < dt <= self.max_gap:
+            totals.energy += (totals.last_power + power) / 2 * dt / 3600
+            delta = revolution_delta(totals.last_revs, revolutions)
+            if self.plausible(delta, dt):
+                totals.distance += delta * self.meters_per_rev
+        elif t is None and totals.last_revs is not None:
+            # Trame sans horodatage exploitable : la distance reste comptée
+            delta = revolution_delta(totals.last_revs, revolutions)
+            if self.plausible(delta, self.max_gap):
+                totals.distance += delta * self.meters_per_rev
+        if t is not None:
+            totals.last_t = t
+        totals.last_power = power
+        totals.last_revs = revolutions
+        totals.step = (totals.energy - energy, totals.distance - distance)
+        speed = max(cadence or 0, 0) / 60 * self.meters_per_rev * 3.6
+        return round(totals.energy, 4), round(totals.distance, 2), round(speed, 2)
+
+    # Valeurs de STEP_FIELDS de la dernière trame du vélo
+    def step(self, bike_id):
+        totals = self.bikes.get(bike_id)
+        if totals is None:
+            return 0.0, 0.0
+        return round(totals.step[0], 6), round(totals.step[1], 3)
+
+    def totals(self, bike_id):
+        totals = self.bikes.get(bike_id)
+        if totals is None:
+            return None
+        return {"total_energy": round(totals.energy, 4), "total_distance": round(totals.distance, 2)}
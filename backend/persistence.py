@@ -0,0 +1,294 @@
+import glob
+import json
+import os
+import queue
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from odometer import STEP_FIELDS, TOTAL_FIELDS
+from wire import FIELDS
+
+# Persistance en écriture différée : les handlers Socket.IO ne font qu'un
+# put_nowait dans une file ; un thread système regroupe trames et résumés de
+# session en lots, vidés tous les batch_size éléments ou toutes les
+# flush_interval secondes, et les écrit dans le puits (Cosmos DB, fichier...).
+# Puits indisponible : le lot est réessayé avec un délai croissant, pendant
+# que la file se remplit ; une fois pleine, les nouveaux éléments sont comptés
+# comme perdus plutôt que de retenir la boucle d'événements. Un lot refusé
+# (erreur non réessayable, ou max_attempts essais) est abandonné et compté :
+# il ne bloque pas les suivants.
+#
+# Documents écrits (mêmes champs quel que soit le puits) :
+#   {"type": "frames", "id", "bike_id", "t0", "t1", "fields",
+#    "frames": [[t, rseq, valeurs..., cumuls..., apports de la trame...]]}
+#     une par vélo et par lot, t en secondes epoch
+#   {"type": "session", "id", "bike_id", "name", "started_at", "ended_at",
+#    "energy", "distance", "max_speed", "saved"}
+#     aussi pour un résultat envoyé par un écran (leaderboard_submit) : bike_id
+#     vide, distance nulle, début et fin à l'instant du résultat
+# Les puits qui savent relire leurs sessions (saved_sessions) permettent au
+# relais de reconstruire ses classements au démarrage.
+FRAME_COLUMNS = ("t", "rseq") + FIELDS + TOTAL_FIELDS + STEP_FIELDS
+# Caractères admis dans un id de document (Cosmos refuse / \ ? #) ; bike_id vient des passerelles
+_UNSAFE_ID = re.compile(r"[^0-9A-Za-z_.-]")
+
+
+# Erreur du puits qui peut disparaître en réessayant : coupure réseau, base
+# verrouillée, 408/429/5xx de Cosmos ; pas un document refusé (4xx) ni une
+# erreur de données
+def retryable(error):
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 429) or status >= 500
+    return not isinstance(error, (ValueError, TypeError, KeyError))
+
+
+class WriteBehind:
+    def __init__(self, sink, batch_size=500, flush_interval=1.0, max_pending=100000,
+                 retry_initial=0.5, retry_max=30.0, max_attempts=20):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.written = 0
+        self.dropped = 0
+        self.failures = 0
+        self.abandoned = 0
+        self.batches = 0
+        self._closing = False
+        # Réveille l'attente entre deux essais à l'arrêt
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    # Appelé depuis la boucle d'événements : jamais bloquant
+    def _put(self, item):
+        try:
+            self.pending.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    # t : instant de la mesure (s epoch), l'arrivée à défaut
+    def frame(self, frame, t=None):
+        n = len(TOTAL_FIELDS)
+        totals = frame.totals[:n] if frame.totals is not None else (None,) * n
+        totals += frame.step if frame.step is not None else (None,) * len(STEP_FIELDS)
+        self._put(("frame", frame.bike_id, t or time.time(), frame.rseq, frame.values(), totals))
+
+    def session(self, ride, saved=True):
+        energy, distance, max_speed = ride.values()
+        self._put(("session", {
+            "type": "session", "id": ride.id, "bike_id": ride.bike_id, "name": ride.name,
+            "started_at": ride.started_at, "ended_at": time.time(),
+            "energy": energy, "distance": distance, "max_speed": max_speed, "saved": saved,
+        }))
+
+    # Résultat hors session (leaderboard.Leaderboards.normalize), persisté pour les classements
+    def result(self, record):
+        self._put(("session", {
+            "type": "session", "id": record["id"], "bike_id": "", "name": record["name"],
+            "started_at": record["t"], "ended_at": record["t"],
+            "energy": record["energy"], "distance": 0.0, "max_speed": record["speed"], "saved": True,
+        }))
+
+    # Sessions enregistrées au classement, relues du puits ; None s'il ne sait pas les relire
+    def saved_sessions(self):
+        read = getattr(self.sink, "saved_sessions", None)
+        return read() if read is not None else None
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(documents(batch))
+                    return
+                batch.append(item)
+            if batch:
+                self._write(documents(batch))
+            elif self._closing:
+                # Arrêt sans marqueur de fin (file pleine) : la file est vide, on s'arrête
+                return
+
+    def _write(self, docs):
+        if not docs:
+            return
+        delay = self.retry_initial
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.sink.write(docs)
+            except Exception as e:
+                self.failures += 1
+                if self._closing or attempt == self.max_attempts or not retryable(e):
+                    self.abandoned += len(docs)
+                    print(f"⚠️ Persistance : {len(docs)} documents abandonnés après {attempt} essai(s) ({e})")
+                    return
+                print(f"⚠️ Persistance indisponible ({e}), nouvel essai dans {delay:.1f} s")
+                self._wake.wait(delay)
+                delay = min(delay * 2, self.retry_max)
+                continue
+            self.written += len(docs)
+            self.batches += 1
+            return
+
+    # Vide la file (au plus timeout secondes) puis ferme le puits, une fois le
+    # thread d'écriture terminé : un lot en attente de nouvel essai est tenté
+    # une dernière fois, sans délai
+    def close(self, timeout=5.0):
+        self._closing = True
+        self._wake.set()
+        try:
+            self.pending.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print("⚠️ Persistance : écriture toujours en cours, puits laissé ouvert")
+            return
+        self.sink.close()
+
+    def stats(self):
+        return {"pending": self.pending.qsize(), "written": self.written, "batches": self.batches,
+                "dropped": self.dropped, "failures": self.failures, "abandoned": self.abandoned}
+
+
+# Lot de la file -> documents : les trames d'un même vélo sont regroupées
+def documents(batch):
+    docs = []
+    frames = {}
+    for item in batch:
+        if item[0] == "session":
+            docs.append(item[1])
+            continue
+        _, bike_id, t, rseq, values, totals = item
+        frames.setdefault(bike_id, []).append([round(t, 3), rseq] + list(values) + list(totals))
+    for bike_id, rows in frames.items():
+        doc_id = f"{_UNSAFE_ID.sub('_', bike_id)}-{rows[0][0]:.3f}-{rows[0][1]}"
+        docs.append({"type": "frames", "id": doc_id, "bike_id": bike_id,
+                     "t0": rows[0][0], "t1": rows[-1][0], "fields": FRAME_COLUMNS, "frames": rows})
+    return docs
+
+
+# Puits Cosmos DB (SQL API), clé de partition /bike_id. upsert : un lot
+# réessayé après une erreur partielle ne crée pas de doublon.
+class CosmosSink:
+    def __init__(self, endpoint, key, database, container):
+        from azure.cosmos import CosmosClient, PartitionKey
+
+        client = CosmosClient(endpoint, credential=key)
+        db = client.create_database_if_not_exists(database)
+        self.container = db.create_container_if_not_exists(container, partition_key=PartitionKey(path="/bike_id"))
+
+    def write(self, docs):
+        for doc in docs:
+            self.container.upsert_item(doc)
+
+    def saved_sessions(self):
+        return self.container.query_items("SELECT * FROM c WHERE c.type = 'session' AND c.saved = true",
+                                          enable_cross_partition_query=True)
+
+    def close(self):
+        pass
+
+
+# Puits local : un document JSON par ligne, mêmes documents que Cosmos.
+# Remplace Cosmos sur un poste sans accès au cloud ou pour les essais.
+# Un lot est écrit en entier ou pas du tout (fichier ramené à sa taille
+# d'avant en cas d'échec) : comme l'upsert de Cosmos, un lot réessayé ne crée
+# pas de doublons.
+# pattern : fichiers relus par saved_sessions (ceux de tous les workers)
+class JsonLinesSink:
+    def __init__(self, path, pattern=None):
+        self.path = path
+        self.pattern = pattern or glob.escape(path)
+        # Sans tampon : ce qui n'a pas été écrit ne part pas plus tard
+        self._file = open(path, "ab", buffering=0)
+
+    def write(self, docs):
+        data = "".join(json.dumps(doc, separators=(",", ":"), ensure_ascii=False) + "\n" for doc in docs)
+        fd = self._file.fileno()
+        size = os.fstat(fd).st_size
+        try:
+            view = memoryview(data.encode("utf-8"))
+            while view:
+                view = view[self._file.write(view):]
+            os.fsync(fd)
+        except OSError:
+            os.ftruncate(fd, size)
+            raise
+
+    def saved_sessions(self):
+        return saved_sessions(sorted(glob.glob(self.pattern)))
+
+    def close(self):
+        self._file.close()
+
+
+def read_documents(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Sessions enregistrées au classement dans des fichiers de documents JSON par
+# ligne ; une ligne tronquée (arrêt brutal) est ignorée
+def saved_sessions(paths):
+    sessions = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if '"session"' not in line:
+                    continue
+                try:
+                    doc = json.loads(line)
+                except ValueError:
+                    continue
+                if doc.get("type") == "session" and doc.get("saved", True):
+                    sessions.append(doc)
+    return sessions
+
+
+# PERSIST_URL :
+#   cosmos://<compte>.documents.azure.com/<base>/<conteneur>  (clé dans COSMOS_KEY)
+#   file:///chemin/rides.jsonl  (suffixé par worker_id avec plusieurs workers)
+#   sqlite:///chemin/michelin.db  (base interrogeable, store.py ; partagée par les workers)
+#   archive:///répertoire  (colonnes projetables en mémoire, archive.py ; suffixé par worker_id)
+# Paramètres communs : ?batch=500&interval=1.0&attempts=20
+def make_persistence(url, worker_id=None):
+    parsed = urlparse(url)
+    params = parse_qs(parsed.query)
+    batch_size = int(params.get("batch", [500])[0])
+    flush_interval = float(params.get("interval", [1.0])[0])
+    max_attempts = int(params.get("attempts", [20])[0])
+    if parsed.scheme == "cosmos":
+        database, _, container = parsed.path.strip("/").partition("/")
+        sink = CosmosSink(f"https://{parsed.netloc}:443/", os.environ.get("COSMOS_KEY"),
+                          database or "michelin", container or "rides")
+    elif parsed.scheme == "sqlite":
+        from store import SqliteStore
+
+        sink = SqliteStore(parsed.path)
+    elif parsed.scheme == "archive":
+        from archive import ArchiveSink
+
+        sink = ArchiveSink(parsed.path if worker_id is None else f"{parsed.path}.{worker_id}",
+                           glob.escape(parsed.path) + "*")
+    elif parsed.scheme == "file":
+        sink = JsonLinesSink(parsed.path if worker_id is None else f"{parsed.path}.{worker_id}",
+                             glob.escape(parsed.path) + "*")
+    else:
+        raise ValueError(f"PERSIST_URL non reconnue : {url}")
+    print(f"💾 Persistance {parsed.scheme} (lots de {batch_size}, toutes les {flush_interval} s)")
+    return WriteBehind(sink, batch_size, flush_interval, max_attempts=max_attempts)
@@ -0,0 +1,455 @@
+import json
+import time
+from collections import deque
+
+from bus import FLAG_EVENT, FLAG_REPLAY, decode_message, encode_event, encode_message, new_node_id
+from history import History
+from latency import LatencyTracker
+from leaderboard import Leaderboards
+from metrics import LAG_BUCKETS, Registry
+from odometer import Odometer
+from rides import SESSION_FIELDS, Rides
+from store import SqliteStore, day_bounds
+from wire import FIELDS, Frame
+
+# État du relais, indépendant du serveur web : capteurs enregistrés,
+# déduplication, horodatage, historique et métriques. Partagé par server.py
+# (Flask-SocketIO sous eventlet) et asgi_server.py (python-socketio sous uvicorn),
+# qui ne gardent que le câblage des événements et la diffusion.
+class Relay:
+    def __init__(self, history_capacity=36000, log_every=0, recorder=None, bus=None, replay_window=600,
+                 odometer=None, leaderboards=None, rides=None, persistence=None, history_bikes=64,
+                 relay_epoch=None):
+        self.history = History(history_capacity, history_bikes)
+        # Latences par tronçon : passerelle -> relais -> écran (voir latency.py)
+        self.latency = LatencyTracker()
+        self.recorder = recorder
+        # Journal des trames reçues : une sur log_every (0 = aucune). Un print par
+        # message est une écriture bloquante sur stdout qui retient la boucle.
+        self.log_every = log_every
+        self.received = 0
+        # Capteurs enregistrés : sid de la passerelle -> vélos qu'elle porte (le premier par défaut)
+        self.sensors = {}
+        # Époque de la passerelle (une par lancement) : sid -> époque
+        self.epochs = {}
+        # Dernière trame acceptée par vélo : bike_id -> (époque, seq)
+        self.last_seq = {}
+        # Séquence du relais par vélo (rseq) et dernières trames numérotées, pour
+        # qu'un écran reconnecté rattrape les trames manquées (replay_since)
+        self.relay_seq = {}
+        # Lancement du relais (ms epoch, commun aux workers) : les rseq n'ont de
+        # sens que dans un même lancement, les écrans comparent relay_epoch
+        self.relay_epoch = relay_epoch or int(time.time() * 1000)
+        self.replay_window = replay_window
+        self.replay = {}
+        # Énergie et distance cumulées par vélo, faisant foi pour tous les écrans
+        self.odometer = odometer if odometer is not None else Odometer()
+        # Classements vitesse et énergie des sessions terminées (leaderboard.py)
+        self.leaderboards = leaderboards if leaderboards is not None else Leaderboards()
+        # Session en cours par vélo (rides.py), cumulée trame par trame
+        self.rides = rides if rides is not None else Rides()
+        # Écriture différée des trames et des sessions (persistence.py) ; None sans persistance
+        self.persistence = persistence
+        # Décalage d'horloge estimé par la passerelle (horloge relais - horloge passerelle) : sid -> s
+        self.clock_offsets = {}
+        # Bus entre workers (bus.py) ; None pour un relais mono-processus
+        self.bus = bus
+        self.node_id = new_node_id()
+        # Métriques exposées sur /metrics (format Prometheus)
+        self.registry = Registry()
+        self.messages_in = self.registry.counter(
+            "relay_messages_in_total", "Messages Socket.IO reçus", ("event",))
+        self.handler_seconds = self.registry.histogram(
+            "relay_handler_duration_seconds", "Durée des handlers Socket.IO", ("event",))
+        self.hub_lag = self.registry.gauge(
+            "relay_hub_lag_seconds", "Dernier retard mesuré de la boucle d'événements")
+        self.hub_lag_seconds = self.registry.histogram(
+            "relay_hub_lag_distribution_seconds", "Retard de la boucle d'événements", buckets=LAG_BUCKETS)
+
+    # server : le serveur python-socketio (socketio.server sous Flask-SocketIO)
+    def register_metrics(self, server, broadcaster, queues=None):
+        def collect_room_clients():
+            rooms = server.manager.rooms.get("/", {})
+            return {(room,): len(members) for room, members in rooms.items()
+                    if isinstance(room, str) and room.startswith("bike:")}
+
+        def collect_connected():
+            return {(): len(server.manager.rooms.get("/", {}).get(None, ()))}
+
+        def collect_emit_queues():
+            # Paquets en attente d'écriture dans la file engine.io de chaque client
+            depths = [s.queue.qsize() for s in list(server.eio.sockets.values())]
+            return {("total",): sum(depths), ("max",): max(depths, default=0)}
+
+        def collect_latency():
+            return {(hop,): (h.count, h.total, {"0.5": h.percentile(0.5), "0.95": h.percentile(0.95),
+                                                "0.99": h.percentile(0.99)})
+                    for hop, h in self.latency.hops.items()}
+
+        registry = self.registry
+        registry.counter("relay_messages_out_total", "Messages envoyés aux écrans",
+                         collect=lambda: {(): broadcaster.stats()["messages_out"]})
+        registry.gauge("relay_connected_clients", "Clients Socket.IO connectés", collect=collect_connected)
+        registry.gauge("relay_room_clients", "Clients abonnés par room", ("room",), collect=collect_room_clients)
+        registry.gauge("relay_emit_queue_depth", "Paquets en attente d'envoi (somme et max par client)",
+                       ("stat",), collect=collect_emit_queues)
+        registry.gauge("relay_broadcast_pending", "Trames en attente du prochain tick de diffusion",
+                       collect=lambda: {(): broadcaster.stats().get("pending", 0)})
+        registry.summary("relay_latency_seconds", "Latence des trames par tronçon (voir /api/latency)",
+                         ("hop",), collect=collect_latency)
+        if queues is not None:
+            registry.counter("relay_send_dropped_total", "Trames remplacées dans la file d'un écran lent",
+                             collect=lambda: {(): queues.dropped})
+            registry.counter("relay_clients_evicted_total", "Écrans lents déconnectés",
+                             collect=lambda: {(): queues.evicted})
+            registry.gauge("relay_slow_clients", "Écrans en mode lent (trames retenues)",
+                           collect=lambda: {(): len(queues.held)})
+        registry.counter("relay_history_rejected_total", "Trames non historisées (HISTORY_MAX_BIKES atteint)",
+                         collect=lambda: {(): self.history.rejected})
+        if self.persistence is not None:
+            registry.counter("relay_persist_documents_total", "Documents écrits par la persistance différée",
+                             collect=lambda: {(): self.persistence.written})
+            registry.counter("relay_persist_dropped_total", "Éléments perdus, file de persistance pleine",
+                             collect=lambda: {(): self.persistence.dropped})
+            registry.counter("relay_persist_failures_total", "Écritures de lot en échec (réessayées)",
+                             collect=lambda: {(): self.persistence.failures})
+            registry.counter("relay_persist_abandoned_total", "Documents abandonnés (lot refusé ou essais épuisés)",
+                             collect=lambda: {(): self.persistence.abandoned})
+            registry.gauge("relay_persist_pending", "Éléments en attente d'écriture",
+                           collect=lambda: {(): self.persistence.pending.qsize()})
+            sink_stats = getattr(self.persistence.sink, "stats", None)
+            if sink_stats is not None:
+                registry.counter("relay_persist_skipped_total", "Trames ignorées par le puits (doublon, hors ordre)",
+                                 ("reason",), collect=lambda: {(k,): v for k, v in sink_stats().items()})
+        if self.bus is not None:
+            registry.counter("relay_bus_messages_total", "Messages du bus entre workers", ("direction",),
+                             collect=lambda: {(k,): v for k, v in self.bus.stats().items()
+                                              if k in ("published", "received", "dropped")})
+
+    def log_frame(self, data):
+        self.received += 1
+        if self.log_every and self.received % self.log_every == 0:
+            print("📡 Données reçues du capteur :", data)
+
+    def register_sensor(self, sid, data):
+        data = data or {}
+        bikes = [str(b) for b in data.get("bikes") or [data.get("bike_id", "default")]]
+        self.sensors[sid] = bikes
+        self.epochs[sid] = int(data.get("epoch", 0))
+        return bikes
+
+    # Renvoie les vélos du capteur déconnecté, None pour un écran
+    def forget(self, sid):
+        self.epochs.pop(sid, None)
+        self.clock_offsets.pop(sid, None)
+        return self.sensors.pop(sid, None)
+
+    def sensor_bike(self, sid, claimed=None):
+        # Une passerelle multi-vélos étiquette ses trames ; on n'accepte que ses propres vélos
+        bikes = self.sensors.get(sid)
+        if not bikes:
+            return str(claimed or "default")
+        if claimed is not None and str(claimed) in bikes:
+            return str(claimed)
+        return bikes[0]
+
+    def accept_seq(self, bike_id, epoch, seq):
+        # Les trames rejouées depuis le spool peuvent arriver deux fois : on ne garde
+        # que celles plus récentes que la dernière acceptée
+        if seq is None:
+            return True
+        key = (epoch, seq)
+        previous = self.last_seq.get(bike_id)
+        if previous is not None and key <= previous:
+            return False
+        self.last_seq[bike_id] = key
+        return True
+
+    def stamp_arrival(self, frame, sid):
+        # Horodatage d'entrée ; la trame est ramenée sur l'horloge du relais
+        # seulement si la passerelle a déjà estimé son décalage
+        frame.t_in = time.monotonic()
+        offset = self.clock_offsets.get(sid)
+        if frame.t_gw is not None and offset is not None:
+            frame.t_src = frame.t_gw + offset
+            self.latency.observe("gateway_to_relay", frame.t_in - frame.t_src)
+
+    def stamp_seq(self, frame, rseq=None):
+        # rseq fourni : trame numérotée par un autre worker (bus), on suit sa séquence
+        if rseq is None:
+            rseq = self.relay_seq.get(frame.bike_id, 0) + 1
+        frame.rseq = rseq
+        if rseq > self.relay_seq.get(frame.bike_id, 0):
+            self.relay_seq[frame.bike_id] = rseq
+        window = self.replay.get(frame.bike_id)
+        if window is None:
+            window = self.replay[frame.bike_id] = deque(maxlen=self.replay_window)
+        window.append(frame)
+
+    # t : instant de la mesure sur l'horloge du relais (t_src, à défaut l'arrivée)
+    def stamp_totals(self, frame, t):
+        power, cadence, _, revolutions = frame.values()[:4]
+        totals = self.odometer.update(frame.bike_id, t, power, revolutions, cadence)
+        frame.totals = totals + self.rides.observe(frame.bike_id, *totals)
+        frame.step = self.odometer.step(frame.bike_id)
+
+    # Point de reprise d'un écran : None s'il date d'un autre lancement du relais
+    # (un écran qui n'envoie pas relay_epoch est cru sur parole)
+    def resume_seq(self, last_seq, relay_epoch=None):
+        if last_seq is None or (relay_epoch is not None and relay_epoch != self.relay_epoch):
+            return None
+        return int(last_seq)
+
+    # Trames d'un vélo postérieures à last_seq, dans l'ordre ; None si l'écran
+    # a trop de retard (trames sorties de la fenêtre) ou si la séquence a
+    # recommencé (relais redémarré) : il repart alors d'un snapshot
+    def replay_since(self, bike_id, last_seq):
+        window = self.replay.get(bike_id)
+        current = self.relay_seq.get(bike_id, 0)
+        if window is None or last_seq > current or window[0].rseq > last_seq + 1:
+            return None
+        return [frame for frame in window if frame.rseq > last_seq]
+
+    # Trame en direct d'une passerelle : True si elle doit être rediffusée
+    def ingest(self, sid, frame):
+        if not self.accept_seq(frame.bike_id, self.epochs.get(sid, 0), frame.seq):
+            return False
+        self.stamp_arrival(frame, sid)
+        self.stamp_seq(frame)
+        self.stamp_totals(frame, frame.t_src if frame.t_src is not None else frame.t_in)
+        self.history.record(frame.bike_id, time.time(), frame.values())
+        if self.persistence is not None:
+            self.persistence.frame(frame)
+        if self.recorder is not None:
+            self.recorder.record_frame(frame.bike_id, frame.as_bytes())
+        if self.bus is not None:
+            self.bus.publish(encode_message(self.node_id, self.epochs.get(sid, 0), frame))
+        return True
+
+    # Lot rejoué depuis le spool : [[bike_id, époque, seq, t, trame binaire], ...]
+    # Renvoie (nombre accepté, dernière trame par vélo)
+    def ingest_batch(self, sid, records):
+        accepted = 0
+        latest = {}
+        epochs = {}
+        wall_to_monotonic = time.monotonic() - time.time()
+        for record in records:
+            try:
+                claimed, epoch, seq, t_wall, raw = record
+                epoch, seq, t_wall = int(epoch), int(seq), float(t_wall)
+                frame = Frame.from_bytes(self.sensor_bike(sid, claimed), raw)
+            except (ValueError, TypeError):
+                # Entrée illisible : elle seule est écartée, le reste du lot est accepté
+                # et acquitté (sinon la passerelle rejouerait le même spool sans fin)
+                continue
+            bike_id = frame.bike_id
+            if not self.accept_seq(bike_id, epoch, seq):
+                continue
+            self.stamp_seq(frame)
+            # Trame du spool : datée par t_wall, l'horloge murale de la passerelle,
+            # ramenée sur l'horloge monotone du relais. Le décalage entre les deux
+            # horloges est le même pour tout le lot : les écarts entre trames, qui
+            # servent à intégrer l'énergie et la distance de la coupure, sont justes
+            self.stamp_totals(frame, t_wall + wall_to_monotonic)
+            if self.persistence is not None:
+                self.persistence.frame(frame, t_wall)
+            latest[bike_id] = frame
+            epochs[bike_id] = epoch
+            accepted += 1
+        if self.bus is not None:
+            for bike_id, frame in latest.items():
+                self.bus.publish(encode_message(self.node_id, epochs[bike_id], frame, FLAG_REPLAY))
+        return accepted, latest
+
+    # Résultat de session : versé aux classements de tous les workers, et persisté
+    # si persist (une session terminée l'est déjà par end_session).
+    # Renvoie (enregistrement normalisé, {tableau: rangs modifiés}) ; ValueError si invalide
+    def submit_result(self, data, persist=True):
+        record = self.leaderboards.normalize(data)
+        updates = self.leaderboards.submit(record)
+        if self.bus is not None:
+            self.bus.publish(encode_event(self.node_id, "leaderboard", record))
+        if persist and self.persistence is not None:
+            self.persistence.result(record)
+        return record, updates
+
+    # Classements reconstruits au démarrage à partir des sessions persistées ;
+    # sans persistance qui sache les relire, ils ne durent que le temps du relais.
+    # Renvoie le nombre de résultats repris, None sans persistance relisible
+    def restore_leaderboards(self):
+        if self.persistence is None:
+            return None
+        try:
+            sessions = self.persistence.saved_sessions()
+            sessions = list(sessions) if sessions is not None else None
+        except Exception as e:
+            print(f"⚠️ Classements non reconstruits : {e}")
+            return None
+        if sessions is None:
+            return None
+        restored = 0
+        for doc in sessions:
+            try:
+                record = self.leaderboards.normalize({"id": doc["id"], "name": doc["name"], "energy": doc["energy"],
+                                                      "speed": doc["max_speed"], "t": doc["ended_at"]})
+            except (ValueError, TypeError, KeyError):
+                continue
+            self.leaderboards.submit(record)
+            restored += 1
+        return restored
+
+    # Début de session {bike_id, name} : ValueError si invalide ou vélo déjà pris
+    def start_session(self, data):
+        data = data or {}
+        bike_id = str(data.get("bike_id") or "default")
+        ride = self.rides.start(bike_id, data.get("name"), self.odometer.totals(bike_id))
+        if self.bus is not None:
+            self.bus.publish(encode_event(self.node_id, "session_start", ride.as_dict()))
+        return ride
+
+    # Fin de session {bike_id[, id]} : le résultat, déjà cumulé, part au classement
+    # si save. Renvoie (session terminée, {tableau: rangs modifiés})
+    def end_session(self, data, save=True):
+        data = data or {}
+        bike_id = str(data.get("bike_id") or "default")
+        ride = self.rides.stop(bike_id, data.get("id"))
+        if ride is None:
+            raise ValueError(f"aucune session en cours sur le vélo {bike_id}")
+        if self.bus is not None:
+            self.bus.publish(encode_event(self.node_id, "session_stop", ride.as_dict()))
+        if self.persistence is not None:
+            self.persistence.session(ride, save)
+        updates = {}
+        if save:
+            energy, _, max_speed = ride.values()
+            _, updates = self.submit_result({"id": ride.id, "name": ride.name, "energy": energy, "speed": max_speed},
+                                            persist=False)
+        return ride, updates
+
+    def receive_event(self, name, data):
+        # Événement d'un autre worker -> (type, données) à pousser aux écrans, ou None
+        if name == "leaderboard":
+            return "leaderboard", self.leaderboards.submit(self.leaderboards.normalize(data))
+        if name == "session_start":
+            ride = self.rides.start(data["bike_id"], data["name"], {
+                "total_energy": data["start_energy"], "total_distance": data["start_distance"]},
+                data["id"], data["started_at"])
+            return "session", (ride.bike_id, ride, None)
+        if name == "session_stop":
+            ride = self.rides.stop(data["bike_id"], data["id"])
+            if ride is not None:
+                # Résultat de référence : celui du worker qui a terminé la session
+                ride.energy, ride.distance, ride.max_speed = (data[field] for field in SESSION_FIELDS)
+                return "session", (ride.bike_id, None, ride)
+        return None
+
+    # Trames publiées par les autres workers, à rediffuser aux écrans locaux.
+    # Elles passent par la même déduplication : une passerelle qui se reconnecte
+    # sur un autre worker ne fait pas réapparaître ses trames déjà vues.
+    # Renvoie (trames, [(type, données)] des événements reçus : "leaderboard" ->
+    # rangs modifiés, "session" -> (bike_id, session en cours, session terminée))
+    def receive_bus(self):
+        frames = []
+        notices = []
+        for payload in self.bus.receive():
+            try:
+                node_id, flags, epoch, t_src, rseq, bike_id, raw = decode_message(payload)
+                if node_id == self.node_id:
+                    continue
+                if flags & FLAG_EVENT:
+                    notice = self.receive_event(bike_id, json.loads(raw))
+                    if notice is not None:
+                        notices.append(notice)
+                    continue
+                frame = Frame.from_bytes(bike_id, raw)
+            except (ValueError, TypeError, KeyError, AttributeError):
+                # Message illisible (trame tronquée, événement mal formé) : seul celui-ci est perdu
+                continue
+            if not self.accept_seq(bike_id, epoch, frame.seq):
+                continue
+            frame.t_src = t_src
+            frame.t_in = time.monotonic()
+            self.stamp_seq(frame, rseq)
+            self.stamp_totals(frame, t_src if t_src is not None else frame.t_in)
+            if not flags & FLAG_REPLAY:
+                self.history.record(bike_id, time.time(), frame.values())
+            frames.append(frame)
+        return frames, notices
+
+    def set_clock_offset(self, sid, data):
+        self.clock_offsets[sid] = float((data or {}).get("offset", 0))
+
+    def frame_ack(self, data):
+        # Accusé d'affichage envoyé par un écran pour une trame sur N,
+        # t_render déjà ramené sur l'horloge du relais
+        data = data or {}
+        t_render = data.get("t_render")
+        if t_render is None:
+            return
+        if data.get("t_out") is not None:
+            self.latency.observe("relay_to_dashboard", t_render - data["t_out"])
+        if data.get("t_src") is not None:
+            self.latency.observe("end_to_end", t_render - data["t_src"])
+
+    # /api/leaderboard/<board>?k= : renvoie (corps JSON, statut HTTP)
+    def leaderboard_query(self, board, k):
+        leaderboard = self.leaderboards.get(board)
+        if leaderboard is None:
+            return {"error": f"classement inconnu : {board}"}, 404
+        return {"board": board, "total": len(leaderboard), "top": leaderboard.top(max(1, min(k, 100)))}, 200
+
+    # /api/leaderboard/<board>/<participant_id> : rang d'un participant
+    def leaderboard_rank(self, board, participant_id):
+        leaderboard = self.leaderboards.get(board)
+        if leaderboard is None:
+            return {"error": f"classement inconnu : {board}"}, 404
+        entry = leaderboard.lookup(participant_id)
+        if entry is None:
+            return {"error": f"aucun score pour {participant_id}"}, 404
+        entry["board"] = board
+        entry["total"] = len(leaderboard)
+        return entry, 200
+
+    # Base SQLite de la persistance (PERSIST_URL=sqlite:///...), None sinon
+    def store(self):
+        sink = getattr(self.persistence, "sink", None)
+        return sink if isinstance(sink, SqliteStore) else None
+
+    # /api/sessions?participant=<nom> : renvoie (corps JSON, statut HTTP)
+    def sessions_query(self, participant, limit):
+        store = self.store()
+        if store is None:
+            return {"error": "pas de base locale (PERSIST_URL=sqlite:///...)"}, 404
+        if not participant:
+            return {"error": "participant manquant"}, 400
+        return {"participant": participant,
+                "sessions": store.participant_sessions(participant, max(1, min(limit, 500)))}, 200
+
+    # /api/sessions/best?metric=energy&day=AAAA-MM-JJ&k=10 (aujourd'hui par défaut)
+    def best_sessions_query(self, metric, day, k):
+        store = self.store()
+        if store is None:
+            return {"error": "pas de base locale (PERSIST_URL=sqlite:///...)"}, 404
+        try:
+            start, end = day_bounds(day)
+            sessions = store.best_sessions(metric, start, end, max(1, min(k, 100)))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return {"metric": metric, "day": day or time.strftime("%Y-%m-%d"), "sessions": sessions}, 200
+
+    # /api/totals?since=<s epoch>&until=<s epoch> : cumuls de l'événement
+    def totals_query(self, since, until):
+        store = self.store()
+        if store is None:
+            return {"error": "pas de base locale (PERSIST_URL=sqlite:///...)"}, 404
+        return store.totals(since, until), 200
+
+    # /api/history/<bike_id> : renvoie (corps JSON, statut HTTP)
+    def history_query(self, bike_id, seconds, points, metric):
+        if metric not in FIELDS:
+            return {"error": f"métrique inconnue : {metric}"}, 400
+        result = self.history.query(bike_id, time.time() - seconds, points, metric)
+        if result is None:
+            return {"error": f"aucune donnée pour le vélo {bike_id}"}, 404
+        result["bike_id"] = bike_id
+        return result, 200
@@ -0,0 +1,87 @@
+import time
+import uuid
+
+# Sessions de participants (mode circuit), tenues par le relais : une session
+# active au plus par vélo. Énergie, distance et vitesse max de la session sont
+# mises à jour à chaque trame, à partir des cumuls de odometer.py ; terminer une
+# session ne demande donc aucun calcul, et tous les écrans voient les mêmes
+# valeurs. Elles partent avec chaque trame (None hors session) :
+#   session_energy    : Wh depuis le début de la session
+#   session_distance  : m depuis le début de la session
+#   session_max_speed : km/h, record de la session
+SESSION_FIELDS = ("session_energy", "session_distance", "session_max_speed")
+NO_SESSION = (None, None, None)
+
+
+class Ride:
+    __slots__ = ("id", "bike_id", "name", "started_at", "start_energy", "start_distance",
+                 "energy", "distance", "max_speed")
+
+    def __init__(self, ride_id, bike_id, name, started_at, start_energy, start_distance):
+        self.id = ride_id
+        self.bike_id = bike_id
+        self.name = name
+        self.started_at = started_at
+        self.start_energy = start_energy
+        self.start_distance = start_distance
+        self.energy = 0.0
+        self.distance = 0.0
+        self.max_speed = 0.0
+
+    def values(self):
+        return round(self.energy, 4), round(self.distance, 2), round(self.max_speed, 2)
+
+    def as_dict(self):
+        data = {"id": self.id, "bike_id": self.bike_id, "name": self.name, "started_at": self.started_at,
+                "start_energy": self.start_energy, "start_distance": self.start_distance}
+        data.update(zip(SESSION_FIELDS, self.values()))
+        return data
+
+
+class Rides:
+    def __init__(self):
+        # bike_id -> Ride en cours
+        self.active = {}
+
+    def get(self, bike_id):
+        return self.active.get(bike_id)
+
+    # totals : cumuls actuels du vélo (Odometer.totals), None si aucune trame reçue.
+    # ValueError si le nom manque ou si le vélo a déjà une session en cours
+    def start(self, bike_id, name, totals, ride_id=None, started_at=None):
+        name = str(name or "").strip()[:40]
+        if not name:
+            raise ValueError("nom de participant manquant")
+        if bike_id in self.active:
+            raise ValueError(f"session déjà en cours sur le vélo {bike_id}")
+        totals = totals or {}
+        ride = Ride(ride_id or uuid.uuid4().hex[:12], bike_id, name, started_at or time.time(),
+                    totals.get("total_energy", 0.0), totals.get("total_distance", 0.0))
+        self.active[bike_id] = ride
+        return ride
+
+    # Trame du vélo : cumuls de la session mis à jour, valeurs de SESSION_FIELDS
+    def observe(self, bike_id, energy, distance, speed):
+        ride = self.active.get(bike_id)
+        if ride is None:
+            return NO_SESSION
+        ride.energy = max(energy - ride.start_energy, 0.0)
+        ride.distance = max(distance - ride.start_distance, 0.0)
+        if speed > ride.max_speed:
+            ride.max_speed = speed
+        return ride.values()
+
+    # Session terminée (ou abandonnée), None si le vélo n'en avait pas.
+    # ride_id : ne termine que cette session, pas une plus récente
+    def stop(self, bike_id, ride_id=None):
+        ride = self.active.get(bike_id)
+        if ride is None or (ride_id is not None and ride.id != ride_id):
+            return None
+        return self.active.pop(bike_id)
+
+
+# Événement "session_update" poussé aux écrans du vélo au début et à la fin
+# d'une session (ended : la session qui vient de se terminer)
+def session_message(bike_id, ride, ended=None):
+    return {"bike_id": bike_id, "session": ride.as_dict() if ride is not None else None,
+            "ended": ended.as_dict() if ended is not None else None}
@@ -1,18 +1,213 @@
+import atexit
+import functools
 import os
-from flask import Flask, send_from_directory
-from flask_socketio import SocketIO
+import time
+from eventlet.hubs import trampoline
+from flask import Flask, Response, jsonify, request
+from flask_socketio import SocketIO, join_room, leave_room
 
-app = Flask(__name__, static_folder="dist", static_url_path="")
+from backpressure import SendQueues, run_send_queues
+from broadcast import bike_rooms, binary_room, bike_room, delta_room, make_broadcaster
+from bus import make_bus, run_workers
+from leaderboard import LEADERBOARD_ROOM, Leaderboards
+from metrics import run_hub_lag_probe
+from persistence import make_persistence
+from relay import Relay
+from rides import session_message
+from session import SessionRecorder
+from static_assets import StaticAssets
+from wire import Frame
 
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet")
+# Fichiers statiques servis par static_assets.py (en mémoire, précompressés) :
+# pas de route statique Flask, qui masquerait serve_static
+app = Flask(__name__, static_folder=None)
+DIST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dist")
+
+# WORKERS=n : n processus relais sur le même port, reliés par le bus BUS_URL
+# (bus.py ; un bus UNIX local est créé si BUS_URL est vide). BUS_URL seul relie
+# des relais lancés séparément, par exemple sur plusieurs machines via Redis.
+WORKERS = int(os.environ.get("WORKERS", 1))
+WORKER_ID = os.environ.get("WORKER_ID")
+BUS_URL = os.environ.get("BUS_URL")
+# Processus parent qui ne fait que lancer les workers
+LAUNCHER = WORKERS > 1 and WORKER_ID is None
+
+# Avec plusieurs workers, les requêtes de long-polling d'un même client pourraient
+# arriver sur des processus différents : WebSocket uniquement
+transports = ["websocket"] if WORKERS > 1 else None
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet", transports=transports)
+
+# BROADCAST_MODE=immediate : une émission par trame reçue
+# BROADCAST_MODE=coalesce : dernière trame par vélo, envoyée BROADCAST_HZ fois par seconde
+BROADCAST_MODE = os.environ.get("BROADCAST_MODE", "immediate")
+BROADCAST_HZ = float(os.environ.get("BROADCAST_HZ", 10))
+# Flux différentiel (subscribe avec delta=true) : une trame complète toutes les KEYFRAME_EVERY trames
+KEYFRAME_EVERY = int(os.environ.get("KEYFRAME_EVERY", 50))
+
+# Journal des trames reçues : une sur LOG_EVERY (0 = aucune). Un print par
+# message est une écriture bloquante sur stdout qui retient le hub eventlet.
+LOG_EVERY = int(os.environ.get("LOG_EVERY", 0))
+
+# RECORD_PATH=fichier : enregistre toutes les trames acceptées (rejouables avec SessionReplay.py)
+RECORD_PATH = os.environ.get("RECORD_PATH")
+if RECORD_PATH and WORKER_ID is not None:
+    RECORD_PATH = f"{RECORD_PATH}.{WORKER_ID}"
+recorder = SessionRecorder(RECORD_PATH) if RECORD_PATH and not LAUNCHER else None
+if recorder is not None:
+    atexit.register(recorder.close)
+
+def run_recorder_flush():
+    while True:
+        socketio.sleep(recorder.flush_interval)
+        recorder.flush()
+
+# PERSIST_URL=cosmos://... ou file:///... : trames et sessions écrites en lots
+# par un thread dédié (persistence.py), sans retenir les handlers
+PERSIST_URL = os.environ.get("PERSIST_URL")
+persistence = make_persistence(PERSIST_URL, WORKER_ID) if PERSIST_URL and not LAUNCHER else None
+if persistence is not None:
+    atexit.register(persistence.close)
+
+bus = make_bus(BUS_URL, int(WORKER_ID or 0), WORKERS) if BUS_URL and not LAUNCHER else None
+# Historique par vélo : HISTORY_CAPACITY points max (36000 = 1 h à 10 Hz),
+# pour HISTORY_MAX_BIKES vélos au plus
+# Reprise des écrans reconnectés : REPLAY_WINDOW dernières trames par vélo
+# Classements : les LEADERBOARD_SIZE premiers sont poussés aux écrans abonnés
+relay = Relay(int(os.environ.get("HISTORY_CAPACITY", 36000)), LOG_EVERY, recorder, bus,
+              int(os.environ.get("REPLAY_WINDOW", 600)),
+              leaderboards=Leaderboards(int(os.environ.get("LEADERBOARD_SIZE", 10))), persistence=persistence,
+              history_bikes=int(os.environ.get("HISTORY_MAX_BIKES", 64)),
+              relay_epoch=int(os.environ.get("RELAY_EPOCH", 0)) or None)
+# Classements repris des sessions persistées (PERSIST_URL), vides sinon
+restored = relay.restore_leaderboards()
+if restored is not None:
+    print(f"🏆 Classements reconstruits : {restored} résultats")
+# Écran lent : au-delà de SEND_QUEUE_MAX paquets en attente, ses trames sont
+# retenues (la plus récente par vélo) ; déconnecté après SLOW_CLIENT_TIMEOUT s
+queues = SendQueues(socketio.server, int(os.environ.get("SEND_QUEUE_MAX", 32)),
+                    float(os.environ.get("SLOW_CLIENT_TIMEOUT", 15)))
+broadcaster = make_broadcaster(socketio, BROADCAST_MODE, BROADCAST_HZ, relay.latency, KEYFRAME_EVERY, queues,
+                               relay_epoch=relay.relay_epoch)
+relay.register_metrics(socketio.server, broadcaster, queues)
+
+def push_leaderboard(updates):
+    # Seuls les rangs modifiés partent, vers les écrans abonnés aux classements
+    for event, payload in relay.leaderboards.messages(updates):
+        socketio.emit(event, payload, to=LEADERBOARD_ROOM)
+
+def push_session(bike_id, ride, ended=None):
+    # Début ou fin de session : tous les écrans du vélo, quel que soit leur format
+    socketio.emit("session_update", session_message(bike_id, ride, ended), to=bike_rooms(bike_id))
+
+def run_bus_listener():
+    # Trames des autres workers : rediffusées aux écrans connectés à ce processus
+    while True:
+        trampoline(bus.fileno(), read=True)
+        try:
+            frames, notices = relay.receive_bus()
+        except ConnectionError as e:
+            print(f"⚠️ Bus interrompu : {e}")
+            return
+        except Exception as e:
+            # Erreur inattendue sur un lot : on le perd, pas l'écoute du bus
+            print(f"⚠️ Messages du bus ignorés : {e!r}")
+            continue
+        for frame in frames:
+            broadcaster.push(frame.bike_id, frame)
+        for kind, data in notices:
+            if kind == "leaderboard":
+                push_leaderboard(data)
+            else:
+                push_session(*data)
+
+def on_event(event):
+    # socketio.on + comptage des messages et durée du handler
+    def decorator(handler):
+        @functools.wraps(handler)
+        def instrumented(*args):
+            relay.messages_in.inc(event)
+            start = time.perf_counter()
+            try:
+                return handler(*args)
+            finally:
+                relay.handler_seconds.observe(event, value=time.perf_counter() - start)
+        return socketio.on(event)(instrumented)
+    return decorator
+
+static_assets = StaticAssets(DIST) if not LAUNCHER else None
+
+def send_asset(path):
+    result = static_assets.respond(path, request.headers.get("Accept-Encoding"),
+                                   request.headers.get("If-None-Match"))
+    if result is None:
+        return jsonify({"error": "introuvable"}), 404
+    status, headers, body = result
+    return Response(body, status, headers)
 
 @app.route("/")
 def index():
-    return send_from_directory("dist", "index.html")
+    return send_asset("index.html")
+
+@app.after_request
+def allow_cors_on_api(response):
+    # Les écrans peuvent être servis depuis un autre domaine que le relais
+    if request.path.startswith("/api/"):
+        response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+@app.route("/api/broadcast")
+def broadcast_stats():
+    return jsonify(broadcaster.stats())
+
+@app.route("/metrics")
+def metrics():
+    return Response(relay.registry.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/latency")
+def latency_stats():
+    # Percentiles en millisecondes par tronçon
+    return jsonify(relay.latency.summary())
+
+@app.route("/api/history/<bike_id>")
+def bike_history(bike_id):
+    # ?seconds=<fenêtre>&points=<nombre max de points>&metric=<courbe pilotant le sous-échantillonnage>
+    seconds = request.args.get("seconds", 300, type=float)
+    points = request.args.get("points", 300, type=int)
+    metric = request.args.get("metric", "power")
+    result, status = relay.history_query(bike_id, seconds, points, metric)
+    return jsonify(result), status
+
+@app.route("/api/leaderboard/<board>")
+def leaderboard_top(board):
+    result, status = relay.leaderboard_query(board, request.args.get("k", 10, type=int))
+    return jsonify(result), status
+
+@app.route("/api/leaderboard/<board>/<participant_id>")
+def leaderboard_rank(board, participant_id):
+    result, status = relay.leaderboard_rank(board, participant_id)
+    return jsonify(result), status
+
+@app.route("/api/sessions")
+def participant_sessions():
+    # Base SQLite uniquement (PERSIST_URL=sqlite:///...)
+    result, status = relay.sessions_query(request.args.get("participant"), request.args.get("limit", 50, type=int))
+    return jsonify(result), status
+
+@app.route("/api/sessions/best")
+def best_sessions():
+    result, status = relay.best_sessions_query(request.args.get("metric", "energy"), request.args.get("day"),
+                                               request.args.get("k", 10, type=int))
+    return jsonify(result), status
+
+@app.route("/api/totals")
+def event_totals():
+    result, status = relay.totals_query(request.args.get("since", 0.0, type=float),
+                                        request.args.get("until", None, type=float))
+    return jsonify(result), status
 
 @app.route("/<path:path>")
 def serve_static(path):
-    return send_from_directory("dist", path)
+    return send_asset(path)
 
 @socketio.on("connect")
 def handle_connect():
@@ -20,15 +215,150 @@ def handle_connect():
 
 @socketio.on("disconnect")
 def handle_disconnect():
-    print("❌ Un client WebSocket s'est déconnecté")
+    queues.forget(request.sid)
+    bikes = relay.forget(request.sid)
+    if bikes is not None:
+        print(f"❌ Capteur des vélos {', '.join(bikes)} déconnecté")
+    else:
+        print("❌ Un client WebSocket s'est déconnecté")
+
+@on_event("register_sensor")
+def handle_register_sensor(data):
+    bikes = relay.register_sensor(request.sid, data)
+    print(f"🚲 Capteur enregistré pour les vélos {', '.join(bikes)}")
+
+@on_event("subscribe")
+def handle_subscribe(data):
+    # Un écran ne reçoit que les vélos qu'il affiche.
+    # binary=true : trames "metrics_frame" (bike_id, octets) au lieu du JSON
+    # delta=true : "metrics_delta", seulement les champs modifiés (broadcast.FrameState)
+    # Le dernier état connu de chaque vélo est envoyé tout de suite.
+    # last_seq={bike_id: rseq} : reprise après coupure, les trames manquées
+    # arrivent en un lot "metrics_replay" (ou un snapshot si trop de retard) ;
+    # ignoré si relay_epoch n'est pas celui de ce lancement du relais
+    data = data or {}
+    kind = "binary" if data.get("binary") else "delta" if data.get("delta") else "json"
+    room = {"binary": binary_room, "delta": delta_room, "json": bike_room}[kind]
+    last_seq = data.get("last_seq") or {}
+    for bike_id in data.get("bikes", []):
+        bike_id = str(bike_id)
+        last = relay.resume_seq(last_seq.get(bike_id), data.get("relay_epoch"))
+        join_room(room(bike_id))
+        for event, payload in broadcaster.state.subscribe_messages(
+                bike_id, kind, last, relay.replay_since(bike_id, last) if last is not None else None):
+            socketio.emit(event, payload, to=request.sid)
+        socketio.emit("session_update", session_message(bike_id, relay.rides.get(bike_id)), to=request.sid)
+
+@on_event("unsubscribe")
+def handle_unsubscribe(data):
+    for bike_id in (data or {}).get("bikes", []):
+        leave_room(bike_room(bike_id))
+        leave_room(binary_room(bike_id))
+        leave_room(delta_room(bike_id))
 
-@socketio.on("metrics_update")
+@on_event("leaderboard_subscribe")
+def handle_leaderboard_subscribe(data=None):
+    # Classements complets en réponse, puis seulement les rangs modifiés ("leaderboard_update")
+    join_room(LEADERBOARD_ROOM)
+    return relay.leaderboards.snapshot()
+
+@on_event("leaderboard_submit")
+def handle_leaderboard_submit(data):
+    # Résultat de session {name, speed, energy[, id]} -> {id, ranks: {tableau: rang}}
+    try:
+        record, updates = relay.submit_result(data)
+    except (ValueError, TypeError) as e:
+        return {"error": str(e)}
+    push_leaderboard(updates)
+    print(f"🏆 Résultat enregistré pour {record['name']}")
+    return {"id": record["id"], "ranks": relay.leaderboards.ranks(record["id"])}
+
+@on_event("session_start")
+def handle_session_start(data):
+    # {bike_id, name} -> {session} ; énergie, distance et vitesse max de la
+    # session arrivent ensuite avec chaque trame (rides.SESSION_FIELDS)
+    try:
+        ride = relay.start_session(data)
+    except (ValueError, TypeError) as e:
+        return {"error": str(e)}
+    push_session(ride.bike_id, ride)
+    print(f"🏁 Session de {ride.name} démarrée sur le vélo {ride.bike_id}")
+    return {"session": ride.as_dict()}
+
+@on_event("session_end")
+def handle_session_end(data):
+    # {bike_id[, id][, save]} -> {session, ranks} ; save=false abandonne la session sans classement
+    save = (data or {}).get("save", True)
+    try:
+        ride, updates = relay.end_session(data, save)
+    except (ValueError, TypeError) as e:
+        return {"error": str(e)}
+    push_session(ride.bike_id, None, ride)
+    push_leaderboard(updates)
+    print(f"🏆 Session de {ride.name} terminée")
+    return {"session": ride.as_dict(), "ranks": relay.leaderboards.ranks(ride.id) if save else None}
+
+@on_event("metrics_update")
 def handle_metrics_update(data):
-    print("📡 Données reçues du capteur :", data)
-    # Rediffuser à tous les clients connectés
-    socketio.emit("metrics_update", data)
+    relay.log_frame(data)
+    bike_id = relay.sensor_bike(request.sid, data.get("bike_id"))
+    frame = Frame.from_json(bike_id, data)
+    if not relay.ingest(request.sid, frame):
+        return
+    # Rediffuser aux abonnés du vélo, sans renvoyer la trame à l'émetteur
+    broadcaster.push(bike_id, frame, skip_sid=request.sid)
+
+@on_event("metrics_frame")
+def handle_metrics_frame(*args):
+    # Trame binaire (voir wire.py) : décodée en tuple, jamais en dict.
+    # Arguments : (octets) ou (bike_id, octets) pour une passerelle multi-vélos
+    payload = args[-1]
+    bike_id = relay.sensor_bike(request.sid, args[0] if len(args) > 1 else None)
+    try:
+        frame = Frame.from_bytes(bike_id, payload)
+    except (ValueError, TypeError) as e:
+        print(f"⚠️ Trame binaire rejetée ({bike_id}) : {e}")
+        return
+    if not relay.ingest(request.sid, frame):
+        return
+    broadcaster.push(bike_id, frame, skip_sid=request.sid)
+
+@on_event("clock_ping")
+def handle_clock_ping(data):
+    # Pong immédiat : le client en déduit son décalage avec l'horloge du relais
+    return {"t": time.monotonic()}
+
+@on_event("clock_offset")
+def handle_clock_offset(data):
+    relay.set_clock_offset(request.sid, data)
+
+@on_event("frame_ack")
+def handle_frame_ack(data):
+    relay.frame_ack(data)
+
+@on_event("metrics_batch")
+def handle_metrics_batch(payload):
+    # Lot rejoué depuis le spool d'une passerelle :
+    # [[bike_id, époque, seq, t, trame binaire], ...]
+    accepted, latest = relay.ingest_batch(request.sid, (payload or {}).get("frames", []))
+    # Les trames rejouées sont plus anciennes que l'historique : seule la plus récente
+    # de chaque vélo est rediffusée, pour que les compteurs cumulés des écrans rattrapent
+    for bike_id, frame in latest.items():
+        broadcaster.push(bike_id, frame, skip_sid=request.sid)
+    print(f"📦 Lot rejoué : {accepted} trames acceptées")
+    return {"accepted": accepted}
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 80))
+    if LAUNCHER:
+        print(f"🚀 Démarrage de {WORKERS} workers sur http://0.0.0.0:{port}")
+        run_workers(os.path.abspath(__file__), WORKERS)
+        raise SystemExit(0)
     print(f"🚀 Démarrage du serveur WebSocket sur http://0.0.0.0:{port}")
+    socketio.start_background_task(run_hub_lag_probe, socketio.sleep, relay.hub_lag, relay.hub_lag_seconds)
+    socketio.start_background_task(run_send_queues, socketio.server, queues, socketio.sleep)
+    if recorder is not None:
+        socketio.start_background_task(run_recorder_flush)
+    if bus is not None:
+        socketio.start_background_task(run_bus_listener)
     socketio.run(app, host="0.0.0.0", port=port, debug=True, use_reloader=False)
@@ -0,0 +1,76 @@
+import struct
+import time
+
+# Enregistrement d'une session (passerelle ou relais) pour la rejouer sans matériel.
+# Fichier en ajout seul :
+#   en-tête : "MBSESS1\n" (8 octets), début de la session (f64, secondes epoch)
+#   entrée : instant depuis le début (f64, s), type (u8), longueur du bike_id (u8),
+#            longueur des données (u16), bike_id (utf-8), données
+MAGIC = b"MBSESS1\n"
+_HEADER = struct.Struct("<8sd")
+_RECORD = struct.Struct("<dBBH")
+
+KIND_RAW = 0    # notification BLE 0x2A63 telle que reçue
+KIND_FRAME = 1  # trame dérivée, format binaire de wire.py
+
+
+class SessionRecorder:
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.start = time.monotonic()
+        self.last_flush = self.start
+        self.records = 0
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, time.time()))
+
+    def _write(self, kind, bike_id, data):
+        # Écriture tamponnée, sans fsync : coût négligeable dans un callback.
+        # Vidage du tampon au plus toutes les flush_interval secondes : un arrêt
+        # brutal ne perd que la dernière seconde.
+        now = time.monotonic()
+        bike = bike_id.encode()
+        self._file.write(_RECORD.pack(now - self.start, kind, len(bike), len(data)))
+        self._file.write(bike)
+        self._file.write(data)
+        self.records += 1
+        if now - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    # À appeler aussi périodiquement quand les trames s'arrêtent
+    def flush(self):
+        self._file.flush()
+        self.last_flush = time.monotonic()
+
+    def record_raw(self, bike_id, data):
+        self._write(KIND_RAW, bike_id, bytes(data))
+
+    def record_frame(self, bike_id, frame):
+        self._write(KIND_FRAME, bike_id, frame)
+
+    def close(self):
+        self._file.close()
+
+
+# Renvoie (début epoch, [(instant, type, bike_id, données), ...]) ;
+# une entrée tronquée en fin de fichier (arrêt brutal) est ignorée
+def read_session(path):
+    with open(path, "rb") as f:
+        data = memoryview(f.read())
+    if len(data) < _HEADER.size:
+        raise ValueError(f"session vide ou tronquée : {path}")
+    magic, started = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"pas un fichier de session : {path}")
+    records = []
+    offset = _HEADER.size
+    while offset + _RECORD.size <= len(data):
+        t, kind, bike_len, length = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        end = offset + bike_len + length
+        if end > len(data):
+            break
+        bike_id = str(data[offset:offset + bike_len], "utf-8")
+        records.append((t, kind, bike_id, bytes(data[offset + bike_len:end])))
+        offset = end
+    return started, records
@@ -0,0 +1,172 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Fichiers du build Vite (dist/) chargés une fois au démarrage et gardés en
+# mémoire, avec leurs variantes gzip et brotli précalculées (ou reprises telles
+# quelles si le build a déjà produit des fichiers .gz / .br).
+# Les fichiers nommés d'après leur contenu (assets/chart.js-f60133a4.js) ne
+# changent jamais : cache « immutable » d'un an. index.html et les autres sont
+# revalidés à chaque chargement (ETag -> 304 si inchangé).
+# Ces fichiers sont ceux du manifeste du build (build.manifest dans
+# vite.config.js) ; à défaut, ceux dont le nom se termine par un hash Vite
+# (8 caractères hexadécimaux) : logo-michelin.svg n'en est pas un.
+MANIFEST = ".vite/manifest.json"
+HASHED = re.compile(r"(^|/)assets/.+-[0-9a-f]{8}\.\w+$")
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "application/xml",
+                "image/svg+xml", "application/manifest+json", "application/wasm")
+MIN_COMPRESS = 256
+
+# Préférence du serveur quand le client accepte plusieurs encodages
+ENCODINGS = ("br", "gzip")
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+class Asset:
+    __slots__ = ("content_type", "etag", "cache_control", "variants")
+
+    def __init__(self, content_type, etag, cache_control, variants):
+        self.content_type = content_type
+        self.etag = etag
+        self.cache_control = cache_control
+        # encodage (None = brut) -> corps
+        self.variants = variants
+
+
+def _compress(encoding, data):
+    if encoding == "gzip":
+        # mtime=0 : même contenu compressé d'un démarrage à l'autre
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+
+def _accepted_encodings(header):
+    # "gzip, deflate, br;q=0.8" -> {"gzip", "deflate", "br"} (q=0 exclut l'encodage)
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name)
+    return accepted
+
+
+class StaticAssets:
+    def __init__(self, root, index="index.html"):
+        self.root = root
+        self.index = index
+        self.assets = {}
+        self.load()
+
+    def load(self):
+        assets = {}
+        if os.path.isdir(self.root):
+            hashed = self._manifest_files()
+            for directory, _, files in os.walk(self.root):
+                for name in files:
+                    if name.endswith((".gz", ".br")):
+                        continue
+                    full = os.path.join(directory, name)
+                    path = os.path.relpath(full, self.root).replace(os.sep, "/")
+                    if path == MANIFEST:
+                        continue
+                    immutable = path in hashed if hashed is not None else bool(HASHED.search(path))
+                    assets[path] = self._load_asset(path, full, immutable)
+        self.assets = assets
+        raw = sum(len(a.variants[None]) for a in assets.values())
+        compressed = sum(min(len(v) for v in a.variants.values()) for a in assets.values())
+        print(f"📦 {len(assets)} fichiers statiques en mémoire ({raw // 1024} Ko, {compressed // 1024} Ko compressés)")
+
+    # Fichiers produits par le bundler d'après le manifeste, None sans manifeste
+    def _manifest_files(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        files = set()
+        for chunk in manifest.values():
+            files.add(chunk["file"])
+            files.update(chunk.get("css", ()))
+            files.update(chunk.get("assets", ()))
+        return files
+
+    def _load_asset(self, path, full, immutable):
+        with open(full, "rb") as f:
+            data = f.read()
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=utf-8"
+        variants = {None: data}
+        if content_type.startswith(COMPRESSIBLE) and len(data) >= MIN_COMPRESS:
+            for encoding in ENCODINGS:
+                precompressed = full + SUFFIXES[encoding]
+                if os.path.exists(precompressed):
+                    with open(precompressed, "rb") as f:
+                        body = f.read()
+                else:
+                    body = _compress(encoding, data)
+                if body is not None and len(body) < len(data):
+                    variants[encoding] = body
+        etag = hashlib.sha256(data).hexdigest()[:20]
+        cache_control = CACHE_IMMUTABLE if immutable else CACHE_REVALIDATE
+        return Asset(content_type, etag, cache_control, variants)
+
+    def get(self, path):
+        path = path.lstrip("/") or self.index
+        return self.assets.get(path)
+
+    # -> (statut, [(en-tête, valeur)], corps), None si le fichier n'existe pas
+    def respond(self, path, accept_encoding=None, if_none_match=None):
+        asset = self.get(path)
+        if asset is None:
+            return None
+        accepted = _accepted_encodings(accept_encoding)
+        encoding = next((e for e in ENCODINGS if e in asset.variants and e in accepted), None)
+        # ETag fort distinct par encodage : les octets envoyés diffèrent
+        etag = f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"'
+        headers = [("ETag", etag), ("Cache-Control", asset.cache_control)]
+        if len(asset.variants) > 1:
+            headers.append(("Vary", "Accept-Encoding"))
+        if if_none_match and _etag_matches(if_none_match, asset.etag):
+            return 304, headers, b""
+        body = asset.variants[encoding]
+        headers.append(("Content-Type", asset.content_type))
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        headers.append(("Content-Length", str(len(body))))
+        return 200, headers, body
+
+
+def _etag_matches(header, etag):
+    # If-None-Match : "*" ou liste d'ETags ; toute variante du même contenu convient
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"').split("-")[0] == etag:
+            return True
+    return False
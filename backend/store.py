@@ -0,0 +1,240 @@
+import datetime
+import sqlite3
+import time
+
+from odometer import STEP_FIELDS
+from persistence import FRAME_COLUMNS
+
+# Base locale SQLite (mode WAL) pour un boîtier seul sur le lieu de l'événement,
+# sans dépendance au cloud. Puits de persistence.WriteBehind : chaque lot est
+# écrit dans une seule transaction (executemany), et les requêtes des routes
+# HTTP lisent en parallèle sur leur propre connexion (WAL : les lectures ne
+# bloquent pas l'écriture). Les trames ne sont pas gardées une à une : elles
+# sont agrégées par vélo et par seconde (rollups).
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS participants (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    first_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    participant_id INTEGER NOT NULL REFERENCES participants(id),
+    bike_id TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    energy REAL NOT NULL,
+    distance REAL NOT NULL,
+    max_speed REAL NOT NULL,
+    saved INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_participant ON sessions(participant_id, started_at);
+CREATE INDEX IF NOT EXISTS sessions_bike ON sessions(bike_id, started_at);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions(started_at);
+CREATE TABLE IF NOT EXISTS rollups (
+    bike_id TEXT NOT NULL,
+    second INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    power_sum REAL NOT NULL,
+    power_max REAL NOT NULL,
+    cadence_sum REAL NOT NULL,
+    energy REAL NOT NULL,
+    distance REAL NOT NULL,
+    speed_max REAL NOT NULL,
+    PRIMARY KEY (bike_id, second)
+) WITHOUT ROWID;
+-- Index couvrant : les cumuls sur une plage se lisent sans toucher la table
+CREATE INDEX IF NOT EXISTS rollups_second ON rollups(second, bike_id, energy, distance);
+-- Cumuls par vélo et par heure : les totaux de l'événement ne parcourent les
+-- rollups que pour les heures entamées aux bornes de la plage
+CREATE TABLE IF NOT EXISTS hourly (
+    bike_id TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    energy REAL NOT NULL,
+    distance REAL NOT NULL,
+    first INTEGER NOT NULL,
+    last INTEGER NOT NULL,
+    PRIMARY KEY (bike_id, hour)
+) WITHOUT ROWID;
+"""
+
+# Une seconde déjà écrite (lot à cheval sur deux flushs) est complétée, pas remplacée
+UPSERT_ROLLUP = """
+INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (bike_id, second) DO UPDATE SET
+    frames = frames + excluded.frames,
+    power_sum = power_sum + excluded.power_sum,
+    power_max = max(power_max, excluded.power_max),
+    cadence_sum = cadence_sum + excluded.cadence_sum,
+    energy = energy + excluded.energy,
+    distance = distance + excluded.distance,
+    speed_max = max(speed_max, excluded.speed_max)
+"""
+
+UPSERT_HOURLY = """
+INSERT INTO hourly VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (bike_id, hour) DO UPDATE SET
+    energy = energy + excluded.energy,
+    distance = distance + excluded.distance,
+    first = min(first, excluded.first),
+    last = max(last, excluded.last)
+"""
+HOUR = 3600
+
+SESSION_METRICS = ("energy", "distance", "max_speed")
+SESSION_COLUMNS = "s.id, p.name, s.bike_id, s.started_at, s.ended_at, s.energy, s.distance, s.max_speed, s.saved"
+
+
+def _connect(path):
+    db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    # WAL : synchronous=NORMAL reste cohérent après une coupure (seules les
+    # dernières transactions peuvent manquer)
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+def _session_dict(row):
+    return {"id": row[0], "name": row[1], "bike_id": row[2], "started_at": row[3], "ended_at": row[4],
+            "energy": row[5], "distance": row[6], "max_speed": row[7], "saved": bool(row[8])}
+
+
+def day_bounds(day=None):
+    # "AAAA-MM-JJ" (aujourd'hui par défaut, heure locale) -> (début, fin) en s epoch
+    date = datetime.date.fromisoformat(day) if day else datetime.date.today()
+    start = datetime.datetime.combine(date, datetime.time())
+    return start.timestamp(), (start + datetime.timedelta(days=1)).timestamp()
+
+
+def _hourly(rollups):
+    hours = {}
+    for bike_id, second, _, _, _, _, energy, distance, _ in rollups:
+        key = (bike_id, second - second % HOUR)
+        agg = hours.get(key)
+        if agg is None:
+            hours[key] = [energy, distance, second, second]
+        else:
+            agg[0] += energy
+            agg[1] += distance
+            agg[2] = min(agg[2], second)
+            agg[3] = max(agg[3], second)
+    return [(bike_id, hour, *agg) for (bike_id, hour), agg in hours.items()]
+
+
+class SqliteStore:
+    def __init__(self, path):
+        self.path = path
+        # Connexion d'écriture, utilisée par le seul thread de WriteBehind
+        self._db = _connect(path)
+        self._db.executescript(SCHEMA)
+        # Connexion de lecture, pour les routes HTTP
+        self._reader = _connect(path)
+
+    def write(self, docs):
+        sessions = [doc for doc in docs if doc["type"] == "session"]
+        rollups = []
+        for doc in docs:
+            if doc["type"] == "frames":
+                rollups.extend(self._rollups(doc))
+        with self._db:
+            for doc in sessions:
+                participant_id = self._participant(doc["name"], doc["started_at"])
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (doc["id"], participant_id, doc["bike_id"], doc["started_at"], doc["ended_at"],
+                     doc["energy"], doc["distance"], doc["max_speed"], int(doc.get("saved", True))))
+            self._db.executemany(UPSERT_ROLLUP, rollups)
+            self._db.executemany(UPSERT_HOURLY, _hourly(rollups))
+
+    def _participant(self, name, t):
+        self._db.execute("INSERT OR IGNORE INTO participants (name, first_seen) VALUES (?, ?)", (name, t))
+        return self._db.execute("SELECT id FROM participants WHERE name = ?", (name,)).fetchone()[0]
+
+    def _rollups(self, doc):
+        # Trames d'un vélo -> une ligne par seconde. L'énergie et la distance de
+        # la seconde sont la somme des apports de ses trames (odometer.STEP_FIELDS),
+        # calculés par le relais qui a reçu chaque trame : rien ne dépend de
+        # l'état de ce processus, quel que soit le worker ou le nombre d'essais
+        columns = doc.get("fields") or FRAME_COLUMNS
+        index = {name: columns.index(name) for name in ("t", "power", "cadence", "speed") + STEP_FIELDS}
+        bike_id = doc["bike_id"]
+        seconds = {}
+        for row in doc["frames"]:
+            d_energy = row[index["step_energy"]] or 0.0
+            d_distance = row[index["step_distance"]] or 0.0
+            second = int(row[index["t"]])
+            power = row[index["power"]] or 0
+            cadence = row[index["cadence"]] or 0
+            speed = row[index["speed"]] or 0
+            agg = seconds.get(second)
+            if agg is None:
+                seconds[second] = [1, power, power, cadence, d_energy, d_distance, speed]
+            else:
+                agg[0] += 1
+                agg[1] += power
+                agg[2] = max(agg[2], power)
+                agg[3] += cadence
+                agg[4] += d_energy
+                agg[5] += d_distance
+                agg[6] = max(agg[6], speed)
+        return [(bike_id, second, *agg) for second, agg in seconds.items()]
+
+    # Sessions d'un participant (nom, sans tenir compte de la casse), plus récentes d'abord
+    def participant_sessions(self, name, limit=50):
+        rows = self._reader.execute(
+            f"SELECT {SESSION_COLUMNS} FROM sessions s JOIN participants p ON p.id = s.participant_id "
+            "WHERE p.name = ? ORDER BY s.started_at DESC LIMIT ?", (name, limit)).fetchall()
+        return [_session_dict(row) for row in rows]
+
+    # Toutes les sessions enregistrées au classement (reconstruction au démarrage)
+    def saved_sessions(self):
+        rows = self._reader.execute(
+            f"SELECT {SESSION_COLUMNS} FROM sessions s JOIN participants p ON p.id = s.participant_id WHERE s.saved")
+        return [_session_dict(row) for row in rows]
+
+    # Meilleures sessions enregistrées au classement entre start et end
+    def best_sessions(self, metric, start, end, k=10):
+        if metric not in SESSION_METRICS:
+            raise ValueError(f"métrique inconnue : {metric}")
+        rows = self._reader.execute(
+            f"SELECT {SESSION_COLUMNS} FROM sessions s JOIN participants p ON p.id = s.participant_id "
+            f"WHERE s.started_at >= ? AND s.started_at < ? AND s.saved ORDER BY s.{metric} DESC LIMIT ?",
+            (start, end, k)).fetchall()
+        return [_session_dict(row) for row in rows]
+
+    # Cumuls de l'événement entre start et end (s epoch), tous vélos confondus :
+    # heures pleines depuis hourly, secondes des heures entamées depuis rollups
+    def totals(self, start=0.0, end=None):
+        start = int(start)
+        end = int(end) if end is not None else int(time.time()) + 1
+        full_start = -(-start // HOUR) * HOUR
+        full_end = end // HOUR * HOUR
+        if full_start >= full_end:
+            parts = [("rollups", "second", start, end)]
+        else:
+            parts = [("rollups", "second", start, full_start), ("hourly", "hour", full_start, full_end),
+                     ("rollups", "second", full_end, end)]
+        energy = distance = 0.0
+        bikes = set()
+        first = last = None
+        for table, column, low, high in parts:
+            if low >= high:
+                continue
+            bounds = "min(first), max(last)" if table == "hourly" else "min(second), max(second)"
+            for bike_id, e, d, lo, hi in self._reader.execute(
+                    f"SELECT bike_id, total(energy), total(distance), {bounds} FROM {table} "
+                    f"WHERE {column} >= ? AND {column} < ? GROUP BY bike_id", (low, high)):
+                energy += e
+                distance += d
+                bikes.add(bike_id)
+                first = lo if first is None else min(first, lo)
+                last = hi if last is None else max(last, hi)
+        sessions, participants = self._reader.execute(
+            "SELECT count(*), count(DISTINCT participant_id) FROM sessions "
+            "WHERE started_at >= ? AND started_at < ? AND saved", (start, end)).fetchone()
+        return {"energy": round(energy, 4), "distance": round(distance, 2), "bikes": len(bikes),
+                "sessions": sessions, "participants": participants, "first": first, "last": last}
+
+    def close(self):
+        self._db.close()
+        self._reader.close()
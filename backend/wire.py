@@ -0,0 +1,133 @@
+import struct
+
+# Format binaire des trames "metrics_update".
+# Le premier octet est l'identifiant de schéma : on peut faire évoluer la
+# disposition sans casser les anciens relais/clients.
+FIELDS = ("power", "cadence", "distance", "revolutions", "grade", "target_power", "power_recharge")
+
+SCHEMA_V1 = 1
+# schéma (u8), puissance, cadence (f32), distance (f64), révolutions (u32),
+# pente, puissance cible, recharge (f32) -> 33 octets
+_V1 = struct.Struct("<BffdIfff")
+
+SCHEMA_V2 = 2
+# v1 précédé d'un numéro de séquence (u32) pour la déduplication -> 37 octets
+_V2 = struct.Struct("<BIffdIfff")
+
+SCHEMA_V3 = 3
+# v2 + instant de réception BLE sur l'horloge monotone de la passerelle (f64),
+# pour mesurer la latence de bout en bout -> 45 octets
+_V3 = struct.Struct("<BIdffdIfff")
+
+
+def encode(values, seq=None, t_gw=None):
+    power, cadence, distance, revolutions, grade, target_power, power_recharge = values
+    revolutions = int(revolutions) & 0xFFFFFFFF
+    if t_gw is not None:
+        return _V3.pack(SCHEMA_V3, (seq or 0) & 0xFFFFFFFF, t_gw, power, cadence, distance,
+                        revolutions, grade, target_power, power_recharge)
+    if seq is None:
+        return _V1.pack(SCHEMA_V1, power, cadence, distance, revolutions,
+                        grade, target_power, power_recharge)
+    return _V2.pack(SCHEMA_V2, seq & 0xFFFFFFFF, power, cadence, distance, revolutions,
+                    grade, target_power, power_recharge)
+
+
+def _unpack(layout, buf):
+    # Trame tronquée : ValueError comme toute trame invalide (struct.error n'en est pas une)
+    if len(buf) < layout.size:
+        raise ValueError(f"trame tronquée : {len(buf)} octets, {layout.size} attendus")
+    return layout.unpack_from(buf)
+
+
+def unpack(buf):
+    # Renvoie (seq, t_gw, valeurs dans l'ordre de FIELDS) sans construire de dict.
+    # seq et t_gw valent None quand le schéma ne les porte pas.
+    if not buf:
+        raise ValueError("trame vide")
+    schema = buf[0]
+    if schema == SCHEMA_V1:
+        return None, None, _unpack(_V1, buf)[1:]
+    if schema == SCHEMA_V2:
+        fields = _unpack(_V2, buf)
+        return fields[1], None, fields[2:]
+    if schema == SCHEMA_V3:
+        fields = _unpack(_V3, buf)
+        return fields[1], fields[2], fields[3:]
+    raise ValueError(f"schéma de trame inconnu : {schema}")
+
+
+def decode(buf):
+    return unpack(buf)[2]
+
+
+def from_dict(data):
+    return tuple(data.get(name, 0) or 0 for name in FIELDS)
+
+
+def to_dict(values):
+    # Les f32 ne tombent pas juste (150.3 -> 150.300003...) : on arrondit comme la passerelle
+    return {name: round(v, 2) if isinstance(v, float) else v for name, v in zip(FIELDS, values)}
+
+
+def encode_dict(data):
+    return encode(from_dict(data))
+
+
+# Une trame reçue par le relais, sous la forme dans laquelle elle est arrivée.
+# Les autres représentations (dict JSON, octets, tuple) sont calculées à la
+# demande et une seule fois, quel que soit le nombre d'écrans.
+# Horodatages (secondes, horloge monotone) : t_gw côté passerelle,
+# t_src = t_gw ramené sur l'horloge du relais, t_in/t_out à l'entrée et à la
+# sortie du relais. rseq : numéro de séquence attribué par le relais, par vélo
+# (relay.py), qui sert de point de reprise aux écrans. totals : cumuls calculés
+# par le relais (odometer.py, puis rides.py pour la session), diffusés avec la trame.
+# step : énergie et distance ajoutées par la trame (odometer.STEP_FIELDS), persistées.
+class Frame:
+    __slots__ = ("bike_id", "seq", "rseq", "totals", "step", "t_gw", "t_src", "t_in", "t_out", "_values", "_raw", "_data")
+
+    def __init__(self, bike_id, values=None, raw=None, data=None, seq=None, t_gw=None):
+        self.bike_id = bike_id
+        self.seq = seq
+        self.rseq = None
+        self.totals = None
+        self.step = None
+        self.t_gw = t_gw
+        self.t_src = None
+        self.t_in = None
+        self.t_out = None
+        self._values = values
+        self._raw = raw
+        self._data = data
+
+    @classmethod
+    def from_bytes(cls, bike_id, raw):
+        raw = bytes(raw)
+        seq, t_gw, values = unpack(raw)
+        return cls(bike_id, values=values, raw=raw, seq=seq, t_gw=t_gw)
+
+    @classmethod
+    def from_json(cls, bike_id, data):
+        data["bike_id"] = bike_id
+        return cls(bike_id, data=data, seq=data.get("seq"), t_gw=data.get("t_gw"))
+
+    def values(self):
+        if self._values is None:
+            self._values = from_dict(self._data)
+        return self._values
+
+    def as_bytes(self):
+        if self._raw is None:
+            self._raw = encode(self.values(), self.seq, self.t_gw)
+        return self._raw
+
+    def as_dict(self):
+        # Repli JSON pour les anciens écrans
+        if self._data is None:
+            self._data = to_dict(self._values)
+            self._data["bike_id"] = self.bike_id
+            if self.seq is not None:
+                self._data["seq"] = self.seq
+            if self.t_gw is not None:
+                self._data["t_gw"] = self.t_gw
+        return self._data
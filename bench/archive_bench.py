@@ -0,0 +1,141 @@
+# Compare l'archive en colonnes projetées en mémoire (backend/archive.py) et
+# des lignes JSON équivalentes (une trame par ligne, comme la persistance file://) :
+# taille sur disque, temps d'écriture, lecture d'une plage de 10 minutes et
+# moyenne d'une colonne sur tout l'événement.
+#
+#   python bench/archive_bench.py [heures] [Hz]
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from archive import ArchiveReader, ArchiveWriter, COLUMNS
+
+NAMES = [name for name, _, _ in COLUMNS]
+
+
+def sample_rows(hours, hz, start):
+    rows = []
+    energy = distance = 0.0
+    revolutions = 0
+    for i in range(int(hours * 3600 * hz)):
+        t = start + i / hz
+        power = 150 + 20 * math.sin(i / (3 * hz))
+        cadence = 60 + 10 * math.sin(i / (5 * hz))
+        revolutions += 1 if i % hz == 0 else 0
+        step_energy = power / hz / 3600
+        step_distance = cadence / 60 / hz * 6.93
+        energy += step_energy
+        distance += step_distance
+        grade = 5 * math.sin(2 * math.pi * i / (60 * hz))
+        rows.append([t, i + 1, power, cadence, distance, revolutions, grade, 150.0, 0.0,
+                     energy, distance, cadence / 60 * 6.93 * 3.6, step_energy, step_distance])
+    return rows
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None or elapsed < best else best
+    return best, result
+
+
+def du(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+    hz = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    start = 1_700_000_000.0
+    rows = sample_rows(hours, hz, start)
+    t0 = start + hours * 3600 / 2
+    t1 = t0 + 600
+    workdir = tempfile.mkdtemp(prefix="archive_bench_")
+    try:
+        jsonl = os.path.join(workdir, "frames.jsonl")
+        directory = os.path.join(workdir, "archive")
+
+        def write_json():
+            with open(jsonl, "w") as f:
+                for row in rows:
+                    f.write(json.dumps(dict(zip(NAMES, row)), separators=(",", ":")))
+                    f.write("\n")
+
+        def write_archive():
+            shutil.rmtree(directory, ignore_errors=True)
+            writer = ArchiveWriter(directory, "bench", math.floor(start))
+            for row in rows:
+                writer.append(row)
+            writer.close()
+
+        def json_range():
+            # Lignes JSON : chaque ligne doit être lue et décodée pour connaître son t
+            power = []
+            with open(jsonl) as f:
+                for line in f:
+                    frame = json.loads(line)
+                    if frame["t"] >= t1:
+                        break
+                    if frame["t"] >= t0:
+                        power.append(frame["power"])
+            return sum(power) / len(power)
+
+        def json_mean():
+            with open(jsonl) as f:
+                power = [json.loads(line)["power"] for line in f]
+            return sum(power) / len(power)
+
+        def archive_range():
+            reader = ArchiveReader(directory)
+            return float(reader.slice(t0, t1, ["power"])["power"].mean())
+
+        def archive_mean():
+            return float(ArchiveReader(directory).column("power").mean())
+
+        json_write, _ = timed(write_json, repeat=1)
+        archive_write, _ = timed(write_archive, repeat=1)
+        json_range_s, json_range_mean = timed(json_range)
+        archive_range_s, archive_range_mean = timed(archive_range)
+        json_mean_s, _ = timed(json_mean, repeat=1)
+        archive_mean_s, _ = timed(archive_mean)
+        reader = ArchiveReader(directory)
+        view = reader.slice(t0, t1)["power"]
+        results = {
+            "frames": len(rows),
+            "hours": hours,
+            "hz": hz,
+            "json_lines": {
+                "bytes": du(jsonl),
+                "write_s": round(json_write, 3),
+                "range_10min_ms": round(json_range_s * 1000, 3),
+                "column_mean_ms": round(json_mean_s * 1000, 3),
+            },
+            "archive": {
+                "bytes": du(directory),
+                "write_s": round(archive_write, 3),
+                "range_10min_ms": round(archive_range_s * 1000, 3),
+                "column_mean_ms": round(archive_mean_s * 1000, 3),
+                # La tranche est une vue sur le fichier projeté, pas une copie
+                "range_is_view": not view.flags["OWNDATA"],
+            },
+            # Les f32 de l'archive arrondissent la puissance au-delà de la 7e décimale
+            "range_mean_delta": abs(json_range_mean - archive_range_mean),
+        }
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
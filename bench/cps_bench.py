@@ -0,0 +1,73 @@
+# Décodage des notifications Cycling Power Measurement (0x2A63) :
+# gateway/cps.py (struct + enregistrement préalloué) contre le parseur pycycling
+# suivi des getattr() des callbacks historiques.
+#
+#   python bench/cps_bench.py [nombre_de_notifications]
+import json
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gateway.cps import PowerMeasurement, decode_into
+
+try:
+    from pycycling.cycling_power_service import _parse_cycling_power_measurement
+except ImportError:
+    _parse_cycling_power_measurement = None
+
+# Dispositions réellement rencontrées : puissance seule, pédalier, roue + pédalier + équilibre
+CASES = {
+    "power_only": 0x0000,
+    "crank": 0x0020,
+    "wheel_crank_balance": 0x0031,
+}
+
+
+def notification(flags, i):
+    buf = bytearray(struct.pack("<Hh", flags, 150 + i % 100))
+    if flags & 0x01:
+        buf += bytes([100])
+    if flags & 0x10:
+        buf += struct.pack("<IH", i * 3, (i * 700) & 0xFFFF)
+    if flags & 0x20:
+        buf += struct.pack("<HH", i & 0xFFFF, (i * 1024) & 0xFFFF)
+    return buf
+
+
+def per_call_ns(fn, notifications, repeat=5):
+    best = min(timeit.repeat(lambda: [fn(n) for n in notifications], number=1, repeat=repeat))
+    return best / len(notifications) * 1e9
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    record = PowerMeasurement()
+
+    def raw(data):
+        m = decode_into(record, data)
+        return m.power, m.crank_revs, m.crank_event_time
+
+    def legacy(data):
+        m = _parse_cycling_power_measurement(data)
+        return (getattr(m, 'instantaneous_power', 0),
+                getattr(m, 'cumulative_crank_revs', 0),
+                getattr(m, 'last_crank_event_time', 0))
+
+    results = {"notifications": n}
+    for name, flags in CASES.items():
+        notifications = [notification(flags, i) for i in range(n)]
+        result = {"raw_ns": per_call_ns(raw, notifications)}
+        if _parse_cycling_power_measurement is not None:
+            result["pycycling_ns"] = per_call_ns(legacy, notifications)
+            result["speedup"] = result["pycycling_ns"] / result["raw_ns"]
+        results[name] = result
+    if _parse_cycling_power_measurement is None:
+        results["note"] = "pycycling non installé : seule la voie brute est mesurée"
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# Banc de charge du relais : N passerelles simulées x M écrans contre backend/server.py.
+# Le serveur est lancé en local (ou --url pour viser un relais existant), chaque
+# passerelle émet le générateur sinusoïdal de PrezTest.py à --rate Hz, chaque
+# écran s'abonne aux vélos et mesure la latence de diffusion.
+# Résultat en JSON sur stdout (et --out) pour comparer les commits entre eux.
+#
+#   python bench/load_test.py --bikes 20 --dashboards 10 --rate 4 --duration 30
+#   python bench/load_test.py --bikes 50 --dashboards 50 --mode coalesce --format binary --out result.json
+#   python bench/load_test.py --server asgi   # relais asgi_server.py au lieu de server.py
+#   python bench/load_test.py --format delta  # écrans sur le flux différentiel
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import socketio
+
+from backend import wire
+from gateway.bike import MockBike
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+
+    def q(p):
+        return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 3)
+    return {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+        "p50_ms": q(0.50),
+        "p95_ms": q(0.95),
+        "p99_ms": q(0.99),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+# CPU (secondes) et mémoire (octets) d'un processus via /proc ; None hors Linux
+def process_usage(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        rss = peak = None
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+        return cpu, rss, peak
+    except (OSError, IndexError, ValueError):
+        return None, None, None
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read())
+
+
+SERVERS = {"eventlet": "server.py", "asgi": "asgi_server.py"}
+
+
+def start_server(port, mode, hz, server="eventlet"):
+    env = dict(os.environ, PORT=str(port), BROADCAST_MODE=mode, BROADCAST_HZ=str(hz), LOG_EVERY="0")
+    process = subprocess.Popen([sys.executable, SERVERS[server]], cwd=os.path.join(ROOT, "backend"), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("le serveur s'est arrêté au démarrage")
+        try:
+            get_json(url + "/api/broadcast")
+            return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit("le serveur n'a pas démarré")
+
+
+class Dashboard:
+    def __init__(self, url, bikes, wire_format):
+        self.url = url
+        self.bikes = bikes
+        self.wire_format = wire_format
+        self.received = 0
+        # Taille des données reçues (JSON compact ou octets), hors enveloppe Socket.IO
+        self.payload_bytes = 0
+        self.latencies = []
+        self.recording = False
+        self.sio = socketio.AsyncClient()
+        self.sio.on("metrics_update", self.on_update)
+        self.sio.on("metrics_delta", self.on_update)
+        self.sio.on("metrics_frame", self.on_frame)
+
+    def observe(self, t_gw, size):
+        if self.recording:
+            self.received += 1
+            self.payload_bytes += size
+            if t_gw is not None:
+                # Même machine : l'horloge monotone est commune à la passerelle et à l'écran
+                self.latencies.append(time.monotonic() - t_gw)
+
+    async def on_update(self, data):
+        self.observe(data.get("t_gw"), len(json.dumps(data, separators=(",", ":"))))
+
+    async def on_frame(self, bike_id, raw):
+        self.observe(wire.unpack(raw)[1], len(bike_id) + len(raw))
+
+    async def connect(self):
+        await self.sio.connect(self.url, transports=["websocket"])
+        # call() : les rooms sont rejointes avant que les passerelles démarrent
+        await self.sio.call("subscribe", {"bikes": self.bikes, "binary": self.wire_format == "binary",
+                                          "delta": self.wire_format == "delta"})
+
+
+class Gateway:
+    def __init__(self, url, bike_id, binary):
+        self.url = url
+        self.bike_id = bike_id
+        self.binary = binary
+        self.mock = MockBike()
+        self.seq = 0
+        self.sent = 0
+        self.sio = socketio.AsyncClient()
+
+    async def connect(self):
+        await self.sio.connect(self.url, transports=["websocket"])
+        await self.sio.call("register_sensor", {"bike_id": self.bike_id, "epoch": int(time.time())})
+
+    async def run(self, rate, until):
+        interval = 1.0 / rate
+        next_send = time.monotonic()
+        while next_send < until:
+            self.seq += 1
+            metrics = self.mock.next()
+            t_gw = time.monotonic()
+            if self.binary:
+                await self.sio.emit("metrics_frame", (self.bike_id, wire.encode(wire.from_dict(metrics), self.seq, t_gw)))
+            else:
+                metrics["seq"] = self.seq
+                metrics["t_gw"] = t_gw
+                await self.sio.emit("metrics_update", metrics)
+            self.sent += 1
+            next_send += interval
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+async def run(args, url, server_pid):
+    binary = args.format == "binary"
+    bike_ids = [f"bench{i}" for i in range(args.bikes)]
+    per_dashboard = min(args.subscribe or args.bikes, args.bikes)
+    dashboards = [Dashboard(url, [bike_ids[(d * per_dashboard + k) % args.bikes] for k in range(per_dashboard)],
+                            args.format)
+                  for d in range(args.dashboards)]
+    gateways = [Gateway(url, bike_id, binary) for bike_id in bike_ids]
+    await asyncio.gather(*(c.connect() for c in dashboards + gateways))
+
+    subscribers = {bike_id: 0 for bike_id in bike_ids}
+    for dashboard in dashboards:
+        for bike_id in dashboard.bikes:
+            subscribers[bike_id] += 1
+
+    stats_before = get_json(url + "/api/broadcast")
+    cpu_before = process_usage(server_pid)[0] if server_pid else None
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.monotonic()
+    for dashboard in dashboards:
+        dashboard.recording = True
+    await asyncio.gather(*(g.run(args.rate, start + args.duration) for g in gateways))
+    # Laisser arriver les dernières trames (et le dernier tick en mode coalesce)
+    await asyncio.sleep(args.drain)
+    elapsed = time.monotonic() - start
+    for dashboard in dashboards:
+        dashboard.recording = False
+    stats_after = get_json(url + "/api/broadcast")
+    cpu_after, rss, peak_rss = process_usage(server_pid) if server_pid else (None, None, None)
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    await asyncio.gather(*(c.sio.disconnect() for c in dashboards + gateways))
+
+    sent = sum(g.sent for g in gateways)
+    received = sum(d.received for d in dashboards)
+    payload_bytes = sum(d.payload_bytes for d in dashboards)
+    expected = sum(g.sent * subscribers[g.bike_id] for g in gateways)
+    latencies = [s for d in dashboards for s in d.latencies]
+    relay_in = stats_after["frames_in"] - stats_before["frames_in"]
+    loadgen_cpu = (self_after.ru_utime + self_after.ru_stime) - (self_before.ru_utime + self_before.ru_stime)
+    return {
+        "revision": git_revision(),
+        "config": {
+            "server": args.server if not args.url else args.url,
+            "bikes": args.bikes,
+            "dashboards": args.dashboards,
+            "bikes_per_dashboard": per_dashboard,
+            "rate_hz": args.rate,
+            "duration_s": args.duration,
+            "mode": args.mode,
+            "format": args.format,
+        },
+        "throughput": {
+            "frames_sent": sent,
+            "frames_sent_per_s": round(sent / args.duration, 1),
+            "relay_frames_in_per_s": round(relay_in / args.duration, 1),
+            "messages_delivered": received,
+            "messages_delivered_per_s": round(received / elapsed, 1),
+            "messages_expected": expected,
+            # < 1 en mode coalesce (trames fusionnées) ou si le relais décroche
+            "delivery_ratio": round(received / expected, 4) if expected else None,
+            "payload_bytes_per_message": round(payload_bytes / received, 1) if received else None,
+        },
+        "fanout_latency": percentiles(latencies),
+        "server": {
+            "cpu_percent": round((cpu_after - cpu_before) / elapsed * 100, 1) if cpu_before is not None else None,
+            "rss_mb": round(rss / 2 ** 20, 1) if rss else None,
+            "peak_rss_mb": round(peak_rss / 2 ** 20, 1) if peak_rss else None,
+        },
+        # Si le générateur sature un cœur, ce sont ses mesures qui limitent le banc
+        "loadgen_cpu_percent": round(loadgen_cpu / elapsed * 100, 1),
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Banc de charge du relais Socket.IO")
+    parser.add_argument("--bikes", type=int, default=10, help="passerelles simulées (une par vélo)")
+    parser.add_argument("--dashboards", type=int, default=10, help="écrans abonnés")
+    parser.add_argument("--subscribe", type=int, default=0, help="vélos suivis par écran (0 = tous)")
+    parser.add_argument("--rate", type=float, default=4.0, help="trames par seconde et par vélo")
+    parser.add_argument("--duration", type=float, default=10.0, help="durée de la mesure (s)")
+    parser.add_argument("--drain", type=float, default=1.0, help="attente des dernières trames (s)")
+    parser.add_argument("--mode", choices=("immediate", "coalesce"), default="immediate")
+    parser.add_argument("--hz", type=float, default=10.0, help="BROADCAST_HZ en mode coalesce")
+    # delta : écrans abonnés au flux différentiel "metrics_delta" (passerelles en JSON)
+    parser.add_argument("--format", choices=("json", "binary", "delta"), default="json")
+    parser.add_argument("--server", choices=tuple(SERVERS), default="eventlet", help="relais lancé en local")
+    parser.add_argument("--port", type=int, default=5199)
+    parser.add_argument("--url", help="relais déjà lancé (pas de mesure CPU/mémoire du serveur)")
+    parser.add_argument("--out", help="fichier JSON de résultat")
+    return parser
+
+
+def run_benchmark(args):
+    process = None
+    if args.url:
+        url, server_pid = args.url, None
+    else:
+        process, url = start_server(args.port, args.mode, args.hz, args.server)
+        server_pid = process.pid
+    try:
+        return asyncio.run(run(args, url, server_pid))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def write_result(result, path=None):
+    output = json.dumps(result, indent=2)
+    print(output)
+    if path:
+        with open(path, "w") as f:
+            f.write(output + "\n")
+
+
+def main():
+    args = build_parser().parse_args()
+    write_result(run_benchmark(args), args.out)
+
+
+if __name__ == "__main__":
+    main()
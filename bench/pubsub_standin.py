@@ -0,0 +1,87 @@
+# Serveur PUBLISH/SUBSCRIBE minimal compatible Redis (protocole RESP), pour
+# tester le bus Redis du relais (backend/bus.py) sans installer Redis :
+#
+#   python bench/pubsub_standin.py --port 6390
+#   BUS_URL=redis://127.0.0.1:6390 WORKERS=4 python backend/server.py
+#
+# Commandes gérées : SUBSCRIBE, UNSUBSCRIBE, PUBLISH, PING, AUTH (acceptée telle quelle).
+import argparse
+import asyncio
+
+channels = {}
+
+
+def bulk(value):
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+async def read_command(reader):
+    header = await reader.readline()
+    if not header:
+        return None
+    if not header.startswith(b"*"):
+        # Commande inline (telnet) : mots séparés par des espaces
+        return header.strip().split()
+    parts = []
+    for _ in range(int(header[1:])):
+        length = int((await reader.readline())[1:])
+        parts.append((await reader.readexactly(length + 2))[:-2])
+    return parts
+
+
+async def handle(reader, writer):
+    subscribed = set()
+    try:
+        while True:
+            command = await read_command(reader)
+            if command is None:
+                break
+            name = command[0].upper()
+            if name == b"SUBSCRIBE":
+                for channel in command[1:]:
+                    channels.setdefault(channel, set()).add(writer)
+                    subscribed.add(channel)
+                    writer.write(b"*3\r\n" + bulk(b"subscribe") + bulk(channel) + b":%d\r\n" % len(subscribed))
+            elif name == b"UNSUBSCRIBE":
+                for channel in command[1:] or list(subscribed):
+                    channels.get(channel, set()).discard(writer)
+                    subscribed.discard(channel)
+                    writer.write(b"*3\r\n" + bulk(b"unsubscribe") + bulk(channel) + b":%d\r\n" % len(subscribed))
+            elif name == b"PUBLISH":
+                channel, payload = command[1], command[2]
+                receivers = channels.get(channel, ())
+                message = b"*3\r\n" + bulk(b"message") + bulk(channel) + bulk(payload)
+                for receiver in receivers:
+                    receiver.write(message)
+                writer.write(b":%d\r\n" % len(receivers))
+            elif name == b"PING":
+                writer.write(b"+PONG\r\n")
+            elif name == b"AUTH":
+                writer.write(b"+OK\r\n")
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        for channel in subscribed:
+            channels.get(channel, set()).discard(writer)
+        writer.close()
+
+
+async def main(host, port):
+    server = await asyncio.start_server(handle, host, port)
+    print(f"📮 Pub/sub compatible Redis sur {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur pub/sub minimal compatible Redis")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,40 @@
+# Compare les deux relais à charge égale : server.py (Flask-SocketIO sous
+# eventlet) et asgi_server.py (python-socketio sous uvicorn). Mêmes options que
+# load_test.py ; chaque relais est lancé à tour de rôle sur le même port.
+#
+#   python bench/relay_compare.py --bikes 20 --dashboards 30 --rate 4 --duration 30 --out compare.json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import SERVERS, build_parser, run_benchmark, write_result
+
+
+def main():
+    parser = build_parser()
+    parser.description = "Compare server.py (eventlet) et asgi_server.py (uvicorn)"
+    args = parser.parse_args()
+    if args.url:
+        raise SystemExit("--url n'a pas de sens ici : les deux relais sont lancés en local")
+    results = {}
+    for server in SERVERS:
+        args.server = server
+        print(f"⏱️ Relais {server}...", file=sys.stderr)
+        results[server] = run_benchmark(args)
+    summary = {}
+    for server, result in results.items():
+        latency = result["fanout_latency"] or {}
+        summary[server] = {
+            "messages_delivered_per_s": result["throughput"]["messages_delivered_per_s"],
+            "delivery_ratio": result["throughput"]["delivery_ratio"],
+            "p50_ms": latency.get("p50_ms"),
+            "p99_ms": latency.get("p99_ms"),
+            "cpu_percent": result["server"]["cpu_percent"],
+            "peak_rss_mb": result["server"]["peak_rss_mb"],
+        }
+    write_result({"summary": summary, "runs": results}, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Compare le format JSON actuel et le format binaire (backend/wire.py) :
+# octets par trame et temps CPU par trame côté passerelle et côté relais.
+#
+#   python bench/wire_bench.py [nombre_de_trames]
+import json
+import math
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from backend import wire
+
+try:
+    from socketio import packet
+except ImportError:
+    packet = None
+
+
+def sample_frames(n):
+    frames = []
+    for i in range(n):
+        t = i * 0.25
+        grade = 5 * math.sin(2 * math.pi * t / 60)
+        target_power = 150 if grade >= 0 else 150 + abs(grade * 10)
+        frames.append({
+            "power": round(150 + 20 * math.sin(t / 3), 1),
+            "cadence": round(60 + 10 * math.sin(t / 5), 1),
+            "distance": round(i * 4.1, 2),
+            "revolutions": i * 2,
+            "grade": round(grade, 1),
+            "target_power": target_power,
+            "power_recharge": round(0.7 * (150 - target_power), 2),
+        })
+    return frames
+
+
+def socketio_bytes(event, data):
+    # Taille réelle sur le fil : paquet texte + pièces jointes binaires éventuelles
+    if packet is None:
+        return None
+    encoded = packet.Packet(packet.EVENT, data=[event, data]).encode()
+    if isinstance(encoded, list):
+        return sum(len(p) if isinstance(p, bytes) else len(p.encode()) + 1 for p in encoded)
+    return len(encoded.encode()) + 1
+
+
+def per_frame_us(fn, frames, repeat=5):
+    best = min(timeit.repeat(lambda: [fn(f) for f in frames], number=1, repeat=repeat))
+    return best / len(frames) * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    frames = sample_frames(n)
+    as_json = [json.dumps(f, separators=(",", ":")) for f in frames]
+    as_bin = [wire.encode_dict(f) for f in frames]
+
+    results = {
+        "frames": n,
+        "json": {
+            "payload_bytes": sum(map(len, as_json)) / n,
+            "socketio_bytes": socketio_bytes("metrics_update", frames[-1]),
+            # Passerelle : dict -> texte ; relais : texte -> dict -> texte
+            "encode_us": per_frame_us(lambda f: json.dumps(f, separators=(",", ":")), frames),
+            "relay_us": per_frame_us(lambda s: json.dumps(json.loads(s), separators=(",", ":")), as_json),
+        },
+        "binary": {
+            "payload_bytes": sum(map(len, as_bin)) / n,
+            "socketio_bytes": socketio_bytes("metrics_frame", as_bin[-1]),
+            # Passerelle : dict -> octets ; relais : octets -> tuple, octets retransmis tels quels
+            "encode_us": per_frame_us(wire.encode_dict, frames),
+            "relay_us": per_frame_us(wire.decode, as_bin),
+        },
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
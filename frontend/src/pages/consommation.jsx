@@ -1,9 +1,7 @@
 import React, { useState, useEffect, useRef } from "react";
-import { io } from "socket.io-client";
+import { BIKE_ID, connectRelay, endSession as endRelaySession, startSession as startRelaySession,
+  subscribeLeaderboards } from "../relay";
 
-const TRANSMISSION_RATIO = 3.3;
-const WHEEL_CIRCUMFERENCE = 2.1;
-const TIME_INTERVAL = 2;
 const OBJECTIF_KWH = 5;
 
 const COLLECTIVE_MILESTONES = [
@@ -22,144 +20,76 @@ function Consommation() {
   const [participants, setParticipants] = useState([]);
   const [speedLeaderboard, setSpeedLeaderboard] = useState([]);
   const [currentParticipant, setCurrentParticipant] = useState(null);
-  const [sessionStartEnergy, setSessionStartEnergy] = useState(0);
-  const [sessionStartDistance, setSessionStartDistance] = useState(0);
+  const [sessionEnergy, setSessionEnergy] = useState(0);
+  const [sessionDistance, setSessionDistance] = useState(0);
   const [sessionSpeedRecord, setSessionSpeedRecord] = useState(0);
   const [instantaneousSpeedCircuit, setInstantaneousSpeedCircuit] = useState(0);
   const [mode, setMode] = useState("total");
 
-  const prevRevolutionsRef = useRef(null);
-  const isFirstUpdateRef = useRef(true);
-  const powerRef = useRef(0);
-  const sessionStartTimeRef = useRef(null);
+  const socketRef = useRef(null);
 
+  // Distance, énergie et vitesse viennent du relais (odometer.py), identiques sur tous les écrans
   useEffect(() => {
-    const storedTrajet = localStorage.getItem("trajet");
-    if (storedTrajet) {
-      const obj = JSON.parse(storedTrajet);
-      if (typeof obj.distance === "number") setTraveledDistance(obj.distance);
-      if (typeof obj.prevRevolutions === "number") {
-        prevRevolutionsRef.current = obj.prevRevolutions;
-      }
-    }
-    const savedEnergy = localStorage.getItem("totalEnergy");
-    if (savedEnergy) setTotalEnergy(parseFloat(savedEnergy));
-    const storedLB = localStorage.getItem("leaderboard");
-    if (storedLB) {
-      const lb = JSON.parse(storedLB);
-      const sortedBySpeed = [...lb].sort((a, b) => b.speed - a.speed).slice(0, 10);
-      const sortedByEnergy = [...lb].sort((a, b) => b.energy - a.energy).slice(0, 10);
-      setSpeedLeaderboard(sortedBySpeed);
-      setParticipants(sortedByEnergy);
-    }
-  }, []);
-
-  useEffect(() => {
-    const socket = io("https://michelin-bike.azurewebsites.net");
+    const socket = connectRelay();
+    socketRef.current = socket;
+    // Classements tenus par le relais : seuls les rangs modifiés arrivent ensuite
+    subscribeLeaderboards(socket, (boards) => {
+      setSpeedLeaderboard(boards.speed || []);
+      setParticipants(boards.energy || []);
+    });
     socket.on("metrics_update", (data) => {
       if (!data) return;
-      powerRef.current = data.power ?? 0;
       setMetrics((prev) => ({ ...prev, ...data }));
-      let computedSpeed = 0;
-      if (isFirstUpdateRef.current) {
-        isFirstUpdateRef.current = false;
-        prevRevolutionsRef.current = data.revolutions;
-      } else {
-        const revolveDelta = data.revolutions - (prevRevolutionsRef.current ?? 0);
-        prevRevolutionsRef.current = data.revolutions;
-        const validDelta = Math.max(0, revolveDelta);
-        const distanceDelta = validDelta * TRANSMISSION_RATIO * WHEEL_CIRCUMFERENCE;
-        setTraveledDistance((prevDist) => {
-          const newDist = prevDist + distanceDelta;
-          const storedTrajet = localStorage.getItem("trajet");
-          let trajetData = {};
-          if (storedTrajet) trajetData = JSON.parse(storedTrajet);
-          const updatedTrajet = {
-            ...trajetData,
-            distance: newDist,
-            prevRevolutions: data.revolutions,
-          };
-          localStorage.setItem("trajet", JSON.stringify(updatedTrajet));
-          return newDist;
-        });
-        computedSpeed = (distanceDelta / TIME_INTERVAL) * 3.6;
+      if (data.total_distance !== undefined) setTraveledDistance(data.total_distance);
+      if (data.total_energy !== undefined) setTotalEnergy(data.total_energy);
+      setSpeed(data.speed ?? 0);
+      // Cumuls de la session en cours, tenus par le relais (null hors session)
+      setSessionEnergy(data.session_energy ?? 0);
+      setSessionDistance(data.session_distance ?? 0);
+      setSessionSpeedRecord(data.session_max_speed ?? 0);
+    });
+    // Début et fin de session, sur cet écran ou un autre écran du même vélo
+    socket.on("session_update", (update) => {
+      if (update.bike_id !== BIKE_ID) return;
+      setCurrentParticipant(update.session);
+      if (!update.session) {
+        setSessionEnergy(0);
+        setSessionDistance(0);
+        setSessionSpeedRecord(0);
+        setInstantaneousSpeedCircuit(0);
       }
-      setSpeed(computedSpeed);
     });
     return () => socket.close();
   }, []);
 
-  useEffect(() => {
-    let lastTime = Date.now();
-    const maxDelta = 1.5;
-    const interval = setInterval(() => {
-      const now = Date.now();
-      let deltaSeconds = (now - lastTime) / 1000;
-      if (deltaSeconds > maxDelta) deltaSeconds = maxDelta;
-      lastTime = now;
-      setTotalEnergy((prev) => {
-        const addedWh = powerRef.current * (deltaSeconds / 3600);
-        const newVal = prev + addedWh;
-        localStorage.setItem("totalEnergy", newVal.toString());
-        return newVal;
-      });
-    }, 1000);
-    return () => clearInterval(interval);
-  }, []);
-
   useEffect(() => {
     if (!currentParticipant) return;
     const interval = setInterval(() => {
-      if (speed > sessionSpeedRecord) setSessionSpeedRecord(speed);
       setInstantaneousSpeedCircuit(speed);
     }, 2000);
     return () => clearInterval(interval);
-  }, [currentParticipant, speed, sessionSpeedRecord]);
+  }, [currentParticipant, speed]);
 
-  const startSession = () => {
+  const startSession = async () => {
     const name = prompt("Entrez le nom du participant :");
     if (!name) return;
-    setCurrentParticipant({ name });
-    setSessionStartEnergy(totalEnergy);
-    setSessionStartDistance(traveledDistance);
-    setSessionSpeedRecord(0);
-    setInstantaneousSpeedCircuit(0);
-    sessionStartTimeRef.current = Date.now();
+    const reply = await startRelaySession(socketRef.current, name);
+    if (reply && reply.error) alert(reply.error);
   };
 
+  // Le relais a déjà cumulé la session : il l'enregistre au classement et
+  // prévient tous les écrans ("session_update")
   const endSession = () => {
     if (!currentParticipant) return;
-    const sessionEnergy = totalEnergy - sessionStartEnergy;
-    const maxSpeed = sessionSpeedRecord;
-    let lb = [];
-    const storedLB = localStorage.getItem("leaderboard");
-    if (storedLB) lb = JSON.parse(storedLB);
-    lb.push({ name: currentParticipant.name, energy: sessionEnergy, speed: maxSpeed });
-    localStorage.setItem("leaderboard", JSON.stringify(lb));
-    const sortedBySpeed = [...lb].sort((a, b) => b.speed - a.speed).slice(0, 10);
-    const sortedByEnergy = [...lb].sort((a, b) => b.energy - a.energy).slice(0, 10);
-    setSpeedLeaderboard(sortedBySpeed);
-    setParticipants(sortedByEnergy);
-    setCurrentParticipant(null);
-    setSessionStartEnergy(0);
-    setSessionStartDistance(0);
-    setSessionSpeedRecord(0);
-    setInstantaneousSpeedCircuit(0);
-    sessionStartTimeRef.current = null;
+    endRelaySession(socketRef.current);
   };
 
   const resetCircuitSession = () => {
-    setCurrentParticipant(null);
-    setSessionStartEnergy(0);
-    setSessionStartDistance(0);
-    setSessionSpeedRecord(0);
-    setInstantaneousSpeedCircuit(0);
-    sessionStartTimeRef.current = null;
+    if (!currentParticipant) return;
+    endRelaySession(socketRef.current, { save: false });
   };
 
   const collectiveProgress = Math.min((totalEnergy / (OBJECTIF_KWH * 1000)) * 100, 100);
-  const sessionDistance = currentParticipant ? traveledDistance - sessionStartDistance : 0;
-  const sessionEnergy = currentParticipant ? totalEnergy - sessionStartEnergy : 0;
 
   return (
     <div className="container mx-auto p-6 text-[#4A4A4A]">
@@ -240,8 +170,8 @@ function Consommation() {
             <h2 className="text-3xl font-bold text-[#001C58] mb-6">🏁 Leaderboard des Vitesses</h2>
             {speedLeaderboard.length > 0 ? (
               <ol className="list-decimal list-inside space-y-2 text-xl">
-                {speedLeaderboard.map((entry, i) => (
-                  <li key={i} className="text-[#001C58] font-medium">
+                {speedLeaderboard.map((entry) => (
+                  <li key={entry.id} className="text-[#001C58] font-medium">
                     {entry.name} - {entry.speed.toFixed(2)} km/h
                   </li>
                 ))}
@@ -255,7 +185,7 @@ function Consommation() {
             {participants.length > 0 ? (
               <ol className="list-decimal list-inside space-y-2 text-xl">
                 {participants.map((p, i) => (
-                  <li key={i} className="text-[#001C58] font-medium">
+                  <li key={p.id} className="text-[#001C58] font-medium">
                     {i + 1}. {p.name} - {p.energy.toFixed(2)} Wh
                   </li>
                 ))}
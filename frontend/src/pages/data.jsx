@@ -1,6 +1,6 @@
-import React, { useState, useEffect, useRef } from "react";
+import React, { useState, useEffect } from "react";
 import { Line } from "react-chartjs-2";
-import { io } from "socket.io-client";
+import { BIKE_ID, SOCKET_URL, connectRelay } from "../relay";
 import {
   Chart as ChartJS,
   CategoryScale,
@@ -16,7 +16,7 @@ ChartJS.register(CategoryScale, LinearScale, PointElement, LineElement, Title, T
 
 const TRANSMISSION_RATIO = 3.3; 
 const WHEEL_CIRCUMFERENCE = 2.1; 
-const TIME_INTERVAL = 2; 
+const CHART_POINTS = 30;
 
 export default function Data() {
   const [metrics, setMetrics] = useState({ power: 0, cadence: 0, distance: 0, revolutions: 0, speed: 0 });
@@ -44,30 +44,43 @@ export default function Data() {
     ],
   });
 
-  const prevRevolutionsRef = useRef(null);
-  const isFirstUpdate = useRef(true);
+  useEffect(() => {
+    // Préremplit le graphique avec l'historique du relais (déjà sous-échantillonné)
+    fetch(`${SOCKET_URL}/api/history/${BIKE_ID}?seconds=60&points=${CHART_POINTS}`)
+      .then((res) => (res.ok ? res.json() : null))
+      .then((hist) => {
+        if (!hist || hist.t.length === 0) return;
+        const speeds = hist.t.map((t, i) => {
+          if (i === 0) return 0;
+          const dt = t - hist.t[i - 1];
+          const revolutionDelta = hist.revolutions[i] - hist.revolutions[i - 1];
+          return dt > 0 ? (revolutionDelta * TRANSMISSION_RATIO * WHEEL_CIRCUMFERENCE / dt) * 3.6 : 0;
+        });
+        setChartData((prev) => ({
+          labels: [...hist.t.map((t) => new Date(t * 1000).toLocaleTimeString()), ...prev.labels].slice(-CHART_POINTS),
+          datasets: [
+            { ...prev.datasets[0], data: [...hist.power.map(Math.abs), ...prev.datasets[0].data].slice(-CHART_POINTS) },
+            { ...prev.datasets[1], data: [...hist.cadence, ...prev.datasets[1].data].slice(-CHART_POINTS) },
+            { ...prev.datasets[2], data: [...speeds, ...prev.datasets[2].data].slice(-CHART_POINTS) },
+          ],
+        }));
+      })
+      .catch(() => {});
+  }, []);
 
   useEffect(() => {
-    const socket = io("https://michelin-bike.azurewebsites.net");
+    const socket = connectRelay();
     socket.on("metrics_update", (data) => {
-      let computedSpeed = 0;
-      if (isFirstUpdate.current) {
-        isFirstUpdate.current = false;
-      } else {
-        const revolutionDelta = data.revolutions - prevRevolutionsRef.current;
-        computedSpeed = (revolutionDelta * TRANSMISSION_RATIO * WHEEL_CIRCUMFERENCE / TIME_INTERVAL) * 3.6;
-      }
-      prevRevolutionsRef.current = data.revolutions;
-
-      const updatedMetrics = { ...data, speed: computedSpeed };
-      setMetrics(updatedMetrics);
+      // Vitesse calculée par le relais (odometer.py)
+      const computedSpeed = data.speed ?? 0;
+      setMetrics({ ...data, speed: computedSpeed });
 
       setChartData((prev) => ({
-        labels: [...prev.labels, new Date().toLocaleTimeString()].slice(-30),
+        labels: [...prev.labels, new Date().toLocaleTimeString()].slice(-CHART_POINTS),
         datasets: [
-          { ...prev.datasets[0], data: [...prev.datasets[0].data, Math.abs(data.power)].slice(-30) },
-          { ...prev.datasets[1], data: [...prev.datasets[1].data, data.cadence].slice(-30) },
-          { ...prev.datasets[2], data: [...prev.datasets[2].data, computedSpeed].slice(-30) },
+          { ...prev.datasets[0], data: [...prev.datasets[0].data, Math.abs(data.power)].slice(-CHART_POINTS) },
+          { ...prev.datasets[1], data: [...prev.datasets[1].data, data.cadence].slice(-CHART_POINTS) },
+          { ...prev.datasets[2], data: [...prev.datasets[2].data, computedSpeed].slice(-CHART_POINTS) },
         ],
       }));
     });
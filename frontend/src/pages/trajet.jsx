@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from "react";
 import { GoogleMap, DirectionsRenderer, Marker, useLoadScript } from "@react-google-maps/api";
-import { io } from "socket.io-client";
+import { connectRelay } from "../relay";
 
 const API_KEY = import.meta.env.VITE_GOOGLE_MAPS_API_KEY;
 const mapContainerStyle = { width: "100%", height: "500px", borderRadius: "12px" };
@@ -17,7 +17,9 @@ export default function Trajet() {
   const [startLocation, setStartLocation] = useState("");
   const [endLocation, setEndLocation] = useState("");
   const [trajetActive, setTrajetActive] = useState(false);
-  const lastSocketDistanceRef = useRef(null);
+  // Distance cumulée du relais (total_distance) au départ du trajet
+  const startDistanceRef = useRef(null);
+  const totalDistanceRef = useRef(null);
 
   useEffect(() => {
     if (!isLoaded) return;
@@ -25,13 +27,12 @@ export default function Trajet() {
     const storedTrajet = localStorage.getItem("trajet");
     if (storedTrajet) {
       const data = JSON.parse(storedTrajet);
-      if (data && data.startLocation && data.endLocation && typeof data.distance === "number") {
+      if (data && data.startLocation && data.endLocation) {
         setStartLocation(data.startLocation);
         setEndLocation(data.endLocation);
-        setTraveledDistance(data.distance);
         setTrajetActive(true);
-        if (typeof data.lastCapteurDistance === "number") {
-          lastSocketDistanceRef.current = data.lastCapteurDistance;
+        if (typeof data.startDistance === "number") {
+          startDistanceRef.current = data.startDistance;
         }
         recalcRoute(data.startLocation, data.endLocation);
       }
@@ -46,43 +47,34 @@ export default function Trajet() {
   }, [isLoaded, startLocation, endLocation, trajetActive]);
 
   useEffect(() => {
-    const socket = io("https://michelin-bike.azurewebsites.net");
+    const socket = connectRelay();
 
+    // Distance parcourue = cumul du relais depuis le départ : aucun calcul ni
+    // écriture localStorage à chaque trame
     socket.on("metrics_update", (data) => {
-      if (typeof data.distance === "number") {
-        const capteurDist = data.distance;
-        if (lastSocketDistanceRef.current === null) {
-          lastSocketDistanceRef.current = capteurDist;
-          return;
-        }
-
-        let delta = capteurDist - lastSocketDistanceRef.current;
-        if (delta < 0) {
-          delta = 0;
-        }
-
-        if (trajetActive) {
-          setTraveledDistance((prev) => {
-            const newDist = prev + delta;
-            const updatedTrajet = {
-              startLocation,
-              endLocation,
-              distance: newDist,
-              timestamp: Date.now(),
-              lastCapteurDistance: capteurDist,
-            };
-            localStorage.setItem("trajet", JSON.stringify(updatedTrajet));
-            return newDist;
-          });
-        }
-
-        lastSocketDistanceRef.current = capteurDist;
+      if (typeof data.total_distance !== "number") return;
+      totalDistanceRef.current = data.total_distance;
+      if (!trajetActive) return;
+      if (startDistanceRef.current === null || data.total_distance < startDistanceRef.current) {
+        // Premier point du trajet, ou cumul remis à zéro (relais redémarré)
+        saveTrajet(startLocation, endLocation, data.total_distance);
       }
+      setTraveledDistance(data.total_distance - startDistanceRef.current);
     });
 
     return () => socket.close();
   }, [startLocation, endLocation, trajetActive]);
 
+  const saveTrajet = (start, end, startDistance) => {
+    startDistanceRef.current = startDistance;
+    localStorage.setItem("trajet", JSON.stringify({
+      startLocation: start,
+      endLocation: end,
+      startDistance,
+      timestamp: Date.now(),
+    }));
+  };
+
   const recalcRoute = (origin, destination) => {
     if (!window.google || !window.google.maps) return;
 
@@ -137,21 +129,14 @@ export default function Trajet() {
     setTotalRouteDistance(1);
     setBikePosition(null);
     setTraveledDistance(0);
-    lastSocketDistanceRef.current = null;
+    startDistanceRef.current = null;
   };
 
   const handlePlanifier = () => {
     if (!startLocation || !endLocation) return;
     recalcRoute(startLocation, endLocation);
     if (!trajetActive) {
-      const initialTrajet = {
-        startLocation,
-        endLocation,
-        distance: 0,
-        timestamp: Date.now(),
-        lastCapteurDistance: 0,
-      };
-      localStorage.setItem("trajet", JSON.stringify(initialTrajet));
+      saveTrajet(startLocation, endLocation, totalDistanceRef.current);
       setTrajetActive(true);
       setTraveledDistance(0);
     }
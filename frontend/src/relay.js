@@ -0,0 +1,214 @@
+import { io } from "socket.io-client";
+
+export const SOCKET_URL = "https://michelin-bike.azurewebsites.net";
+
+// Vélo affiché par cet écran : ?bike=<id> dans l'URL, "default" sinon
+export const BIKE_ID = new URLSearchParams(window.location.search).get("bike") || "default";
+
+// Mesure de latence : une trame sur ACK_EVERY est acquittée une fois affichée
+const ACK_EVERY = 10;
+const CLOCK_PINGS = 5;
+const CLOCK_INTERVAL_MS = 30000;
+// Reconnexion après une déconnexion par le relais (écran jugé trop lent)
+const EVICTED_RECONNECT_MS = 5000;
+
+const now = () => performance.now() / 1000;
+
+// Décalage horloge relais - horloge locale, par ping/pong : on garde
+// l'échange au plus petit aller-retour
+function syncClock(socket, clock) {
+  const samples = [];
+  const ping = () => {
+    const t0 = now();
+    socket.emit("clock_ping", { t0 }, (reply) => {
+      const t1 = now();
+      samples.push([t1 - t0, reply.t - (t0 + t1) / 2]);
+      if (samples.length < CLOCK_PINGS) {
+        ping();
+        return;
+      }
+      samples.sort((a, b) => a[0] - b[0]);
+      clock.offset = samples[0][1];
+    });
+  };
+  ping();
+}
+
+export function connectRelay(bikes = [BIKE_ID]) {
+  // WebSocket direct : avec plusieurs workers relais (WORKERS), le long-polling
+  // pourrait répartir les requêtes d'un même client sur des processus différents
+  const socket = io(SOCKET_URL, { transports: ["websocket"] });
+  const clock = { offset: null };
+  // Dernier état complet de chaque vélo, reconstruit à partir du flux différentiel
+  const state = {};
+  // Dernière séquence relais (rseq) remise aux pages par vélo : point de reprise,
+  // valable pour un lancement du relais (relay_epoch) ; les rseq repartent de 1 au suivant
+  const lastSeq = {};
+  let relayEpoch = null;
+  let received = 0;
+  // Resynchronisation d'horloge périodique, le temps de chaque connexion : arrêtée
+  // à la déconnexion (y compris socket.close() au démontage d'une page)
+  let clockTimer = null;
+  // Réabonnement à chaque (re)connexion : les rooms ne survivent pas à une coupure.
+  // Le relais répond par un snapshot de chaque vélo, puis n'envoie que les champs
+  // modifiés ; après une coupure, il renvoie d'abord les trames manquées.
+  socket.on("connect", () => {
+    socket.emit("subscribe", { bikes, delta: true, last_seq: lastSeq, relay_epoch: relayEpoch });
+    syncClock(socket, clock);
+    clearInterval(clockTimer);
+    clockTimer = setInterval(() => syncClock(socket, clock), CLOCK_INTERVAL_MS);
+  });
+  // socket.io ne se reconnecte pas seul quand c'est le serveur qui coupe ;
+  // la reprise par last_seq rattrape ensuite les trames manquées
+  socket.on("disconnect", (reason) => {
+    clearInterval(clockTimer);
+    clockTimer = null;
+    if (reason === "io server disconnect") setTimeout(() => socket.connect(), EVICTED_RECONNECT_MS);
+  });
+  const ack = (data) => {
+    received += 1;
+    if (received % ACK_EVERY !== 0 || clock.offset === null || data.t_out === undefined) return;
+    // Accusé après le prochain rendu, sur l'horloge du relais
+    requestAnimationFrame(() => {
+      socket.emit("frame_ack", {
+        bike_id: data.bike_id,
+        seq: data.seq,
+        t_src: data.t_src,
+        t_out: data.t_out,
+        t_render: now() + clock.offset,
+      });
+    });
+  };
+  socket.on("metrics_update", ack);
+  // Les pages (et ack) écoutent "metrics_update" : chaque trame leur est remise
+  // sous forme d'état complet, comme avant
+  const deliver = (data) => {
+    for (const listener of socket.listeners("metrics_update")) listener(data);
+  };
+  // Chaque trame n'est remise qu'une fois, dans l'ordre des rseq. reset : le relais
+  // ne peut pas reprendre (trop de retard, relais redémarré), on repart de cet état
+  const fresh = (data) => {
+    if (data.relay_epoch !== undefined && data.relay_epoch !== relayEpoch) {
+      // Relais redémarré : les points de reprise de l'ancien lancement ne valent plus
+      relayEpoch = data.relay_epoch;
+      for (const bike of Object.keys(lastSeq)) delete lastSeq[bike];
+    }
+    if (data.rseq === undefined || data.rseq === null) return true;
+    const last = lastSeq[data.bike_id];
+    if (last !== undefined && data.rseq <= last && !data.reset) return false;
+    lastSeq[data.bike_id] = data.rseq;
+    return true;
+  };
+  socket.on("metrics_delta", (delta) => {
+    const { key, reset, ...fields } = delta;
+    const full = key ? fields : { ...state[delta.bike_id], ...fields };
+    state[delta.bike_id] = full;
+    if (fresh(delta)) deliver(full);
+  });
+  // Trames manquées pendant une coupure, en un seul lot
+  socket.on("metrics_replay", ({ bike_id, frames }) => {
+    for (const frame of frames) {
+      if (!fresh(frame)) continue;
+      state[bike_id] = frame;
+      deliver(frame);
+    }
+  });
+  return socket;
+}
+
+// Classements tenus par le relais (leaderboard.py) : état complet à
+// l'abonnement, puis seulement les rangs modifiés. onChange reçoit
+// { speed: [...], energy: [...] } triés par rang ; chaque entrée porte son
+// score sous le nom du tableau (entry.speed, entry.energy).
+export function subscribeLeaderboards(socket, onChange) {
+  const boards = {};
+  const publish = () => {
+    const view = {};
+    for (const [board, entries] of Object.entries(boards)) {
+      view[board] = Object.values(entries)
+        .sort((a, b) => a.rank - b.rank)
+        .map((entry) => ({ ...entry, [board]: entry.score }));
+    }
+    onChange(view);
+  };
+  const subscribe = () => {
+    socket.emit("leaderboard_subscribe", {}, (snapshot) => {
+      for (const [board, top] of Object.entries(snapshot)) {
+        boards[board] = Object.fromEntries(top.map((entry) => [entry.id, entry]));
+      }
+      publish();
+      migrateLocalLeaderboard(socket);
+    });
+  };
+  socket.on("connect", subscribe);
+  if (socket.connected) subscribe();
+  socket.on("leaderboard_update", ({ board, k, changes }) => {
+    const entries = boards[board] || (boards[board] = {});
+    for (const entry of changes) {
+      if (entry.rank > k) delete entries[entry.id];
+      else entries[entry.id] = entry;
+    }
+    publish();
+  });
+}
+
+// Résultat de session { name, speed, energy } -> { id, ranks } (ou { error }).
+// timeoutMs : { error } si le relais n'a pas répondu à temps (coupure)
+export function submitResult(socket, record, timeoutMs = null) {
+  return new Promise((resolve) => {
+    if (timeoutMs === null) {
+      socket.emit("leaderboard_submit", record, resolve);
+      return;
+    }
+    socket.timeout(timeoutMs).emit("leaderboard_submit", record, (err, reply) => {
+      resolve(err ? { error: "pas de réponse du relais" } : reply);
+    });
+  });
+}
+
+const MIGRATE_TIMEOUT_MS = 10000;
+let migrating = false;
+
+// Classement d'avant le relais, resté dans le localStorage de cet écran : envoyé
+// au relais, qui le persiste. Un résultat n'est effacé d'ici qu'une fois accusé
+// sans erreur ; les autres restent pour la prochaine connexion
+async function migrateLocalLeaderboard(socket) {
+  if (migrating) return;
+  let local;
+  try {
+    local = JSON.parse(localStorage.getItem("leaderboard") || "[]");
+  } catch (err) {
+    local = [];
+  }
+  if (!Array.isArray(local) || local.length === 0) return;
+  migrating = true;
+  try {
+    // Identifiant fixé avant l'envoi : un résultat renvoyé après un échec remplace
+    // sa première version au classement au lieu d'apparaître deux fois
+    for (const record of local) {
+      if (record && !record.id) record.id = Math.random().toString(16).slice(2, 14);
+    }
+    localStorage.setItem("leaderboard", JSON.stringify(local));
+    const replies = await Promise.all(
+      local.map((record) => (record && record.name ? submitResult(socket, record, MIGRATE_TIMEOUT_MS) : null)),
+    );
+    const remaining = local.filter((record, i) => !replies[i] || replies[i].error);
+    if (remaining.length === 0) localStorage.removeItem("leaderboard");
+    else localStorage.setItem("leaderboard", JSON.stringify(remaining));
+  } finally {
+    migrating = false;
+  }
+}
+
+// Sessions de participants tenues par le relais (rides.py) : une par vélo.
+// Énergie, distance et vitesse max de la session arrivent avec chaque trame
+// (session_energy, session_distance, session_max_speed) ; début et fin sont
+// annoncés à tous les écrans du vélo par "session_update".
+export function startSession(socket, name, bikeId = BIKE_ID) {
+  return new Promise((resolve) => socket.emit("session_start", { bike_id: bikeId, name }, resolve));
+}
+
+// save=false : session abandonnée, sans passage au classement
+export function endSession(socket, { save = true, bikeId = BIKE_ID } = {}) {
+  return new Promise((resolve) => socket.emit("session_end", { bike_id: bikeId, save }, resolve));
+}
@@ -4,6 +4,8 @@ import react from '@vitejs/plugin-react';
 export default defineConfig({
   plugins: [react()],
   build: {
+    // Liste des fichiers hashés, lue par le relais (static_assets.py) pour le cache immutable
+    manifest: '.vite/manifest.json',
     rollupOptions: {
       output: {
         manualChunks(id) {
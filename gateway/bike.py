@@ -0,0 +1,103 @@
+import math
+import time
+
+# Paramètres de simulation
+BASE_POWER = 150           # Puissance de base (W)
+GRADE_AMPLITUDE = 5        # Amplitude de variation de la pente en %
+SIMULATION_PERIOD = 60     # Période d'oscillation de la pente (s)
+EFFICIENCY = 0.7           # Rendement pour la recharge de la batterie
+WHEEL_CIRCUMFERENCE = 622 * math.pi / 1000  # en mètres
+
+
+def simulated_grade(elapsed_time):
+    return GRADE_AMPLITUDE * math.sin(2 * math.pi * elapsed_time / SIMULATION_PERIOD)
+
+
+def target_and_recharge(grade):
+    if grade >= 0:
+        return BASE_POWER, 0  # Pas de recharge en montée
+    target_power = BASE_POWER + abs(grade * 10)  # Simulation du frein moteur
+    return target_power, EFFICIENCY * (BASE_POWER - target_power)
+
+
+# État d'un vélo côté passerelle. __slots__ : pas de dict par instance,
+# l'état reste compact même avec beaucoup de vélos sur un petit hôte.
+class BikeState:
+    __slots__ = (
+        "bike_id", "address", "time_start", "connected", "notifications",
+        "last_crank_revs", "last_crank_time", "total_distance", "metrics",
+    )
+
+    def __init__(self, bike_id, address):
+        self.bike_id = bike_id
+        self.address = address
+        self.time_start = time.time()
+        self.connected = False
+        self.notifications = 0
+        self.last_crank_revs = None
+        self.last_crank_time = None
+        self.total_distance = 0.0
+        self.metrics = None
+
+    # Une notification Cycling Power : renvoie le dict envoyé au relais
+    def update(self, power, cumulative_crank_revs, last_crank_event_time):
+        self.notifications += 1
+        if cumulative_crank_revs is None:
+            # Notification sans données pédalier : cadence et distance inchangées
+            cadence_rpm = self.metrics["cadence"] if self.metrics else 0
+            cumulative_crank_revs = self.last_crank_revs or 0
+            last_crank_event_time = self.last_crank_time
+        elif self.last_crank_revs is not None and self.last_crank_time is not None:
+            # Compteurs BLE sur 16 bits : révolutions et temps (1/1024 s) rebouclent
+            delta_revs = (cumulative_crank_revs - self.last_crank_revs) & 0xFFFF
+            delta_time = ((last_crank_event_time - self.last_crank_time) & 0xFFFF) / 1024
+            cadence_rpm = (delta_revs / delta_time) * 60 if delta_time > 0 else 0
+            self.total_distance += delta_revs * WHEEL_CIRCUMFERENCE
+        else:
+            cadence_rpm = 0
+        self.last_crank_revs = cumulative_crank_revs
+        self.last_crank_time = last_crank_event_time
+
+        grade = simulated_grade(time.time() - self.time_start)
+        target_power, power_recharge = target_and_recharge(grade)
+        self.metrics = {
+            "power": power,
+            "cadence": round(cadence_rpm, 1),
+            "distance": round(self.total_distance, 2),
+            "revolutions": cumulative_crank_revs,
+            "grade": round(grade, 1),
+            "target_power": target_power,
+            "power_recharge": round(power_recharge, 2),
+        }
+        return self.metrics
+
+
+# Générateur sinusoïdal utilisé quand aucun capteur n'est joignable
+# (mode simulation de PrezTest.py, banc de charge bench/load_test.py).
+class MockBike:
+    __slots__ = ("time_start", "total_distance", "revolutions")
+
+    def __init__(self, time_start=None):
+        self.time_start = time.time() if time_start is None else time_start
+        self.total_distance = 0
+        self.revolutions = 0
+
+    def next(self, current_time=None):
+        current_time = time.time() if current_time is None else current_time
+        elapsed_time = current_time - self.time_start
+        delta_revs = 3 + int((math.sin(current_time) + 1) * 1)
+        self.revolutions += delta_revs
+        cadence_rpm = 60 + 10 * math.sin(current_time / 5)
+        self.total_distance += delta_revs * WHEEL_CIRCUMFERENCE
+        puissance = BASE_POWER + 20 * math.sin(current_time / 3)
+        grade = simulated_grade(elapsed_time)
+        target_power, power_recharge = target_and_recharge(grade)
+        return {
+            "power": round(puissance, 1),
+            "cadence": round(cadence_rpm, 1),
+            "distance": round(self.total_distance, 2),
+            "revolutions": self.revolutions,
+            "grade": round(grade, 1),
+            "target_power": target_power,
+            "power_recharge": round(power_recharge, 2),
+        }
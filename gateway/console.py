@@ -0,0 +1,69 @@
+import asyncio
+import sys
+
+# Vue terminal à cadence fixe : les callbacks BLE se contentent de déposer le
+# dernier état, une tâche le redessine en place FPS fois par seconde, en une
+# seule écriture. En mode headless il n'y a aucune sortie console.
+HOME = "\033[H"
+CLEAR_LINE = "\033[K"
+CLEAR_BELOW = "\033[J"
+
+
+def format_metrics(metrics):
+    lines = [
+        f"⚡ Puissance: {metrics.get('power', 0)} W | 🚴 Cadence: {metrics.get('cadence', 0)} RPM",
+        f"📏 Distance parcourue: {metrics.get('distance', 0)} m | 🔁 Révolutions: {metrics.get('revolutions', 0)}",
+    ]
+    if "grade" in metrics:
+        lines.append(f"🟢 Pente: {metrics['grade']}% | 🎯 Puissance cible: {metrics.get('target_power', 0)} W"
+                     f" | 🔋 Recharge: {metrics.get('power_recharge', 0)} W")
+    if "energy_recharged_j" in metrics:
+        lines.append(f"⚡ Énergie stockée : {metrics['energy_recharged_j']} J"
+                     f" ({metrics.get('energy_recharged_wh', 0)} Wh)")
+    if "last_crank_event_time" in metrics:
+        lines.append(f"🔁 Dernier événement du pédalier : {metrics['last_crank_event_time']}")
+    return lines
+
+
+class TerminalView:
+    def __init__(self, fps=4, headless=False, footer=None, stream=None):
+        self.interval = 1.0 / fps
+        self.headless = headless
+        self.footer = footer
+        self.stream = stream or sys.stdout
+        self.latest = {}
+        self.dirty = False
+        self._task = None
+
+    # Appelée à chaque notification : simple affectation, aucune E/S
+    def update(self, key, metrics):
+        self.latest[key] = metrics
+        self.dirty = True
+
+    def render(self):
+        lines = []
+        several = len(self.latest) > 1
+        for key, metrics in self.latest.items():
+            if several:
+                lines.append(f"🚲 {key}")
+            lines.extend(format_metrics(metrics))
+        if self.footer is not None:
+            lines.append(self.footer())
+        return HOME + "".join(line + CLEAR_LINE + "\n" for line in lines) + CLEAR_BELOW
+
+    async def run(self):
+        while True:
+            if self.dirty:
+                self.dirty = False
+                self.stream.write(self.render())
+                self.stream.flush()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if not self.headless and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,132 @@
+import struct
+
+# Décodage direct de la caractéristique Cycling Power Measurement (0x2A63),
+# sans passer par les objets pycycling : c'est le code le plus chaud de la
+# passerelle, exécuté à chaque notification.
+CYCLING_POWER_MEASUREMENT_UUID = "00002a63-0000-1000-8000-00805f9b34fb"
+
+PEDAL_POWER_BALANCE = 1
+ACCUMULATED_TORQUE = 1 << 2
+WHEEL_REVOLUTIONS = 1 << 4
+CRANK_REVOLUTIONS = 1 << 5
+EXTREME_FORCES = 1 << 6
+EXTREME_TORQUES = 1 << 7
+EXTREME_ANGLES = 1 << 8
+TOP_DEAD_SPOT = 1 << 9
+BOTTOM_DEAD_SPOT = 1 << 10
+ACCUMULATED_ENERGY = 1 << 11
+
+_FLAGS = struct.Struct("<H")
+
+
+# Enregistrement préalloué, réécrit à chaque notification : le consommateur
+# doit copier ce qu'il veut garder.
+class PowerMeasurement:
+    __slots__ = (
+        "flags", "power", "pedal_power_balance", "accumulated_torque",
+        "wheel_revs", "wheel_event_time", "crank_revs", "crank_event_time",
+        "accumulated_energy",
+    )
+
+    def __init__(self):
+        self.flags = 0
+        self.power = 0
+        self.pedal_power_balance = None
+        self.accumulated_torque = None
+        self.wheel_revs = None
+        self.wheel_event_time = None
+        self.crank_revs = None
+        self.crank_event_time = None
+        self.accumulated_energy = None
+
+
+# Une disposition par combinaison de drapeaux : un capteur n'en utilise en
+# pratique qu'une ou deux, on compile donc un seul struct par combinaison et
+# on garde la position de chaque champ utile (-1 si absent).
+def _build_layout(flags):
+    fmt = "<h"
+    index = {}
+
+    def field(name, code):
+        nonlocal fmt
+        # Position dans le tuple décodé (0 = puissance, les octets sautés ne comptent pas)
+        index[name] = len(index) + 1
+        fmt += code
+
+    if flags & PEDAL_POWER_BALANCE:
+        field("pedal_power_balance", "B")
+    if flags & ACCUMULATED_TORQUE:
+        field("accumulated_torque", "H")
+    if flags & WHEEL_REVOLUTIONS:
+        field("wheel_revs", "I")
+        field("wheel_event_time", "H")
+    if flags & CRANK_REVOLUTIONS:
+        field("crank_revs", "H")
+        field("crank_event_time", "H")
+    # Champs non exploités : sautés sans être décodés
+    if flags & EXTREME_FORCES:
+        fmt += "4x"
+    if flags & EXTREME_TORQUES:
+        fmt += "4x"
+    if flags & EXTREME_ANGLES:
+        fmt += "3x"
+    if flags & TOP_DEAD_SPOT:
+        fmt += "2x"
+    if flags & BOTTOM_DEAD_SPOT:
+        fmt += "2x"
+    if flags & ACCUMULATED_ENERGY:
+        field("accumulated_energy", "H")
+
+    def at(name):
+        return index.get(name, -1)
+
+    return (
+        struct.Struct(fmt),
+        at("pedal_power_balance"), at("accumulated_torque"),
+        at("wheel_revs"), at("wheel_event_time"),
+        at("crank_revs"), at("crank_event_time"),
+        at("accumulated_energy"),
+    )
+
+
+_LAYOUTS = {}
+
+
+def decode_into(record, data):
+    # data : bytearray/memoryview fourni par bleak, lu sur place par unpack_from
+    flags = _FLAGS.unpack_from(data)[0]
+    layout = _LAYOUTS.get(flags)
+    if layout is None:
+        layout = _LAYOUTS[flags] = _build_layout(flags)
+    layout_struct, i_balance, i_torque, i_wheel, i_wheel_t, i_crank, i_crank_t, i_energy = layout
+    values = layout_struct.unpack_from(data, 2)
+    record.flags = flags
+    record.power = values[0]
+    record.pedal_power_balance = values[i_balance] if i_balance >= 0 else None
+    record.accumulated_torque = values[i_torque] if i_torque >= 0 else None
+    if i_wheel >= 0:
+        record.wheel_revs = values[i_wheel]
+        record.wheel_event_time = values[i_wheel_t]
+    else:
+        record.wheel_revs = record.wheel_event_time = None
+    if i_crank >= 0:
+        record.crank_revs = values[i_crank]
+        record.crank_event_time = values[i_crank_t]
+    else:
+        record.crank_revs = record.crank_event_time = None
+    record.accumulated_energy = values[i_energy] if i_energy >= 0 else None
+    return record
+
+
+# Abonnement brut à 0x2A63 : on_measurement(record) reçoit toujours le même objet.
+# on_raw(data) reçoit en plus les octets de la notification (enregistrement de session).
+async def subscribe_raw(client, on_measurement, on_raw=None):
+    record = PowerMeasurement()
+
+    def handler(characteristic, data):
+        if on_raw is not None:
+            on_raw(data)
+        on_measurement(decode_into(record, data))
+
+    await client.start_notify(CYCLING_POWER_MEASUREMENT_UUID, handler)
+    return record
@@ -0,0 +1,195 @@
+import asyncio
+import time
+
+import socketio
+
+from backend import wire
+from backend.latency import estimate_offset
+
+# Politique quand la file est pleine :
+#   drop_oldest : on jette la trame la plus ancienne (l'écran reste à jour)
+#   drop_newest : on jette la trame qui arrive (l'historique reste continu)
+DROP_POLICIES = ("drop_oldest", "drop_newest")
+
+
+# Envoi des trames au relais, découplé des notifications BLE : les callbacks
+# déposent dans une file bornée, une tâche dédiée fait les entrées/sorties.
+# Avec un spool (spool.py), les trames produites pendant une coupure sont
+# écrites sur disque puis rejouées par lots à la reconnexion.
+# Une seule connexion peut porter plusieurs vélos : chaque trame est étiquetée
+# avec son bike_id.
+# Chaque trame porte t_gw, l'instant de la notification sur l'horloge monotone
+# de la passerelle ; le décalage avec l'horloge du relais est estimé par
+# ping/pong toutes les clock_interval secondes.
+class FrameSender:
+    def __init__(self, url, bike_ids, maxsize=256, drop_policy="drop_oldest", wire_format="json",
+                 spool=None, replay_batch=200, clock_interval=10, clock_pings=5):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"politique de rejet inconnue : {drop_policy}")
+        self.url = url
+        self.bike_ids = [bike_ids] if isinstance(bike_ids, str) else list(bike_ids)
+        self.drop_policy = drop_policy
+        self.wire_format = wire_format
+        self.spool = spool
+        self.replay_batch = replay_batch
+        self.clock_interval = clock_interval
+        self.clock_pings = clock_pings
+        self.clock_offset = None
+        self.clock_rtt = None
+        # (époque, seq) identifie chaque trame : le relais ignore celles déjà reçues
+        self.epoch = int(time.time())
+        self.seq = 0
+        self.queue = asyncio.Queue(maxsize)
+        self.connected = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.max_depth = 0
+        self._tasks = []
+        self.sio = socketio.AsyncClient()
+        self.sio.on("connect", self._on_connect)
+        self.sio.on("disconnect", self._on_disconnect)
+
+    async def _on_connect(self):
+        await self.sio.emit("register_sensor", {
+            "bike_id": self.bike_ids[0],
+            "bikes": self.bike_ids,
+            "epoch": self.epoch,
+        })
+        self.connected.set()
+
+    async def _on_disconnect(self, *args):
+        self.connected.clear()
+
+    # Appelée depuis les callbacks BLE : ne bloque jamais et ne fait aucune E/S
+    def send(self, metrics, bike_id=None):
+        # seq est commun à tous les vélos : il reste croissant pour chacun d'eux
+        self.seq += 1
+        item = (bike_id or self.bike_ids[0], self.seq, time.time(), time.monotonic(), metrics)
+        queue = self.queue
+        if queue.full():
+            self.dropped += 1
+            if self.drop_policy == "drop_newest":
+                return
+            queue.get_nowait()
+        queue.put_nowait(item)
+        depth = queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    async def _emit(self, item):
+        bike_id, seq, t, t_gw, metrics = item
+        if self.wire_format == "binary":
+            await self.sio.emit("metrics_frame", (bike_id, wire.encode(wire.from_dict(metrics), seq, t_gw)))
+        else:
+            metrics["bike_id"] = bike_id
+            metrics["seq"] = seq
+            metrics["t_gw"] = t_gw
+            await self.sio.emit("metrics_update", metrics)
+
+    def _spool(self, item):
+        # Les trames rejouées n'ont plus de sens pour la latence : pas de t_gw
+        bike_id, seq, t, t_gw, metrics = item
+        self.spool.append(bike_id, self.epoch, seq, t, wire.encode(wire.from_dict(metrics), seq))
+        self.spooled += 1
+
+    async def _replay(self):
+        loop = asyncio.get_running_loop()
+        records = await loop.run_in_executor(None, lambda: list(self.spool.read()))
+        for i in range(0, len(records), self.replay_batch):
+            batch = [list(record) for record in records[i:i + self.replay_batch]]
+            try:
+                # call() attend l'accusé du relais avant d'envoyer le lot suivant
+                await self.sio.call("metrics_batch", {"frames": batch}, timeout=10)
+            except socketio.exceptions.SocketIOError:
+                # On garde le spool : les lots déjà reçus seront dédupliqués au prochain essai
+                return
+            self.replayed += len(batch)
+        await loop.run_in_executor(None, self.spool.clear)
+
+    async def _run_sender(self):
+        loop = asyncio.get_running_loop()
+        timeout = self.spool.sync_interval if self.spool is not None else None
+        while True:
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if self.spool is not None:
+                # Le spool passe toujours avant les trames en direct pour garder l'ordre des seq :
+                # tant qu'il n'est pas acquitté (rejeu en échec), elles y sont ajoutées. Émises
+                # avant, leur seq ferait rejeter par le relais les trames encore au spool
+                if self.connected.is_set() and len(self.spool):
+                    await self._replay()
+                if item is not None and (not self.connected.is_set() or len(self.spool)):
+                    self._spool(item)
+                    item = None
+                if self.spool.needs_sync():
+                    await loop.run_in_executor(None, self.spool.sync)
+            if item is None:
+                continue
+            await self.connected.wait()
+            try:
+                await self._emit(item)
+                self.sent += 1
+            except socketio.exceptions.SocketIOError:
+                # Connexion perdue entre le wait() et l'emit
+                if self.spool is not None:
+                    self._spool(item)
+                else:
+                    self.dropped += 1
+
+    async def _sync_clock(self):
+        samples = []
+        for _ in range(self.clock_pings):
+            t0 = time.monotonic()
+            reply = await self.sio.call("clock_ping", {"t0": t0}, timeout=5)
+            samples.append((t0, reply["t"], time.monotonic()))
+        self.clock_offset, self.clock_rtt = estimate_offset(samples)
+        await self.sio.emit("clock_offset", {"offset": self.clock_offset, "rtt": self.clock_rtt})
+
+    async def _run_clock(self):
+        while True:
+            await self.connected.wait()
+            try:
+                await self._sync_clock()
+            except socketio.exceptions.SocketIOError:
+                # Coupure pendant l'échange : on réessaiera à la reconnexion
+                pass
+            await asyncio.sleep(self.clock_interval)
+
+    async def _run_connect(self):
+        # retry=True : socketio réessaie jusqu'à joindre le relais,
+        # puis gère seul les reconnexions. WebSocket uniquement : compatible
+        # avec un relais à plusieurs workers (WORKERS)
+        await self.sio.connect(self.url, transports=["websocket"], retry=True)
+        await self.sio.wait()
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._run_connect()),
+            asyncio.create_task(self._run_sender()),
+            asyncio.create_task(self._run_clock()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self.spool is not None:
+            self.spool.close()
+        await self.sio.disconnect()
+
+    def stats(self):
+        return {
+            "connected": self.connected.is_set(),
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "spool_pending": len(self.spool) if self.spool is not None else 0,
+            "clock_offset": self.clock_offset,
+            "clock_rtt": self.clock_rtt,
+        }
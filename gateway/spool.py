@@ -0,0 +1,84 @@
+import os
+import struct
+import time
+
+# Spool disque des trames non envoyées (relais injoignable).
+# Fichier en ajout seul, une entrée par trame :
+#   époque (u32), seq (u32), horodatage passerelle (f64), longueur du bike_id (u8),
+#   longueur de la trame (u16), bike_id (utf-8), trame binaire (wire.py)
+_RECORD = struct.Struct("<IIdBH")
+
+
+class Spool:
+    def __init__(self, path, sync_every=32, sync_interval=1.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.records = 0
+        self._file = open(path, "ab")
+        if self._file.tell():
+            # Trames laissées par une exécution précédente : elles seront rejouées.
+            # Une entrée tronquée (coupure pendant l'écriture) est retirée : les
+            # suivantes, ajoutées derrière elle, seraient illisibles
+            end = 0
+            for end, _ in self._scan():
+                self.records += 1
+            if end < self._file.tell():
+                self._file.truncate(end)
+                self.sync()
+
+    def __len__(self):
+        return self.records
+
+    def append(self, bike_id, epoch, seq, t, frame):
+        bike = bike_id.encode()
+        self._file.write(_RECORD.pack(epoch, seq, t, len(bike), len(frame)))
+        self._file.write(bike)
+        self._file.write(frame)
+        self.records += 1
+        self.unsynced += 1
+
+    def needs_sync(self):
+        if not self.unsynced:
+            return False
+        return (self.unsynced >= self.sync_every
+                or time.monotonic() - self.last_sync >= self.sync_interval)
+
+    # fsync par lots : bloquant, à appeler hors de la boucle asyncio (run_in_executor)
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def _scan(self):
+        # (fin de l'entrée, entrée) ; s'arrête à une entrée tronquée en fin de fichier
+        self._file.flush()
+        with open(self.path, "rb") as f:
+            data = memoryview(f.read())
+        offset = 0
+        while offset + _RECORD.size <= len(data):
+            epoch, seq, t, bike_len, length = _RECORD.unpack_from(data, offset)
+            offset += _RECORD.size
+            end = offset + bike_len + length
+            if end > len(data):
+                break
+            bike_id = str(data[offset:offset + bike_len], "utf-8")
+            yield end, (bike_id, epoch, seq, t, bytes(data[offset + bike_len:end]))
+            offset = end
+
+    def read(self):
+        for _, record in self._scan():
+            yield record
+
+    def clear(self):
+        self._file.truncate(0)
+        self._file.seek(0)
+        self.sync()
+        self.records = 0
+
+    def close(self):
+        self.sync()
+        self._file.close()
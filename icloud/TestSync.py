@@ -1,19 +1,30 @@
 import asyncio
+import os
 import time
 import json
 import sys
 import math
-import socketio
 from bleak import BleakClient
 from pycycling.cycling_power_service import CyclingPowerService
 from pycycling.fitness_machine_service import FitnessMachineService  # Ajout du service FTMS
 
+# Modules partagés de la passerelle (dossier gateway/ à la racine du dépôt)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gateway.console import TerminalView
+from gateway.sender import FrameSender
+from gateway.spool import Spool
+
 # Adresse du capteur BLE
 SENSOR_ADDRESS = "B39283B0-F675-456D-E265-9EE860DE185F"
+BIKE_ID = os.environ.get("BIKE_ID", "default")
 
 # Connexion au serveur Flask-SocketIO
-sio = socketio.Client()
-sio.connect("http://0.0.0.0:5001")
+RELAY_URL = os.environ.get("RELAY_URL", "http://0.0.0.0:5001")
+# Trames conservées sur disque quand le relais est injoignable
+SPOOL_PATH = os.environ.get("SPOOL_PATH", f"{BIKE_ID}.spool")
+# Affichage terminal à cadence fixe ; CONSOLE=off pour le désactiver
+CONSOLE_FPS = float(os.environ.get("CONSOLE_FPS", 4))
+HEADLESS = os.environ.get("CONSOLE", "on") == "off"
 
 # Paramètres de simulation
 BASE_POWER = 150  # Puissance de base (W)
@@ -21,11 +32,7 @@ GRADE_AMPLITUDE = 5  # Variation de pente en pourcentage (%)
 SIMULATION_PERIOD = 60  # Période d'oscillation de la pente (s)
 EFFICIENCY = 0.7  # Rendement de la recharge de la batterie
 
-def clear_terminal():
-    sys.stdout.write("\033[H\033[J")
-    sys.stdout.flush()
-
-async def connect_to_power_meter():
+async def connect_to_power_meter(sender, view):
     async with BleakClient(SENSOR_ADDRESS) as client:
         print("✅ Connecté au capteur BLE")
 
@@ -110,13 +117,9 @@ async def connect_to_power_meter():
                 "energy_recharged_wh": round(total_energy_wh, 4),
             }
 
-            clear_terminal()
-            print(f"⚡ Puissance: {puissance} W | 🚴 Cadence: {cadence_rpm:.1f} RPM")
-            print(f"📏 Distance parcourue : {total_distance:.2f} m | 🔁 Révolutions : {cumulative_crank_revs}")
-            print(f"🟢 Pente: {grade:.1f}% | 🎯 Puissance cible: {target_power} W | 🔋 Recharge: {power_recharge:.2f} W")
-            print(f"⚡ Énergie stockée : {total_energy_recharged:.2f} J ({total_energy_wh:.4f} Wh)")
+            view.update(BIKE_ID, metrics)
 
-            sio.emit("metrics_update", metrics)
+            sender.send(metrics)
 
         power_service.set_cycling_power_measurement_handler(power_callback)
 
@@ -127,4 +130,16 @@ async def connect_to_power_meter():
 
         print("⏹️ Fin du parsing après 150 secondes")
 
-asyncio.run(connect_to_power_meter())
+async def main():
+    spool = Spool(SPOOL_PATH) if SPOOL_PATH else None
+    sender = FrameSender(RELAY_URL, BIKE_ID, spool=spool)
+    sender.start()
+    view = TerminalView(CONSOLE_FPS, HEADLESS)
+    view.start()
+    try:
+        await connect_to_power_meter(sender, view)
+    finally:
+        view.stop()
+        await sender.stop()
+
+asyncio.run(main())
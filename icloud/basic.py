@@ -1,12 +1,17 @@
 import asyncio
+import os
 import time
 import sys
 from bleak import BleakClient
 from pycycling.cycling_power_service import CyclingPowerService
 
-def clear_terminal():
-    sys.stdout.write("\033[H\033[J")
-    sys.stdout.flush()
+# Modules partagés de la passerelle (dossier gateway/ à la racine du dépôt)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gateway.console import TerminalView
+
+# Affichage terminal à cadence fixe ; CONSOLE=off pour le désactiver
+CONSOLE_FPS = float(os.environ.get("CONSOLE_FPS", 4))
+HEADLESS = os.environ.get("CONSOLE", "on") == "off"
 
 async def connect_to_power_meter(address):
     async with BleakClient(address) as client:
@@ -43,17 +48,20 @@ async def connect_to_power_meter(address):
                 cadence_rpm = 0
             last_crank_revs = cumulative_crank_revs
             last_crank_time = last_crank_event_time
-            clear_terminal()
-            print("✅ Connecté au capteur de puissance")
-            print(f"⚡ Puissance instantanée : {puissance} W")
-            print(f"🚴 Révolutions totales du pédalier : {cumulative_crank_revs}")
-            print(f"🔁 Dernier événement du pédalier : {last_crank_event_time}")
-            print(f"⚡ Puissance: {puissance} W | 🚴 Cadence: {cadence_rpm:.1f} RPM")
-            print(f"📏 Distance parcourue : {total_distance:.2f} m")
+            view.update(address, {
+                "power": puissance,
+                "cadence": round(cadence_rpm, 1),
+                "distance": round(total_distance, 2),
+                "revolutions": cumulative_crank_revs,
+                "last_crank_event_time": last_crank_event_time,
+            })
+        view = TerminalView(CONSOLE_FPS, HEADLESS)
         power_service.set_cycling_power_measurement_handler(power_callback)
+        view.start()
         start_time = time.time()
         while time.time() - start_time < 150:
             await asyncio.sleep(1)
+        view.stop()
         print("⏹️ Fin du parsing après 150 secondes")
 
 asyncio.run(connect_to_power_meter("B39283B0-F675-456D-E265-9EE860DE185F"))